@@ -0,0 +1,298 @@
+from array import array
+from protocol import MAP_DATA, TOKEN_PLACE, TOKEN_MOVE, TOKEN_REMOVE, TILE_SET
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FEET_PER_TILE = 5
+# Sight radius in tiles, 60 ft of darkvision
+DEFAULT_SIGHT = 12
+# Side of a spatial hash cell in tiles
+CELL_SIZE = 8
+MAX_TILES = 1024 * 1024
+
+FLOOR = '.'
+WALL = '#'
+DOOR = '+'
+OPEN_DOOR = '/'
+WATER = '~'
+RUBBLE = ','
+TERRAIN = {FLOOR: 'floor', WALL: 'wall', DOOR: 'closed door', OPEN_DOOR: 'open door', WATER: 'water', RUBBLE: 'difficult terrain'}
+TERRAIN_BYTES = bytes(ord(tile) for tile in TERRAIN)
+OPAQUE = frozenset(ord(tile) for tile in (WALL, DOOR))
+# (xx, xy, yx, yy) turning the first octant into each of the eight around a viewer
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1), (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+class MapError(ValueError):
+    pass
+
+class Token:
+    __slots__ = ('name', 'x', 'y', 'owner', 'sight')
+
+    def __init__(self, name, x, y, owner='', sight=DEFAULT_SIGHT):
+        self.name = name
+        self.x = x
+        self.y = y
+        # Character name of the player who moves it, empty for the DM's tokens
+        self.owner = owner
+        self.sight = sight
+
+class FogOfWar:
+    # One player's view: how many of their tokens see each tile, and every tile they have ever seen
+    def __init__(self, size):
+        self.counts = array('H', [0]) * size
+        self.explored = bytearray(size)
+        # Token name -> tiles it currently sees
+        self.views = {}
+
+    def update(self, name, tiles):
+        # Swaps in a token's new view and returns (tiles that came into sight, tiles that went out of it)
+        old = self.views.pop(name, frozenset())
+        if tiles is None:
+            tiles = frozenset()
+        else:
+            self.views[name] = tiles
+        counts = self.counts
+        revealed = []
+        for tile in tiles - old:
+            if not counts[tile]:
+                revealed.append(tile)
+            counts[tile] += 1
+            self.explored[tile] = 1
+        hidden = []
+        for tile in old - tiles:
+            counts[tile] -= 1
+            if not counts[tile]:
+                hidden.append(tile)
+        return revealed, hidden
+
+class BattleMap:
+    def __init__(self, location, width, height, tiles=None):
+        if width < 1 or height < 1 or width * height > MAX_TILES:
+            raise MapError(f"A {width}x{height} map is out of range")
+        self.location = location
+        self.width = width
+        self.height = height
+        # One byte per tile, the terrain character itself, row by row
+        self.tiles = bytearray(tiles.encode('ascii') if tiles else FLOOR.encode('ascii') * (width * height))
+        if len(self.tiles) != width * height:
+            raise MapError(f"Expected {width * height} tiles, got {len(self.tiles)}")
+        if self.tiles.translate(None, TERRAIN_BYTES):
+            raise MapError("Map has unknown terrain")
+        self.tokens = {}
+        # Spatial hash of token names keyed by (column, row) of CELL_SIZE squares
+        self.cells = {}
+        # Fog is only kept for the players this copy of the map is shown to
+        self.fog = {}
+
+    @classmethod
+    def from_rows(cls, location, rows):
+        # Rows of terrain characters, short rows are padded with floor
+        rows = [row.rstrip() for row in rows if row.strip()]
+        if not rows:
+            raise MapError("Map is empty")
+        width = max(len(row) for row in rows)
+        return cls(location, width, len(rows), ''.join(row.ljust(width, FLOOR) for row in rows))
+
+    @classmethod
+    def from_payload(cls, payload):
+        battle_map = cls(payload['location'], payload['width'], payload['height'], payload['tiles'])
+        for name, x, y, owner, sight in payload['tokens']:
+            battle_map.place(name, x, y, owner, sight)
+        return battle_map
+
+    def to_payload(self):
+        return {'location': self.location, 'width': self.width, 'height': self.height, 'tiles': self.tiles.decode('ascii'),
+                'tokens': [[token.name, token.x, token.y, token.owner, token.sight] for token in self.tokens.values()]}
+
+    def grid(self):
+        # The terrain as a height x width array of character codes sharing the map's memory, None without NumPy
+        if np is None:
+            return None
+        return np.frombuffer(self.tiles, dtype=np.uint8).reshape(self.height, self.width)
+
+    def tile(self, x, y):
+        return chr(self.tiles[y * self.width + x])
+
+    def _check(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise MapError(f"({x}, {y}) is off the map")
+
+    def fill(self, x0, y0, x1, y1, terrain):
+        # Sets a rectangle of terrain, both corners included. Meant for building a map, it doesn't update fog.
+        self._check(x0, y0)
+        self._check(x1, y1)
+        code = ord(terrain)
+        grid = self.grid()
+        if grid is not None:
+            grid[y0:y1 + 1, x0:x1 + 1] = code
+        else:
+            run = bytes((code,)) * (x1 - x0 + 1)
+            for y in range(y0, y1 + 1):
+                self.tiles[y * self.width + x0:y * self.width + x1 + 1] = run
+
+    def _cell(self, x, y):
+        return x // CELL_SIZE, y // CELL_SIZE
+
+    def within(self, x, y, feet):
+        # Names of tokens within feet of a point. Diagonals count as 5 ft like any other step,
+        # so only the cells overlapping that square are looked at.
+        reach = feet // FEET_PER_TILE
+        found = []
+        for cx in range((x - reach) // CELL_SIZE, (x + reach) // CELL_SIZE + 1):
+            for cy in range((y - reach) // CELL_SIZE, (y + reach) // CELL_SIZE + 1):
+                for name in self.cells.get((cx, cy), ()):
+                    token = self.tokens[name]
+                    if max(abs(token.x - x), abs(token.y - y)) <= reach:
+                        found.append(name)
+        return found
+
+    def fov(self, x, y, radius):
+        # Tile indices visible from (x, y) within radius tiles, by recursive shadowcasting one octant at a time
+        visible = {y * self.width + x}
+        for xx, xy, yx, yy in OCTANTS:
+            self._cast(x, y, 1, 1.0, 0.0, radius, xx, xy, yx, yy, visible)
+        return visible
+
+    def _cast(self, cx, cy, row, start, end, radius, xx, xy, yx, yy, visible):
+        if start < end:
+            return
+        width, height, tiles = self.width, self.height, self.tiles
+        radius_squared = radius * radius
+        new_start = start
+        for distance in range(row, radius + 1):
+            dx, dy = -distance - 1, -distance
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                left, right = (dx - 0.5) / (dy + 0.5), (dx + 0.5) / (dy - 0.5)
+                if start < right:
+                    continue
+                if end > left:
+                    break
+                x, y = cx + dx * xx + dy * xy, cy + dx * yx + dy * yy
+                if 0 <= x < width and 0 <= y < height:
+                    index = y * width + x
+                    if dx * dx + dy * dy <= radius_squared:
+                        visible.add(index)
+                    opaque = tiles[index] in OPAQUE
+                else:
+                    opaque = True
+                if blocked:
+                    if opaque:
+                        new_start = right
+                    else:
+                        blocked = False
+                        start = new_start
+                elif opaque and distance < radius:
+                    blocked = True
+                    self._cast(cx, cy, distance + 1, start, left, radius, xx, xy, yx, yy, visible)
+                    new_start = right
+            if blocked:
+                break
+
+    def watch(self, owner):
+        # Start keeping fog for a player, returns the tiles their tokens can already see
+        if owner in self.fog:
+            return {}
+        self.fog[owner] = FogOfWar(len(self.tiles))
+        changes = {}
+        for token in self.tokens.values():
+            if token.owner == owner:
+                self._see(token, changes)
+        return changes
+
+    def visible(self, owner, x, y):
+        fog = self.fog.get(owner)
+        return fog is None or fog.counts[y * self.width + x] > 0
+
+    def explored(self, owner, x, y):
+        fog = self.fog.get(owner)
+        return fog is None or fog.explored[y * self.width + x] == 1
+
+    def _see(self, token, changes, gone=False):
+        # Recomputes one token's view and merges the difference into changes, {owner: (revealed, hidden)}
+        fog = self.fog.get(token.owner)
+        if fog is None:
+            return
+        revealed, hidden = fog.update(token.name, None if gone else frozenset(self.fov(token.x, token.y, token.sight)))
+        if revealed or hidden:
+            shown, lost = changes.setdefault(token.owner, ([], []))
+            shown.extend(revealed)
+            lost.extend(hidden)
+
+    # Each change returns {owner: (revealed tiles, hidden tiles)} for the players whose fog it touched
+    def place(self, name, x, y, owner='', sight=DEFAULT_SIGHT):
+        self._check(x, y)
+        changes = self.remove(name) if name in self.tokens else {}
+        token = self.tokens[name] = Token(name, x, y, owner, sight)
+        self.cells.setdefault(self._cell(x, y), set()).add(name)
+        self._see(token, changes)
+        return changes
+
+    def move(self, name, x, y):
+        token = self.tokens.get(name)
+        if token is None:
+            raise MapError(f"No token called {name}")
+        self._check(x, y)
+        old, new = self._cell(token.x, token.y), self._cell(x, y)
+        if old != new:
+            self._unhash(name, old)
+            self.cells.setdefault(new, set()).add(name)
+        token.x, token.y = x, y
+        changes = {}
+        self._see(token, changes)
+        return changes
+
+    def remove(self, name):
+        token = self.tokens.pop(name, None)
+        if token is None:
+            return {}
+        self._unhash(name, self._cell(token.x, token.y))
+        changes = {}
+        self._see(token, changes, gone=True)
+        return changes
+
+    def _unhash(self, name, cell):
+        names = self.cells[cell]
+        names.discard(name)
+        if not names:
+            del self.cells[cell]
+
+    def set_tile(self, x, y, terrain):
+        # Opening a door or knocking down a wall only changes the view of tokens that could reach the tile
+        self._check(x, y)
+        if terrain not in TERRAIN:
+            raise MapError(f"Unknown terrain {terrain!r}")
+        self.tiles[y * self.width + x] = ord(terrain)
+        changes = {}
+        for fog in self.fog.values():
+            for name in list(fog.views):
+                token = self.tokens[name]
+                if max(abs(token.x - x), abs(token.y - y)) <= token.sight:
+                    self._see(token, changes)
+        return changes
+
+def apply_message(maps, msg_type, payload):
+    # Applies a map message to maps (location -> BattleMap). Returns the fog changes,
+    # or None if the message is for a map we don't have or doesn't fit it.
+    try:
+        if msg_type == MAP_DATA:
+            maps[payload['location']] = BattleMap.from_payload(payload)
+            return {}
+        battle_map = maps.get(payload['location'])
+        if battle_map is None:
+            return None
+        if msg_type == TOKEN_PLACE:
+            return battle_map.place(payload['name'], payload['x'], payload['y'], payload['owner'], payload['sight'])
+        if msg_type == TOKEN_MOVE:
+            return battle_map.move(payload['name'], payload['x'], payload['y'])
+        if msg_type == TOKEN_REMOVE:
+            return battle_map.remove(payload['name'])
+        if msg_type == TILE_SET:
+            return battle_map.set_tile(payload['x'], payload['y'], payload['tile'])
+    except MapError:
+        return None
+    return None
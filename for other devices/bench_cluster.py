@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+from bench_load import run_load, free_port, wait_for_server
+from cluster import serve_cluster
+
+def load(host, port, connections, room_size, rate, duration, prefix):
+    return asyncio.run(run_load(host, port, connections, room_size, rate, duration, prefix=prefix))
+
+def run(host, workers, connections, room_size, rate, duration, drivers):
+    # Bots are spread over several processes too, one event loop can't keep a big cluster busy
+    port = free_port(host)
+    server = multiprocessing.Process(target=serve_cluster, args=(host, port, workers))
+    server.start()
+    try:
+        wait_for_server(host, port)
+        share = connections // drivers
+        with multiprocessing.Pool(drivers) as pool:
+            reports = pool.starmap(load, [(host, port, share, room_size, rate, duration, f"driver{i}") for i in range(drivers)])
+    finally:
+        server.terminate()
+        server.join()
+    return {
+        'received_per_sec': sum(report['received_per_sec'] for report in reports),
+        'sent_per_sec': sum(report['sent_per_sec'] for report in reports),
+        'p50_ms': max(report['p50_ms'] for report in reports),
+        'p99_ms': max(report['p99_ms'] for report in reports),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare campaign server throughput across cluster worker counts on this machine")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--workers', default='1,2,4', help="comma separated worker counts to try")
+    parser.add_argument('--connections', type=int, default=1200)
+    parser.add_argument('--room-size', type=int, default=6)
+    parser.add_argument('--rate', type=float, default=20.0, help="Messages per second per bot, high enough to saturate one worker")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--drivers', type=int, default=os.cpu_count() or 1, help="load generating processes")
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPUs, {args.connections} connections in rooms of {args.room_size}, {args.rate:g} msg/s per bot")
+    baseline = None
+    for workers in (int(count) for count in args.workers.split(',')):
+        report = run(args.host, workers, args.connections, args.room_size, args.rate, args.duration, args.drivers)
+        baseline = baseline or report['received_per_sec']
+        print(f"{workers} workers: delivered {report['received_per_sec']:10,.0f}/s ({report['received_per_sec'] / baseline:4.2f}x), "
+              f"sent {report['sent_per_sec']:8,.0f}/s, p50 {report['p50_ms']:7.2f} ms, p99 {report['p99_ms']:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
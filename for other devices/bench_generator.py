@@ -0,0 +1,34 @@
+import argparse
+import io
+import os
+import time
+from dice import roll
+from generator import CHARACTERS, ENEMIES, ABILITY_ROLL, generate, write_jsonl
+from models import STATS
+
+def rate(function, count):
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+def per_roll(count):
+    # What filling in stats one dice.roll at a time costs, the generator's baseline
+    for _ in range(count * len(STATS)):
+        roll(ABILITY_ROLL)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how fast characters and monsters are generated")
+    parser.add_argument('--count', type=int, default=50000)
+    parser.add_argument('--workers', default=f"1,{os.cpu_count() or 1}", help="comma separated worker counts to try")
+    args = parser.parse_args()
+    count = args.count
+    print(f"{os.cpu_count()} CPUs, {count} models per run")
+    print(f"stats alone, one roll each: {rate(lambda: per_roll(count), count):10,.0f} characters/s")
+    for kind in (CHARACTERS, ENEMIES):
+        for workers in sorted({int(n) for n in args.workers.split(',')}):
+            generated = rate(lambda: sum(1 for _ in generate(kind, count, 1, workers, max_level=5)), count)
+            written = rate(lambda: write_jsonl(generate(kind, count, 1, workers, max_level=5), io.StringIO()), count)
+            print(f"{kind:<10} {workers} workers: {generated:10,.0f}/s generated, {written:10,.0f}/s as JSON lines")
+
+if __name__ == "__main__":
+    main()
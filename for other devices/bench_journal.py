@@ -0,0 +1,87 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from journal import Journal, SNAPSHOT_INTERVAL
+from models import Character, Enemy, Location
+from protocol import model_message, CHAT, PATCH, STAT_BATCH, INITIATIVE, TURN
+from state_sync import TableState
+
+def events(count, seed=1):
+    # A long session: a party, a stream of monsters and places, and mostly chat, damage and turns in between
+    rng = random.Random(seed)
+    players = [Character(f"Hero {i}", "Elf", "Wizard", 5) for i in range(6)]
+    enemies = []
+    yield from (model_message(player, 1) for player in players)
+    for i in range(count - len(players)):
+        roll = rng.random()
+        if roll < 0.4:
+            yield CHAT, {'text': f"{rng.choice(players).name}: message {i}"}
+        elif roll < 0.7 and enemies:
+            targets = rng.sample(enemies, min(len(enemies), 3)) + [rng.choice(players).name]
+            yield STAT_BATCH, {'updates': [{'name': name, 'stat': 'hp', 'value': rng.randint(0, 40)} for name in targets]}
+        elif roll < 0.8:
+            player = rng.choice(players)
+            yield PATCH, {'kind': 'player_data', 'name': player.name, 'base': 1, 'rev': 2, 'fields': {'mp': rng.randint(0, 20)}}
+        elif roll < 0.9:
+            yield INITIATIVE, {'name': rng.choice(players).name, 'roll': rng.randint(1, 20), 'dex': 12}
+        elif roll < 0.997:
+            yield TURN, {'name': rng.choice(players).name, 'round': i // 50}
+        elif roll < 0.999:
+            enemy = Enemy(f"Goblin {i}", "Humanoid", 3, 21, 15, "A small, sneaky creature")
+            enemies.append(enemy.name)
+            yield model_message(enemy, 1)
+        else:
+            yield model_message(Location(f"Room {i}", "Dungeon", "A damp chamber with a collapsed ceiling. " * 4), 1)
+
+def write(journal, count):
+    table = TableState()
+    journal.recover()
+    for seq, (msg_type, payload) in enumerate(events(count), 1):
+        table.apply(msg_type, payload)
+        journal.append(seq, msg_type, payload)
+        if journal.due():
+            journal.rotate(table, seq)
+    journal.close()
+
+def replay_all(journal):
+    # What recovery would cost without snapshots: every log, from the very first message
+    table = TableState()
+    for segment in journal.segments():
+        journal.replay(segment, table)
+    return table
+
+def run(count=1000000, snapshot_interval=SNAPSHOT_INTERVAL):
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(directory, snapshot_interval)
+        start = time.perf_counter()
+        write(journal, count)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"{count:,} events written in {elapsed:.2f} s ({count / elapsed:,.0f}/s, snapshots included), "
+              f"{size / 1024 / 1024:.1f} MB in {len(journal.segments())} segments")
+
+        start = time.perf_counter()
+        table = replay_all(journal)
+        elapsed = time.perf_counter() - start
+        print(f"full replay:       {elapsed * 1000:9.1f} ms ({count / elapsed:,.0f} events/s, {len(table.entities)} entities)")
+
+        start = time.perf_counter()
+        restarted = Journal(directory, snapshot_interval)
+        recovered, seq = restarted.recover()
+        restarted.close()
+        print(f"snapshot + tail:   {(time.perf_counter() - start) * 1000:9.1f} ms (seq {seq})")
+        assert recovered.to_dict() == table.to_dict()
+
+        for label, target in (("first quarter", count // 4), ("middle", count // 2)):
+            start = time.perf_counter()
+            _, seq = journal.state_at(target)
+            print(f"fast-forward to {label + ':':<14} {(time.perf_counter() - start) * 1000:6.1f} ms (seq {seq})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Journal write, replay and recovery benchmark")
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--snapshot-interval', type=int, default=SNAPSHOT_INTERVAL)
+    args = parser.parse_args()
+    run(args.events, args.snapshot_interval)
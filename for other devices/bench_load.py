@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import time
+import dice
+from framing import encode_frame, FrameDecoder
+from models import Character, Enemy
+from protocol import (MessageCodec, model_message, HELLO, SESSION, CHAT, PLAYER_DATA, ENEMY_DATA, EDIT, STAT_UPDATE, SUBSCRIBE, PROTOCOL_VERSION,
+                      TABLE_TOPIC, COMBAT_TOPIC, DM_TOPIC, PLAYER_TOPICS, player_topic)
+from server import CampaignServer
+
+RACES = ["Human", "Elf", "Dwarf", "Halfling", "Gnome", "Half-Orc", "Tiefling"]
+CLASSES = ["Fighter", "Wizard", "Rogue", "Cleric", "Ranger", "Paladin", "Bard"]
+PLAYER_SCRIPT = [CHAT, CHAT, PLAYER_DATA, 'initiative']
+DM_SCRIPT = [CHAT, EDIT, EDIT, ENEMY_DATA]
+
+def message_key(msg_type, payload):
+    # What a receiver sees for each thing a bot sends, EDITs come back as STAT_UPDATEs
+    if msg_type == CHAT:
+        return payload['text']
+    if msg_type in (PLAYER_DATA, ENEMY_DATA):
+        return (msg_type, payload['name'], payload['rev'])
+    if msg_type in (EDIT, STAT_UPDATE):
+        return (payload['name'], payload['stat'], payload['value'])
+    return None
+
+class LoadStats:
+    def __init__(self):
+        self.sent_at = {}
+        self.sent = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.latencies = []
+
+    def record_send(self, msg_type, payload):
+        self.sent += 1
+        self.sent_at[message_key(msg_type, payload)] = time.perf_counter()
+
+    def record_receive(self, msg_type, payload):
+        self.received += 1
+        sent_at = self.sent_at.get(message_key(msg_type, payload))
+        if sent_at is not None:
+            self.latencies.append(time.perf_counter() - sent_at)
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class Bot:
+    def __init__(self, number, room, players, is_dm, codec, stats, rate, subscribe=False):
+        self.number = number
+        self.room = room
+        self.players = players
+        self.is_dm = is_dm
+        self.codec = codec
+        self.stats = stats
+        self.rate = rate
+        self.subscribe = subscribe
+        self.counter = 0
+        self.random = random.Random(number)
+        if is_dm:
+            self.name = f"DM-{room}"
+        else:
+            self.name = f"Bot-{room}-{number}"
+            self.character = Character(self.name, self.random.choice(RACES), self.random.choice(CLASSES), self.random.randint(1, 20))
+            self.rev = 0
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.subscribe:
+            # The same topics the real clients declare for their role
+            private = [DM_TOPIC, PLAYER_TOPICS] if self.is_dm else [player_topic(self.name)]
+            self.write(SUBSCRIBE, {'topics': [TABLE_TOPIC, COMBAT_TOPIC] + private})
+        self.write(HELLO, {'version': PROTOCOL_VERSION})
+        self.write(CHAT, {'text': f"/join {self.room}"})
+        await self.writer.drain()
+
+    def write(self, msg_type, payload):
+        self.writer.write(encode_frame(self.codec.encode(msg_type, payload)))
+
+    def send(self, msg_type, payload):
+        self.stats.record_send(msg_type, payload)
+        self.write(msg_type, payload)
+
+    def next_message(self):
+        self.counter += 1
+        script = DM_SCRIPT if self.is_dm else PLAYER_SCRIPT
+        action = script[self.counter % len(script)]
+        if action == 'initiative':
+            return CHAT, {'text': f"{self.name} rolled a {dice.roll('1d20')} for initiative. #{self.counter}"}
+        if action == CHAT:
+            return CHAT, {'text': f"{self.name}: message {self.counter}"}
+        if action == PLAYER_DATA:
+            self.character.hp = self.random.randint(1, 60)
+            self.rev += 1
+            msg_type, payload = model_message(self.character, self.rev)
+            return msg_type, payload
+        if action == EDIT:
+            # The counter keeps each (name, stat, value) unique so the STAT_UPDATE can be matched
+            return EDIT, {'name': self.random.choice(self.players), 'stat': 'hp', 'value': self.counter}
+        enemy = Enemy(f"Goblin {self.counter}", "Humanoid", 1 + self.counter % 10, 7, 12, "A small, sneaky creature")
+        return model_message(enemy, 1)
+
+    async def send_loop(self, deadline):
+        if not self.is_dm:
+            self.rev += 1
+            self.send(*model_message(self.character, self.rev))
+        interval = 1.0 / self.rate
+        await asyncio.sleep(self.random.uniform(0, interval))
+        while time.perf_counter() < deadline:
+            self.send(*self.next_message())
+            await self.writer.drain()
+            await asyncio.sleep(interval)
+
+    async def receive_loop(self):
+        decoder = FrameDecoder()
+        while True:
+            data = await self.reader.read(65536)
+            if not data:
+                return
+            self.stats.received_bytes += len(data)
+            for frame in decoder.feed(data):
+                msg_type, payload = self.codec.decode(frame)
+                if msg_type != SESSION:
+                    self.stats.record_receive(msg_type, payload)
+
+    def close(self):
+        self.writer.close()
+
+def make_bots(connections, room_size, codec, stats, rate, prefix='load', subscribe=False):
+    bots = []
+    for start in range(0, connections, room_size):
+        room = f"{prefix}-{start // room_size}"
+        members = range(start, min(start + room_size, connections))
+        players = [f"Bot-{room}-{number}" for number in members[1:]] or ["nobody"]
+        for number in members:
+            bots.append(Bot(number, room, players, number == start, codec, stats, rate, subscribe))
+    return bots
+
+async def run_load(host, port, connections=200, room_size=6, rate=2.0, duration=10.0, binary=False, prefix='load', subscribe=False):
+    stats = LoadStats()
+    codec = MessageCodec(binary)
+    bots = make_bots(connections, room_size, codec, stats, rate, prefix, subscribe)
+    for bot in bots:
+        await bot.connect(host, port)
+    receivers = [asyncio.create_task(bot.receive_loop()) for bot in bots]
+    # Give the server a moment to put everyone in their rooms before the clock starts
+    await asyncio.sleep(0.5)
+    start = time.perf_counter()
+    await asyncio.gather(*(bot.send_loop(start + duration) for bot in bots))
+    # Let in-flight broadcasts land
+    await asyncio.sleep(1.0)
+    elapsed = time.perf_counter() - start
+    for bot in bots:
+        bot.close()
+    for task in receivers:
+        task.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    return {
+        'connections': connections,
+        'sent': stats.sent,
+        'received': stats.received,
+        'sent_per_sec': stats.sent / elapsed,
+        'received_per_sec': stats.received / elapsed,
+        'received_bytes': stats.received_bytes,
+        'p50_ms': stats.percentile(0.5) * 1000,
+        'p99_ms': stats.percentile(0.99) * 1000,
+    }
+
+def serve(host, port):
+    asyncio.run(CampaignServer(host=host, port=port).serve_forever())
+
+def free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+def wait_for_server(host, port, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            time.sleep(0.05)
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive scripted players and DMs against a campaign server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help="Use a running server instead of starting one")
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--room-size', type=int, default=6)
+    parser.add_argument('--rate', type=float, default=2.0, help="Messages per second per bot")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--binary', action='store_true')
+    parser.add_argument('--subscribe', action='store_true', help="Bots declare topics for their role like the real clients")
+    args = parser.parse_args()
+    server = None
+    port = args.port
+    if port is None:
+        # The stand-in server gets its own process so it doesn't share an event loop with the bots
+        port = free_port(args.host)
+        server = multiprocessing.Process(target=serve, args=(args.host, port), daemon=True)
+        server.start()
+    try:
+        wait_for_server(args.host, port)
+        report = asyncio.run(run_load(args.host, port, args.connections, args.room_size, args.rate, args.duration, args.binary,
+                                      subscribe=args.subscribe))
+    finally:
+        if server:
+            server.terminate()
+            server.join()
+    print(f"{report['connections']} connections: sent {report['sent']:,} ({report['sent_per_sec']:,.0f}/s), "
+          f"received {report['received']:,} ({report['received_per_sec']:,.0f}/s, {report['received_bytes'] / 1024:,.0f} KB)")
+    print(f"End-to-end latency: p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import random
+import timeit
+from battle_map import BattleMap, WALL
+
+def build(size=256, tokens=500, players=4, seed=1):
+    # A big open map with scattered pillars, a handful of player tokens and a crowd of monsters
+    rng = random.Random(seed)
+    battle_map = BattleMap("Bench", size, size)
+    for _ in range(size * size // 10):
+        battle_map.tiles[rng.randrange(size * size)] = ord(WALL)
+    for player in range(players):
+        battle_map.watch(f"Player {player}")
+    for i in range(tokens):
+        owner = f"Player {i}" if i < players else ''
+        battle_map.place(f"Token {i}", rng.randrange(size), rng.randrange(size), owner)
+    return battle_map, rng
+
+def linear_within(battle_map, x, y, feet):
+    reach = feet // 5
+    return [name for name, token in battle_map.tokens.items() if max(abs(token.x - x), abs(token.y - y)) <= reach]
+
+def run(number=2000):
+    for tokens in (500, 5000):
+        battle_map, rng = build(tokens=tokens)
+        points = [(rng.randrange(battle_map.width), rng.randrange(battle_map.height)) for _ in range(number)]
+        hashed = min(timeit.repeat(lambda: [battle_map.within(x, y, 20) for x, y in points], number=1, repeat=3))
+        linear = min(timeit.repeat(lambda: [linear_within(battle_map, x, y, 20) for x, y in points], number=1, repeat=3))
+        print(f"{tokens} tokens, within 20 ft: spatial hash {hashed / number * 1e6:7.1f} us, linear scan {linear / number * 1e6:7.1f} us")
+
+    battle_map, rng = build()
+    for radius in (6, 12, 24):
+        elapsed = min(timeit.repeat(lambda: battle_map.fov(128, 128, radius), number=200, repeat=3)) / 200
+        print(f"shadowcast, {radius * 5} ft sight: {elapsed * 1000:6.2f} ms")
+    steps = [(rng.randrange(battle_map.width), rng.randrange(battle_map.height)) for _ in range(number)]
+    moves = iter(steps * 10)
+    monster = min(timeit.repeat(lambda: battle_map.move("Token 100", *next(moves)), number=number, repeat=3)) / number
+    player = min(timeit.repeat(lambda: battle_map.move("Token 0", *next(moves)), number=number // 10, repeat=3)) / (number // 10)
+    print(f"move without fog: {monster * 1e6:6.1f} us, move with fog update: {player * 1000:6.2f} ms")
+
+if __name__ == "__main__":
+    run()
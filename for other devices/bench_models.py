@@ -0,0 +1,97 @@
+import json
+import time
+import tracemalloc
+from models import Character, Enemy
+
+# The dict-backed classes models.py used before the slotted rewrite, kept for comparison
+class DictCharacter:
+    def __init__(self, name, race, class_type, level=1):
+        self.name = name
+        self.race = race
+        self.class_type = class_type
+        self.level = level
+        self.stats = {'STR': 10, 'DEX': 10, 'CON': 10, 'INT': 10, 'WIS': 10, 'CHA': 10}
+        self.hp = 10
+        self.mp = 10
+        self.ac = 10
+        self.special_skills = []
+
+    def to_json(self):
+        return json.dumps(self.__dict__)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        character = cls(data['name'], data['race'], data['class_type'], data['level'])
+        character.__dict__.update(data)
+        return character
+
+class DictEnemy:
+    def __init__(self, name, enemy_type, level=1, hp=10, ac=10, description=""):
+        self.name = name
+        self.enemy_type = enemy_type
+        self.level = level
+        self.hp = hp
+        self.ac = ac
+        self.description = description
+        self.stats = {'STR': 10, 'DEX': 10, 'CON': 10, 'INT': 10, 'WIS': 10, 'CHA': 10}
+        self.special_abilities = []
+
+    def to_json(self):
+        return json.dumps(self.__dict__)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        enemy = cls(data['name'], data['enemy_type'])
+        enemy.__dict__.update(data)
+        return enemy
+
+def memory_per_entity(factory, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    entities = [factory(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del entities
+    return total / count
+
+def throughput(encode, decode, entities):
+    start = time.perf_counter()
+    encoded = [encode(entity) for entity in entities]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for data in encoded:
+        decode(data)
+    decode_time = time.perf_counter() - start
+    size = sum(len(data) for data in encoded) / len(encoded)
+    return len(entities) / encode_time, len(entities) / decode_time, size
+
+def report(label, memory, results):
+    print(f"{label}: {memory:.0f} bytes/entity")
+    for name, (encode_rate, decode_rate, size) in results.items():
+        print(f"  {name:<6} encode {encode_rate:>10,.0f}/s  decode {decode_rate:>10,.0f}/s  {size:.0f} bytes")
+
+def run(count=20000):
+    def make_enemy(cls):
+        return lambda i: cls(f"Goblin {i}", "Humanoid", 1 + i % 10, 7 + i % 20, 12 + i % 5, "A small, sneaky creature")
+
+    for label, cls, legacy in (("Enemy", Enemy, DictEnemy), ("Character", Character, DictCharacter)):
+        if cls is Enemy:
+            new_factory, old_factory = make_enemy(cls), make_enemy(legacy)
+        else:
+            new_factory = lambda i: cls(f"Hero {i}", "Elf", "Wizard", 1 + i % 20)
+            old_factory = lambda i: legacy(f"Hero {i}", "Elf", "Wizard", 1 + i % 20)
+        new_entities = [new_factory(i) for i in range(count)]
+        old_entities = [old_factory(i) for i in range(count)]
+        report(f"dict {label}", memory_per_entity(old_factory, count), {
+            'json': throughput(legacy.to_json, legacy.from_json, old_entities),
+        })
+        report(f"slotted {label}", memory_per_entity(new_factory, count), {
+            'json': throughput(cls.to_json, cls.from_json, new_entities),
+            'bytes': throughput(cls.to_bytes, cls.from_bytes, new_entities),
+        })
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,58 @@
+import timeit
+import dice
+from framing import encode_frame, FrameDecoder
+import zlib
+from models import Character, Enemy, Location
+from protocol import MessageCodec, model_message, to_legacy, parse_legacy, encode_json, CHAT, EDIT
+from utils import roll_dice
+
+def rate(statement, number):
+    # Best of a few repeats, in operations per second
+    return number / min(timeit.repeat(statement, number=number, repeat=3))
+
+def sample_messages():
+    hero = Character("Aria", "Elf", "Wizard", 7)
+    hero.special_skills = ["Arcane Recovery", "Sculpt Spells"]
+    return {
+        'chat': (CHAT, {'text': "Aria rolled a 17 for initiative."}),
+        'player': model_message(hero, 3),
+        'enemy': model_message(Enemy("Goblin Boss", "Humanoid", 3, 21, 15, "A small, sneaky creature"), 1),
+        'edit': (EDIT, {'name': "Aria", 'stat': 'hp', 'value': 14}),
+    }
+
+def run(number=20000):
+    codecs = {'json': MessageCodec(), 'binary': MessageCodec(binary=True)}
+    for label, (msg_type, payload) in sample_messages().items():
+        print(f"{label}:")
+        for codec_name, codec in codecs.items():
+            frame = codec.encode(msg_type, payload)
+            encode = rate(lambda: codec.encode(msg_type, payload), number)
+            decode = rate(lambda: codec.decode(frame), number)
+            print(f"  {codec_name:<7} encode {encode:>10,.0f}/s  parse {decode:>10,.0f}/s  {len(frame)} bytes")
+        text = to_legacy(msg_type, payload)
+        encode = rate(lambda: to_legacy(msg_type, payload), number)
+        decode = rate(lambda: parse_legacy(text), number)
+        print(f"  {'legacy':<7} encode {encode:>10,.0f}/s  parse {decode:>10,.0f}/s  {len(text.encode('utf-8'))} bytes")
+
+    description = ("The ancient tower rises from the swamp, its stone walls slick with moss. Torch light flickers in "
+                   "the abandoned hall beyond the gate, and the smell of damp stone and old magic hangs in the cold air. ") * 4
+    msg_type, payload = model_message(Location("Drowned Tower", "Ruins", description), 1)
+    raw = encode_json(msg_type, payload)
+    compressed = MessageCodec().encode(msg_type, payload)
+    print(f"location, {len(raw)} bytes: zlib {len(zlib.compress(raw))} bytes, with dictionary {len(compressed)} bytes, "
+          f"encode {rate(lambda: MessageCodec().encode(msg_type, payload), number // 10):,.0f}/s, "
+          f"parse {rate(lambda: MessageCodec().decode(compressed), number // 10):,.0f}/s")
+
+    frames = b''.join(encode_frame(MessageCodec().encode(CHAT, {'text': f"message {i}"})) for i in range(1000))
+    decoder = FrameDecoder()
+    print(f"framing: {rate(lambda: decoder.feed(frames), 200) * 1000:,.0f} frames/s")
+
+    print("dice:")
+    print(f"  utils.roll_dice(20)      {rate(lambda: roll_dice(20), number):>10,.0f}/s")
+    print(f"  utils.roll_dice(6, 8)    {rate(lambda: roll_dice(6, 8), number):>10,.0f}/s")
+    print(f"  dice.roll('1d20')        {rate(lambda: dice.roll('1d20'), number):>10,.0f}/s")
+    print(f"  dice.roll('8d6')         {rate(lambda: dice.roll('8d6'), number):>10,.0f}/s")
+    print(f"  dice.roll('4d6kh3')      {rate(lambda: dice.roll('4d6kh3'), number):>10,.0f}/s")
+
+if __name__ == "__main__":
+    run()
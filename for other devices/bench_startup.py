@@ -0,0 +1,47 @@
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Each scenario runs in a fresh interpreter so module imports are part of the cost
+SCENARIOS = {
+    'session core (player)': "from session import Session\nSession().set_role(False)",
+    'session core (DM)': "from session import Session\nSession().set_role(True)",
+    'GUI player': "from client import DNDClient\nclient = DNDClient(is_dm=False)\nclient.root.update()",
+    'GUI DM, lazy DM tab': "from client import DNDClient\nclient = DNDClient(is_dm=True)\nclient.root.update()",
+    # What DNDClient.__init__ used to do: every tab, including the DM tools, built before the window shows
+    'GUI DM, eager DM tab': "from client import DNDClient\nclient = DNDClient(is_dm=True)\nclient.create_dm_gui()\nclient.root.update()",
+}
+
+TEMPLATE = """import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {here!r})
+{body}
+print(time.perf_counter() - start)
+"""
+
+def measure(body, runs):
+    times = []
+    # Run somewhere disposable, the DM scenarios create a campaign store in the working directory
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, '-c', TEMPLATE.format(here=HERE, body=body)],
+                                    cwd=workdir, capture_output=True, text=True)
+            if result.returncode:
+                return None, result.stderr.strip().splitlines()[-1]
+            times.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(times), None
+
+def run(runs=5):
+    for label, body in SCENARIOS.items():
+        median, error = measure(body, runs)
+        if error:
+            print(f"{label:<24} skipped: {error}")
+        else:
+            print(f"{label:<24} {median * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    run()
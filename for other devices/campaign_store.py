@@ -0,0 +1,135 @@
+import sqlite3
+from contextlib import contextmanager
+from models import Character, Enemy, Location
+
+# Searchable columns are stored alongside the packed record so queries never decode rows they skip
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    name TEXT PRIMARY KEY,
+    race TEXT NOT NULL,
+    class_type TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS characters_class_level ON characters (class_type, level);
+CREATE INDEX IF NOT EXISTS characters_level ON characters (level);
+CREATE TABLE IF NOT EXISTS enemies (
+    name TEXT PRIMARY KEY,
+    enemy_type TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    ac INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS enemies_type_level ON enemies (enemy_type, level);
+CREATE INDEX IF NOT EXISTS enemies_level ON enemies (level);
+CREATE TABLE IF NOT EXISTS locations (
+    name TEXT PRIMARY KEY,
+    location_type TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS locations_type ON locations (location_type);
+"""
+
+TABLES = {
+    Character: ('characters', ('race', 'class_type', 'level')),
+    Enemy: ('enemies', ('enemy_type', 'level', 'ac')),
+    Location: ('locations', ('location_type',)),
+}
+
+class CampaignStore:
+    def __init__(self, path='campaign.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.in_batch = False
+        self.statements = {}
+        for model, (table, columns) in TABLES.items():
+            names = ('name',) + columns + ('data',)
+            updates = ', '.join(f"{column} = excluded.{column}" for column in names[1:])
+            self.statements[model] = (f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                                      f"ON CONFLICT(name) DO UPDATE SET {updates}")
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def batch(self):
+        # Everything written inside the block lands in one transaction
+        if self.in_batch:
+            yield self
+            return
+        self.in_batch = True
+        self.connection.execute("BEGIN")
+        try:
+            yield self
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        else:
+            self.connection.execute("COMMIT")
+        finally:
+            self.in_batch = False
+
+    def _row(self, record):
+        columns = TABLES[type(record)][1]
+        return (record.name,) + tuple(getattr(record, column) for column in columns) + (record.to_bytes(),)
+
+    def upsert(self, record):
+        self.connection.execute(self.statements[type(record)], self._row(record))
+
+    def upsert_many(self, records):
+        with self.batch():
+            for record in records:
+                self.upsert(record)
+
+    def delete(self, model, name):
+        self.connection.execute(f"DELETE FROM {TABLES[model][0]} WHERE name = ?", (name,))
+
+    def get(self, model, name):
+        row = self.connection.execute(f"SELECT data FROM {TABLES[model][0]} WHERE name = ?", (name,)).fetchone()
+        return model.from_bytes(row[0]) if row else None
+
+    def count(self, model):
+        return self.connection.execute(f"SELECT COUNT(*) FROM {TABLES[model][0]}").fetchone()[0]
+
+    def find(self, model, name_prefix=None, min_level=None, max_level=None, limit=None, **filters):
+        table, columns = TABLES[model]
+        clauses = []
+        params = []
+        for column, value in filters.items():
+            if column not in columns:
+                raise ValueError(f"Can't filter {table} by {column}")
+            clauses.append(f"{column} = ?")
+            params.append(value)
+        if name_prefix:
+            # A range scan on the primary key instead of LIKE, so the index is used
+            clauses.append("name >= ? AND name < ?")
+            params += [name_prefix, name_prefix + '\uffff']
+        if (min_level is not None or max_level is not None) and 'level' not in columns:
+            raise ValueError(f"{table} have no level")
+        if min_level is not None:
+            clauses.append("level >= ?")
+            params.append(min_level)
+        if max_level is not None:
+            clauses.append("level <= ?")
+            params.append(max_level)
+        query = f"SELECT data FROM {table}"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY name"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        for (data,) in self.connection.execute(query, params):
+            yield model.from_bytes(data)
+
+    def characters(self, **filters):
+        return self.find(Character, **filters)
+
+    def enemies(self, **filters):
+        return self.find(Enemy, **filters)
+
+    def locations(self, **filters):
+        return self.find(Location, **filters)
@@ -0,0 +1,269 @@
+import argparse
+import csv
+import difflib
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_left
+from collections import Counter
+from models import Enemy, Location
+
+# Compiled catalog layout, little-endian like the models' packed records:
+#   header, then a pool of names and packed entries, then one fixed-size record per entry sorted by
+#   case-folded name, then a small JSON block with the type, race and class tables.
+# Opening reads the header and the JSON block, entries are only unpacked when asked for.
+MAGIC = b'DNDCAT\x00\x01'
+HEADER = struct.Struct('<8sIIIIII')
+# name offset, entry offset, entry length, level, ac, type id
+RECORD = struct.Struct('<IIIHHH')
+NAME_LENGTH = struct.Struct('<H')
+CATALOG_PATH = 'catalog.dat'
+
+ENEMY = 'enemy'
+LOCATION = 'location'
+KINDS = {ENEMY: Enemy, LOCATION: Location}
+INT_FIELDS = ('level', 'hp', 'ac')
+STATS = ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA']
+LIST_FIELDS = ('special_abilities', 'npcs', 'points_of_interest')
+
+class CatalogError(Exception):
+    pass
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _normalize(row):
+    # CSV cells are all strings, lists are separated by semicolons and stats can be flat columns
+    data = {key: value for key, value in row.items() if value not in (None, '')}
+    for field in INT_FIELDS:
+        if field in data:
+            data[field] = int(data[field])
+    stats = data.get('stats') or {}
+    for stat in STATS:
+        if stat in data:
+            stats[stat] = int(data.pop(stat))
+    data['stats'] = stats
+    for field in LIST_FIELDS:
+        if isinstance(data.get(field), str):
+            data[field] = [item.strip() for item in data[field].split(';') if item.strip()]
+    return data
+
+def _kind_of(data):
+    if 'enemy_type' in data:
+        return ENEMY
+    if 'location_type' in data:
+        return LOCATION
+    raise CatalogError(f"Can't tell whether {data.get('name')!r} is an enemy or a location")
+
+def load_sources(paths):
+    entries = {ENEMY: {}, LOCATION: {}}
+    races, classes = [], []
+    for path in paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            if path.lower().endswith('.csv'):
+                rows = list(csv.DictReader(f))
+            else:
+                source = json.load(f)
+                if isinstance(source, dict):
+                    races += source.get('races', [])
+                    classes += source.get('classes', [])
+                    rows = source.get('enemies', []) + source.get('locations', [])
+                else:
+                    rows = source
+        for row in rows:
+            data = _normalize(row)
+            kind = _kind_of(data)
+            entries[kind][data['name']] = KINDS[kind].from_dict(data)
+    return entries, list(dict.fromkeys(races)), list(dict.fromkeys(classes))
+
+def compile_catalog(sources, path=CATALOG_PATH):
+    entries, races, classes = load_sources(sources)
+    types = []
+    type_ids = {}
+    pool = bytearray()
+    sections = {}
+    for kind in (ENEMY, LOCATION):
+        records = []
+        for name in sorted(entries[kind], key=str.casefold):
+            model = entries[kind][name]
+            entry_type = model.enemy_type if kind == ENEMY else model.location_type
+            if entry_type not in type_ids:
+                type_ids[entry_type] = len(types)
+                types.append(entry_type)
+            encoded = name.encode('utf-8')
+            name_offset = HEADER.size + len(pool)
+            pool += NAME_LENGTH.pack(len(encoded)) + encoded
+            data = model.to_bytes()
+            data_offset = HEADER.size + len(pool)
+            pool += data
+            level, ac = (model.level, model.ac) if kind == ENEMY else (0, 0)
+            records.append(RECORD.pack(name_offset, data_offset, len(data), level, ac, type_ids[entry_type]))
+        sections[kind] = records
+    enemy_offset = HEADER.size + len(pool)
+    location_offset = enemy_offset + RECORD.size * len(sections[ENEMY])
+    meta_offset = location_offset + RECORD.size * len(sections[LOCATION])
+    meta = json.dumps({'types': types, 'races': races, 'classes': classes}).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, enemy_offset, len(sections[ENEMY]), location_offset, len(sections[LOCATION]), meta_offset, len(meta)))
+        f.write(pool)
+        f.write(b''.join(sections[ENEMY]))
+        f.write(b''.join(sections[LOCATION]))
+        f.write(meta)
+    return len(sections[ENEMY]), len(sections[LOCATION])
+
+class _Names:
+    # Sequence view of one section's case-folded names, so bisect can search the file in place
+    def __init__(self, catalog, kind):
+        self.catalog = catalog
+        self.kind = kind
+
+    def __len__(self):
+        return self.catalog.counts[self.kind]
+
+    def __getitem__(self, index):
+        return self.catalog.name(self.kind, index).casefold()
+
+class Catalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise CatalogError(f"{path} is not a catalog")
+        magic, enemy_offset, enemy_count, location_offset, location_count, meta_offset, meta_length = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise CatalogError(f"{path} is not a catalog, or was built by another version")
+        self.offsets = {ENEMY: enemy_offset, LOCATION: location_offset}
+        self.counts = {ENEMY: enemy_count, LOCATION: location_count}
+        meta = json.loads(self.map[meta_offset:meta_offset + meta_length])
+        self.types = meta['types']
+        self.races = meta['races']
+        self.classes = meta['classes']
+        # Case-folded names and a trigram index over them, only built the first time a fuzzy search needs them
+        self.folded = {}
+        self.trigram_index = {}
+
+    def close(self):
+        self.map.close()
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def record(self, kind, index):
+        return RECORD.unpack_from(self.map, self.offsets[kind] + index * RECORD.size)
+
+    def name(self, kind, index):
+        offset = self.record(kind, index)[0]
+        (length,) = NAME_LENGTH.unpack_from(self.map, offset)
+        start = offset + NAME_LENGTH.size
+        return str(self.map[start:start + length], 'utf-8')
+
+    def get(self, kind, index):
+        _, offset, length, _, _, _ = self.record(kind, index)
+        return KINDS[kind].from_bytes(self.map[offset:offset + length])
+
+    def find(self, kind, name):
+        names = _Names(self, kind)
+        folded = name.casefold()
+        index = bisect_left(names, folded)
+        if index < len(names) and names[index] == folded:
+            return self.get(kind, index)
+        return None
+
+    def summary(self, kind, index):
+        # (index, name, type, level, ac) without unpacking the entry
+        _, _, _, level, ac, type_id = self.record(kind, index)
+        return index, self.name(kind, index), self.types[type_id], level, ac
+
+    def _matches(self, record, type_id, min_level, max_level, min_ac, max_ac):
+        _, _, _, level, ac, entry_type = record
+        return ((type_id is None or entry_type == type_id) and
+                (min_level is None or level >= min_level) and (max_level is None or level <= max_level) and
+                (min_ac is None or ac >= min_ac) and (max_ac is None or ac <= max_ac))
+
+    def _fuzzy(self, kind, folded, limit):
+        # Candidates share the most trigrams with the query, then difflib ranks the short list
+        keys = self.folded.get(kind)
+        if keys is None:
+            names = _Names(self, kind)
+            keys = self.folded[kind] = [names[i] for i in range(len(names))]
+            index = self.trigram_index[kind] = {}
+            for position, key in enumerate(keys):
+                for gram in trigrams(key):
+                    index.setdefault(gram, []).append(position)
+        index = self.trigram_index[kind]
+        shared = Counter()
+        for gram in trigrams(folded):
+            shared.update(index.get(gram, ()))
+        substring = [position for position, key in enumerate(keys) if folded in key]
+        ranked = sorted((position for position, _ in shared.most_common(limit * 4)),
+                        key=lambda position: difflib.SequenceMatcher(None, folded, keys[position]).ratio(), reverse=True)
+        return substring + ranked
+
+    def search(self, query='', kind=ENEMY, entry_type=None, min_level=None, max_level=None, min_ac=None, max_ac=None,
+               limit=50, fuzzy=True):
+        # Prefix matches first (a binary search on the sorted records), then substring and fuzzy matches
+        if entry_type is not None and entry_type not in self.types:
+            return []
+        type_id = self.types.index(entry_type) if entry_type is not None else None
+        filters = (type_id, min_level, max_level, min_ac, max_ac)
+        count = self.counts[kind]
+        folded = query.casefold().strip()
+        found = []
+        names = _Names(self, kind)
+        start = bisect_left(names, folded)
+        stop = bisect_left(names, folded + '\U0010ffff', start) if folded else count
+        # The prefix range is filtered straight off the packed records
+        offset = self.offsets[kind]
+        records = RECORD.iter_unpack(self.map[offset + start * RECORD.size:offset + stop * RECORD.size])
+        for index, record in enumerate(records, start):
+            if self._matches(record, *filters):
+                found.append(index)
+                if len(found) >= limit:
+                    break
+        if folded and fuzzy and len(found) < limit:
+            seen = set(found)
+            for index in self._fuzzy(kind, folded, limit):
+                if index not in seen and self._matches(self.record(kind, index), *filters):
+                    found.append(index)
+                    seen.add(index)
+                    if len(found) >= limit:
+                        break
+        return [self.summary(kind, index) for index in found]
+
+def open_catalog(path=CATALOG_PATH):
+    # The catalog is optional, callers fall back to their built-in lists without one
+    if not os.path.exists(path):
+        return None
+    try:
+        return Catalog(path)
+    except (CatalogError, ValueError, OSError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or search the monster and location catalog")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('compile', help="Compile JSON and CSV sources into a catalog file")
+    build.add_argument('sources', nargs='+')
+    build.add_argument('--output', default=CATALOG_PATH)
+    find = commands.add_parser('search', help="Search a compiled catalog")
+    find.add_argument('query', nargs='?', default='')
+    find.add_argument('--catalog', default=CATALOG_PATH)
+    find.add_argument('--kind', choices=list(KINDS), default=ENEMY)
+    find.add_argument('--type', default=None)
+    find.add_argument('--min-level', type=int, default=None)
+    find.add_argument('--max-level', type=int, default=None)
+    find.add_argument('--max-ac', type=int, default=None)
+    args = parser.parse_args()
+    if args.command == 'compile':
+        enemies, locations = compile_catalog(args.sources, args.output)
+        print(f"Wrote {enemies} enemies and {locations} locations to {args.output}")
+        return
+    catalog = Catalog(args.catalog)
+    for _, name, entry_type, level, ac in catalog.search(args.query, args.kind, args.type, args.min_level, args.max_level, None, args.max_ac):
+        print(f"{name} ({entry_type}) level {level}, AC {ac}")
+
+if __name__ == "__main__":
+    main()
@@ -1,513 +1,871 @@
-import tkinter as tk
-from tkinter import scrolledtext, ttk
-import socket
-import threading
-import json
-import random
-from models import Character, Enemy, Location
-from utils import roll_dice, setup_logging, log_event
-
-class DNDClient:
-    def __init__(self, host='localhost', port=12345):
-        self.host = host
-        self.port = port
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.root = tk.Tk()
-        self.root.title("D&D Campaign Client")
-        self.root.geometry("800x600")
-        self.root.attributes('-alpha', 0.95)  # 50% opacity for glassy effect
-        self.root.configure(bg='#F0F0F0')
-
-        # Style configuration for glassy look
-        self.style = ttk.Style()
-        self.style.theme_use('clam')
-        self.style.configure('TNotebook', background='#F0F0F0', borderwidth=0)
-        self.style.configure('TNotebook.Tab', background='#D0D0D0', foreground='black', font=('Arial', 10, 'bold'), padding=[10, 5])
-        self.style.map('TNotebook.Tab', background=[('selected', '#B0B0B0')])
-        self.style.configure('TButton', background='#4CAF50', foreground='white', font=('Arial', 10, 'bold'), padding=[10, 5])
-        self.style.map('TButton', background=[('active', '#45A049')])
-        self.style.configure('TLabel', background='#F0F0F0', foreground='black', font=('Arial', 10))
-        self.style.configure('TEntry', fieldbackground='#E0E0E0', borderwidth=1, relief='solid')
-        self.style.configure('TCombobox', fieldbackground='#E0E0E0', background='#E0E0E0')
-
-        self.is_dm = False
-        self.player_number = 1
-        self.races = ['Human', 'Elf', 'Dwarf', 'Orc', 'Halfling', 'Gnome', 'Half-Elf', 'Half-Orc', 'Tiefling', 'Dragonborn']
-        self.classes = ['Fighter', 'Wizard', 'Rogue', 'Cleric', 'Barbarian', 'Bard', 'Druid', 'Monk', 'Paladin', 'Ranger', 'Sorcerer', 'Warlock']
-        self.select_role()
-        if self.is_dm:
-            self.player_stats = {}
-        self.notebook = ttk.Notebook(self.root)
-        self.notebook.pack(expand=True, fill='both', padx=10, pady=10)
-
-        # Chat Tab
-        self.chat_frame = tk.Frame(self.notebook, bg='#2E2E2E')
-        self.notebook.add(self.chat_frame, text='Chat')
-        self.chat_area = scrolledtext.ScrolledText(self.chat_frame, wrap=tk.WORD, height=20, width=50, bg='#4A4A4A', fg='white', insertbackground='white', state='disabled')
-        self.chat_area.pack(pady=10)
-        self.message_entry = tk.Entry(self.chat_frame, width=40, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.message_entry.pack(pady=5)
-        self.send_button = tk.Button(self.chat_frame, text="Send", command=self.send_message, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.send_button.pack()
-
-        # Character Tab
-        self.char_frame = tk.Frame(self.notebook, bg='#2E2E2E')
-        self.notebook.add(self.char_frame, text='Character Sheet')
-        self.create_character_gui()
-        self.character = None
-
-        # Combat Tab
-        self.combat_frame = tk.Frame(self.notebook, bg='#2E2E2E')
-        self.notebook.add(self.combat_frame, text='Combat')
-        self.create_combat_gui()
-
-        # DM Tab
-        if self.is_dm:
-            self.dm_frame = tk.Frame(self.notebook, bg='#2E2E2E')
-            self.notebook.add(self.dm_frame, text='DM Tools')
-            self.create_dm_gui()
-
-        # Setup logging
-        setup_logging()
-
-    def create_character_gui(self):
-        # Center the content
-        self.char_frame.columnconfigure(0, weight=1)
-        self.char_frame.columnconfigure(1, weight=1)
-        self.char_frame.rowconfigure(14, weight=1)
-
-        # Container frame for centering
-        container = tk.Frame(self.char_frame, bg='#F0F0F0')
-        container.grid(row=0, column=0, columnspan=2, sticky='nsew', padx=20, pady=20)
-
-        # Labels and Entries
-        tk.Label(container, text="Name:").grid(row=0, column=0, sticky='e', pady=5)
-        self.name_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
-        self.name_entry.grid(row=0, column=1, sticky='ew', pady=5)
-
-        tk.Label(container, text="Race:").grid(row=1, column=0, sticky='e', pady=5)
-        self.race_combo = ttk.Combobox(container, values=self.races)
-        self.race_combo.grid(row=1, column=1, sticky='ew', pady=5)
-
-        tk.Label(container, text="Class:").grid(row=2, column=0, sticky='e', pady=5)
-        self.class_combo = ttk.Combobox(container, values=self.classes)
-        self.class_combo.grid(row=2, column=1, sticky='ew', pady=5)
-
-        tk.Label(container, text="Level:").grid(row=3, column=0, sticky='e', pady=5)
-        self.level_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
-        self.level_entry.grid(row=3, column=1, sticky='ew', pady=5)
-
-        # HP and MP
-        tk.Label(container, text="HP:").grid(row=4, column=0, sticky='e', pady=5)
-        self.hp_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
-        self.hp_entry.grid(row=4, column=1, sticky='ew', pady=5)
-
-        tk.Label(container, text="MP:").grid(row=5, column=0, sticky='e', pady=5)
-        self.mp_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
-        self.mp_entry.grid(row=5, column=1, sticky='ew', pady=5)
-
-        # Stats
-        stats = ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA']
-        self.stat_entries = {}
-        for i, stat in enumerate(stats):
-            tk.Label(container, text=f"{stat}:").grid(row=6+i, column=0, sticky='e', pady=5)
-            entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
-            entry.grid(row=6+i, column=1, sticky='ew', pady=5)
-            self.stat_entries[stat] = entry
-
-        # Special Skills
-        tk.Label(container, text="Special Skills:").grid(row=12, column=0, sticky='ne', pady=5)
-        self.skills_text = tk.Text(container, height=4, width=30, bg='#E0E0E0', fg='black', insertbackground='black')
-        self.skills_text.grid(row=12, column=1, sticky='ew', pady=5)
-
-        # Buttons
-        button_frame = tk.Frame(container, bg='#F0F0F0')
-        button_frame.grid(row=13, column=0, columnspan=2, pady=10)
-        self.save_button = tk.Button(button_frame, text="Save Character", command=self.save_character, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.save_button.pack(side=tk.LEFT, padx=5)
-        self.generate_button = tk.Button(button_frame, text="Generate Random Race/Class", command=self.generate_random, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.generate_button.pack(side=tk.LEFT, padx=5)
-
-        # Display Area
-        self.char_display = scrolledtext.ScrolledText(container, wrap=tk.WORD, height=10, width=40, bg='#E0E0E0', fg='black', insertbackground='black')
-        self.char_display.grid(row=14, column=0, columnspan=2, sticky='nsew', pady=10)
-
-        # Configure container for responsiveness
-        container.columnconfigure(1, weight=1)
-        container.rowconfigure(14, weight=1)
-
-    def save_character(self):
-        name = self.name_entry.get()
-        race = self.race_combo.get()
-        class_type = self.class_combo.get()
-        level = int(self.level_entry.get()) if self.level_entry.get() else 1
-        hp = int(self.hp_entry.get()) if self.hp_entry.get() else 10
-        mp = int(self.mp_entry.get()) if self.mp_entry.get() else 10
-        stats = {stat: int(entry.get()) if entry.get() else 10 for stat, entry in self.stat_entries.items()}
-        special_skills = self.skills_text.get("1.0", tk.END).strip().split('\n') if self.skills_text.get("1.0", tk.END).strip() else []
-        self.character = Character(name, race, class_type, level)
-        self.character.hp = hp
-        self.character.mp = mp
-        self.character.stats = stats
-        self.character.special_skills = special_skills
-        self.display_character()
-        # Send player data to server
-        skills_str = ','.join(special_skills) if special_skills else ''
-        stats_str = ' '.join(str(stats[s]) for s in ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA'])
-        data = f"PLAYER_DATA {name} {race} {class_type} {level} {hp} {mp} {stats_str} {skills_str}"
-        self.client_socket.send(data.encode())
-        log_event(f"Character saved: {name}, {race}, {class_type}, Level {level}")
-
-    def generate_random(self):
-        self.race_combo.set(random.choice(self.races))
-        self.class_combo.set(random.choice(self.classes))
-
-    def display_character(self):
-        if self.character:
-            skills_str = '\n'.join(self.character.special_skills) if self.character.special_skills else 'None'
-            info = f"Name: {self.character.name}\nRace: {self.character.race}\nClass: {self.character.class_type}\nLevel: {self.character.level}\nStats: {self.character.stats}\nSpecial Skills:\n{skills_str}"
-            self.char_display.delete(1.0, tk.END)
-            self.char_display.insert(tk.END, info)
-
-    def create_combat_gui(self):
-        # Basic combat GUI with initiative order and dice roll button
-        tk.Label(self.combat_frame, text="Initiative Order:").pack()
-        self.initiative_list = tk.Listbox(self.combat_frame, height=10, width=30)
-        self.initiative_list.pack(pady=5)
-
-        self.roll_button = tk.Button(self.combat_frame, text="Roll d20 for Initiative", command=self.roll_initiative)
-        self.roll_button.pack(pady=10)
-
-        self.combat_log = scrolledtext.ScrolledText(self.combat_frame, wrap=tk.WORD, height=10, width=50)
-        self.combat_log.pack(pady=10)
-
-    def roll_initiative(self):
-        roll = roll_dice(20)
-        player_name = self.character.name if self.character else f"Player {self.player_number}"
-        message = f"{player_name} rolled a {roll} for initiative."
-        self.combat_log.insert(tk.END, message + '\n')
-        self.combat_log.see(tk.END)
-        self.client_socket.send(message.encode())
-        log_event(f"Initiative roll: {roll}")
-
-    def create_dm_gui(self):
-        # Configure DM frame for proper layout
-        self.dm_frame.columnconfigure(0, weight=1)
-        self.dm_frame.rowconfigure(0, weight=1)
-
-        # Create a canvas and scrollbar for scrolling
-        canvas = tk.Canvas(self.dm_frame, bg='#2E2E2E', highlightthickness=0)
-        scrollbar = tk.Scrollbar(self.dm_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas, bg='#2E2E2E')
-
-        def configure_scroll_region(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-
-        def configure_canvas(event):
-            canvas.itemconfig(scrollable_window, width=event.width)
-
-        scrollable_frame.bind("<Configure>", configure_scroll_region)
-        canvas.bind("<Configure>", configure_canvas)
-
-        scrollable_window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        # Pack canvas and scrollbar
-        canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
-
-        # DM narration area
-        tk.Label(scrollable_frame, text="DM Narration:", bg='#2E2E2E', fg='white').pack(pady=(10, 5))
-        self.narration_entry = tk.Entry(scrollable_frame, width=50, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.narration_entry.pack(pady=5)
-        self.narrate_button = tk.Button(scrollable_frame, text="Narrate", command=self.send_narration, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.narrate_button.pack(pady=5)
-
-        # DM Edit Player Status
-        tk.Label(scrollable_frame, text="Edit Player Status", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
-        edit_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
-        edit_frame.pack(pady=5)
-
-        tk.Label(edit_frame, text="Player Name:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
-        self.edit_player_entry = tk.Entry(edit_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.edit_player_entry.grid(row=0, column=1, padx=5, pady=2)
-
-        tk.Label(edit_frame, text="Stat:", bg='#2E2E2E', fg='white').grid(row=1, column=0, sticky='e', padx=5, pady=2)
-        self.edit_stat_combo = ttk.Combobox(edit_frame, values=['hp', 'mp', 'str', 'dex', 'con', 'int', 'wis', 'cha'])
-        self.edit_stat_combo.grid(row=1, column=1, padx=5, pady=2)
-
-        tk.Label(edit_frame, text="New Value:", bg='#2E2E2E', fg='white').grid(row=2, column=0, sticky='e', padx=5, pady=2)
-        self.edit_value_entry = tk.Entry(edit_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.edit_value_entry.grid(row=2, column=1, padx=5, pady=2)
-
-        self.edit_button = tk.Button(edit_frame, text="Update Status", command=self.send_edit_command, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.edit_button.grid(row=3, column=0, columnspan=2, pady=10)
-
-        # DM tools
-        self.next_turn_button = tk.Button(scrollable_frame, text="Next Turn", command=self.next_turn, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.next_turn_button.pack(pady=10)
-
-        self.dm_log = scrolledtext.ScrolledText(scrollable_frame, wrap=tk.WORD, height=8, width=60, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.dm_log.pack(pady=10)
-
-        # Player Stats Log
-        tk.Label(scrollable_frame, text="Player Stats Log:", bg='#2E2E2E', fg='white').pack(pady=(10, 5))
-        self.player_stats_log = scrolledtext.ScrolledText(scrollable_frame, wrap=tk.WORD, height=8, width=60, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.player_stats_log.pack(pady=10)
-
-        # Enemy Creation Section
-        tk.Label(scrollable_frame, text="Create Enemy:", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
-        enemy_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
-        enemy_frame.pack(pady=5)
-
-        tk.Label(enemy_frame, text="Name:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
-        self.enemy_name_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.enemy_name_entry.grid(row=0, column=1, padx=5, pady=2)
-
-        tk.Label(enemy_frame, text="Type:", bg='#2E2E2E', fg='white').grid(row=1, column=0, sticky='e', padx=5, pady=2)
-        self.enemy_type_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.enemy_type_entry.grid(row=1, column=1, padx=5, pady=2)
-
-        tk.Label(enemy_frame, text="Level:", bg='#2E2E2E', fg='white').grid(row=2, column=0, sticky='e', padx=5, pady=2)
-        self.enemy_level_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.enemy_level_entry.grid(row=2, column=1, padx=5, pady=2)
-
-        tk.Label(enemy_frame, text="HP:", bg='#2E2E2E', fg='white').grid(row=3, column=0, sticky='e', padx=5, pady=2)
-        self.enemy_hp_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.enemy_hp_entry.grid(row=3, column=1, padx=5, pady=2)
-
-        tk.Label(enemy_frame, text="AC:", bg='#2E2E2E', fg='white').grid(row=4, column=0, sticky='e', padx=5, pady=2)
-        self.enemy_ac_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.enemy_ac_entry.grid(row=4, column=1, padx=5, pady=2)
-
-        tk.Label(enemy_frame, text="Description:", bg='#2E2E2E', fg='white').grid(row=5, column=0, sticky='ne', padx=5, pady=2)
-        self.enemy_desc_text = tk.Text(enemy_frame, height=3, width=30, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.enemy_desc_text.grid(row=5, column=1, padx=5, pady=2)
-
-        self.create_enemy_button = tk.Button(enemy_frame, text="Create Enemy", command=self.create_enemy, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.create_enemy_button.grid(row=6, column=0, columnspan=2, pady=10)
-
-        # Location Creation Section
-        tk.Label(scrollable_frame, text="Create Location:", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
-        location_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
-        location_frame.pack(pady=5)
-
-        tk.Label(location_frame, text="Name:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
-        self.location_name_entry = tk.Entry(location_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.location_name_entry.grid(row=0, column=1, padx=5, pady=2)
-
-        tk.Label(location_frame, text="Type:", bg='#2E2E2E', fg='white').grid(row=1, column=0, sticky='e', padx=5, pady=2)
-        self.location_type_entry = tk.Entry(location_frame, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.location_type_entry.grid(row=1, column=1, padx=5, pady=2)
-
-        tk.Label(location_frame, text="Description:", bg='#2E2E2E', fg='white').grid(row=2, column=0, sticky='ne', padx=5, pady=2)
-        self.location_desc_text = tk.Text(location_frame, height=3, width=30, bg='#4A4A4A', fg='white', insertbackground='white')
-        self.location_desc_text.grid(row=2, column=1, padx=5, pady=2)
-
-        self.create_location_button = tk.Button(location_frame, text="Create Location", command=self.create_location, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
-        self.create_location_button.grid(row=3, column=0, columnspan=2, pady=10)
-
-    def send_narration(self):
-        narration = self.narration_entry.get()
-        if narration:
-            message = f"DM: {narration}"
-            self.client_socket.send(message.encode())
-            self.narration_entry.delete(0, tk.END)
-            log_event(f"DM narration: {narration}")
-
-    def next_turn(self):
-        self.dm_log.insert(tk.END, "Next turn.\n")
-        self.dm_log.see(tk.END)
-        log_event("Next turn initiated")
-
-    def connect(self):
-        self.client_socket.connect((self.host, self.port))
-        threading.Thread(target=self.receive_messages).start()
-
-    def send_message(self):
-        message = self.message_entry.get()
-        if message:
-            # Display the message in our own chat log
-            self.chat_area.config(state='normal')
-            self.chat_area.insert(tk.END, f"You: {message}\n")
-            self.chat_area.see(tk.END)
-            self.chat_area.config(state='disabled')
-
-            # Send to server
-            self.client_socket.send(message.encode())
-            self.message_entry.delete(0, tk.END)
-            log_event(f"Message sent: {message}")
-
-    def send_edit_command(self):
-        player_name = self.edit_player_entry.get()
-        stat = self.edit_stat_combo.get().lower()
-        value = self.edit_value_entry.get()
-        if player_name and stat and value.isdigit():
-            command = f"/edit_{stat} {player_name} {value}"
-            self.client_socket.send(command.encode())
-            self.edit_player_entry.delete(0, tk.END)
-            self.edit_stat_combo.set('')
-            self.edit_value_entry.delete(0, tk.END)
-            log_event(f"Sent DM edit command: {command}")
-
-    def receive_messages(self):
-        while True:
-            try:
-                message = self.client_socket.recv(1024).decode()
-                self.root.after(0, self.update_chat, message)
-            except:
-                break
-
-    def update_chat(self, message):
-        self.chat_area.config(state='normal')
-        self.chat_area.insert(tk.END, message + '\n')
-        self.chat_area.see(tk.END)
-        self.chat_area.config(state='disabled')
-        # Update HP/MP display if message contains DM update
-        if message.startswith("DM updated"):
-            parts = message.split()
-            if len(parts) >= 5:
-                player_name = parts[2].strip("'s")
-                stat = parts[3]
-                value = parts[5]
-                if self.character and self.character.name == player_name:
-                    stat_upper = stat.upper()
-                    if stat == 'hp':
-                        self.character.hp = int(value)
-                        self.hp_entry.delete(0, tk.END)
-                        self.hp_entry.insert(0, value)
-                    elif stat == 'mp':
-                        self.character.mp = int(value)
-                        self.mp_entry.delete(0, tk.END)
-                        self.mp_entry.insert(0, value)
-                    elif stat_upper in self.character.stats:
-                        self.character.stats[stat_upper] = int(value)
-                        self.stat_entries[stat_upper].delete(0, tk.END)
-                        self.stat_entries[stat_upper].insert(0, value)
-                # Also update DM's player stats log automatically
-                if self.is_dm and player_name in self.player_stats:
-                    if stat in ['hp', 'mp']:
-                        self.player_stats[player_name][stat] = value
-                    elif stat_upper in self.player_stats[player_name].get('stats', {}):
-                        self.player_stats[player_name]['stats'][stat_upper] = int(value)
-                    # Refresh the log with updated stats
-                    self.player_stats_log.delete(1.0, tk.END)
-                    for name, data in self.player_stats.items():
-                        skills_display = ', '.join(data.get('special_skills', [])) if data.get('special_skills') else 'None'
-                        stats = data.get('stats', {})
-                        stats_display = f"STR{stats.get('STR', 10)} DEX{stats.get('DEX', 10)} CON{stats.get('CON', 10)} INT{stats.get('INT', 10)} WIS{stats.get('WIS', 10)} CHA{stats.get('CHA', 10)}"
-                        self.player_stats_log.insert(tk.END, f"Player: {name}, Race: {data['race']}, Class: {data['class']}, Level: {data['level']}, HP: {data['hp']}, MP: {data['mp']}, Stats: {stats_display}, Skills: {skills_display}\n")
-                    self.player_stats_log.see(tk.END)
-        # Update player stats log if message contains player data
-        if self.is_dm and message.startswith("PLAYER_DATA"):
-            parts = message.split()
-            if len(parts) >= 9:
-                name, race, class_type, level, hp, mp, stats_str, skills_str = parts[1], parts[2], parts[3], parts[4], parts[5], parts[6], parts[7], ' '.join(parts[8:])
-                skills = skills_str.split(',') if skills_str else []
-                str_val, dex, con, int_val, wis, cha = stats_str.split()
-                stats = {'STR': int(str_val), 'DEX': int(dex), 'CON': int(con), 'INT': int(int_val), 'WIS': int(wis), 'CHA': int(cha)}
-                self.player_stats[name] = {'race': race, 'class': class_type, 'level': level, 'hp': hp, 'mp': mp, 'stats': stats, 'special_skills': skills}
-                skills_display = ', '.join(skills) if skills else 'None'
-                stats_display = f"STR{str_val} DEX{dex} CON{con} INT{int_val} WIS{wis} CHA{cha}"
-                self.player_stats_log.insert(tk.END, f"Player: {name}, Race: {race}, Class: {class_type}, Level: {level}, HP: {hp}, MP: {mp}, Stats: {stats_display}, Skills: {skills_display}\n")
-                self.player_stats_log.see(tk.END)
-
-        # Handle enemy data for players
-        if message.startswith("ENEMY_DATA"):
-            parts = message.split()
-            if len(parts) >= 6:
-                name, enemy_type, level, hp, ac, description = parts[1], parts[2], parts[3], parts[4], parts[5], ' '.join(parts[6:]).replace('_', ' ')
-                enemy_info = f"DM created enemy: {name} ({enemy_type}) - Level {level}, HP {hp}, AC {ac}\nDescription: {description}"
-                self.chat_area.insert(tk.END, enemy_info + '\n', 'enemy')
-                self.chat_area.tag_config('enemy', foreground='red', font=('Arial', 10, 'bold'))
-                self.chat_area.see(tk.END)
-
-        # Handle location data for players
-        if message.startswith("LOCATION_DATA"):
-            parts = message.split()
-            if len(parts) >= 4:
-                name, location_type, description = parts[1], parts[2], ' '.join(parts[3:]).replace('_', ' ')
-                location_info = f"DM created location: {name} ({location_type})\nDescription: {description}"
-                self.chat_area.insert(tk.END, location_info + '\n', 'location')
-                self.chat_area.tag_config('location', foreground='blue', font=('Arial', 10, 'bold'))
-                self.chat_area.see(tk.END)
-
-    def select_role(self):
-        # Create a selection window
-        select_win = tk.Toplevel(self.root)
-        select_win.title("Select Role")
-        select_win.geometry("300x250")
-
-        tk.Label(select_win, text="Server IP:").pack(pady=5)
-        server_ip_var = tk.StringVar(value="localhost")
-        server_ip_entry = tk.Entry(select_win, textvariable=server_ip_var)
-        server_ip_entry.pack()
-
-        tk.Label(select_win, text="Are you a Player or DM?").pack(pady=10)
-
-        role_var = tk.StringVar(value="Player")
-        tk.Radiobutton(select_win, text="Player", variable=role_var, value="Player").pack()
-        tk.Radiobutton(select_win, text="DM", variable=role_var, value="DM").pack()
-
-        tk.Label(select_win, text="Player Number (1-4):").pack(pady=5)
-        player_num_var = tk.StringVar(value="1")
-        player_num_entry = tk.Entry(select_win, textvariable=player_num_var)
-        player_num_entry.pack()
-
-        def confirm():
-            self.host = server_ip_var.get()
-            self.is_dm = role_var.get() == "DM"
-            self.player_number = int(player_num_var.get()) if player_num_var.get().isdigit() else 1
-            select_win.destroy()
-
-        tk.Button(select_win, text="Confirm", command=confirm).pack(pady=10)
-
-        self.root.wait_window(select_win)
-
-    def create_enemy(self):
-        name = self.enemy_name_entry.get()
-        enemy_type = self.enemy_type_entry.get()
-        level = int(self.enemy_level_entry.get()) if self.enemy_level_entry.get() else 1
-        hp = int(self.enemy_hp_entry.get()) if self.enemy_hp_entry.get() else 10
-        ac = int(self.enemy_ac_entry.get()) if self.enemy_ac_entry.get() else 10
-        description = self.enemy_desc_text.get("1.0", tk.END).strip()
-
-        enemy = Enemy(name, enemy_type, level, hp, ac, description)
-        enemy_data = f"ENEMY_DATA {name} {enemy_type} {level} {hp} {ac} {description.replace(' ', '_')}"
-        self.client_socket.send(enemy_data.encode())
-
-        # Clear the form
-        self.enemy_name_entry.delete(0, tk.END)
-        self.enemy_type_entry.delete(0, tk.END)
-        self.enemy_level_entry.delete(0, tk.END)
-        self.enemy_hp_entry.delete(0, tk.END)
-        self.enemy_ac_entry.delete(0, tk.END)
-        self.enemy_desc_text.delete("1.0", tk.END)
-
-        log_event(f"Enemy created: {name}, {enemy_type}, Level {level}")
-
-    def create_location(self):
-        name = self.location_name_entry.get()
-        location_type = self.location_type_entry.get()
-        description = self.location_desc_text.get("1.0", tk.END).strip()
-
-        location = Location(name, location_type, description)
-        location_data = f"LOCATION_DATA {name} {location_type} {description.replace(' ', '_')}"
-        self.client_socket.send(location_data.encode())
-
-        # Clear the form
-        self.location_name_entry.delete(0, tk.END)
-        self.location_type_entry.delete(0, tk.END)
-        self.location_desc_text.delete("1.0", tk.END)
-
-        log_event(f"Location created: {name}, {location_type}")
-
-
-
-    def run(self):
-        self.connect()
-        self.root.mainloop()
-
-if __name__ == "__main__":
-    client = DNDClient()
-    client.run()
+import tkinter as tk
+from tkinter import scrolledtext, ttk
+from models import Character, Enemy, Location
+from utils import setup_logging, log_event
+from ui_pump import UpdatePump
+from log_view import LogView
+from protocol import (ProtocolError, to_legacy, CHAT, PLAYER_DATA, ENEMY_DATA, LOCATION_DATA, EDIT, STAT_UPDATE, PATCH, INITIATIVE, INITIATIVE_REMOVE, TURN,
+                      STAT_BATCH, MAP_DATA, TOKEN_PLACE, TOKEN_MOVE, TOKEN_REMOVE, TILE_SET, WHISPER, parse_whisper)
+from session import Session
+from metrics import setup_from_environment
+
+class DNDClient:
+    def __init__(self, host='localhost', port=12345, is_dm=None, player_number=1):
+        # All protocol and table state lives in the session, this class only draws it
+        self.session = Session(host, port)
+        self.session.subscribe(CHAT, self.handle_chat)
+        self.session.subscribe(WHISPER, self.handle_whisper)
+        self.session.subscribe(PLAYER_DATA, self.handle_player_data)
+        self.session.subscribe(ENEMY_DATA, self.handle_enemy_data)
+        self.session.subscribe(LOCATION_DATA, self.handle_location_data)
+        self.session.subscribe(STAT_UPDATE, self.handle_stat_update)
+        self.session.subscribe(STAT_BATCH, self.handle_stat_batch)
+        self.session.subscribe(PATCH, self.handle_patch)
+        self.session.subscribe(INITIATIVE, self.handle_initiative)
+        self.session.subscribe(INITIATIVE_REMOVE, self.handle_initiative_remove)
+        self.session.subscribe(TURN, self.handle_turn)
+        self.session.subscribe(MAP_DATA, self.handle_map_data)
+        for msg_type in (TOKEN_PLACE, TOKEN_MOVE, TOKEN_REMOVE):
+            self.session.subscribe(msg_type, self.handle_token)
+        self.session.subscribe(TILE_SET, self.handle_tile)
+        self.root = tk.Tk()
+        self.root.title("D&D Campaign Client")
+        self.root.geometry("800x600")
+        self.root.attributes('-alpha', 0.95)  # 50% opacity for glassy effect
+        self.root.configure(bg='#F0F0F0')
+
+        # Style configuration for glassy look
+        self.style = ttk.Style()
+        self.style.theme_use('clam')
+        self.style.configure('TNotebook', background='#F0F0F0', borderwidth=0)
+        self.style.configure('TNotebook.Tab', background='#D0D0D0', foreground='black', font=('Arial', 10, 'bold'), padding=[10, 5])
+        self.style.map('TNotebook.Tab', background=[('selected', '#B0B0B0')])
+        self.style.configure('TButton', background='#4CAF50', foreground='white', font=('Arial', 10, 'bold'), padding=[10, 5])
+        self.style.map('TButton', background=[('active', '#45A049')])
+        self.style.configure('TLabel', background='#F0F0F0', foreground='black', font=('Arial', 10))
+        self.style.configure('TEntry', fieldbackground='#E0E0E0', borderwidth=1, relief='solid')
+        self.style.configure('TCombobox', fieldbackground='#E0E0E0', background='#E0E0E0')
+
+        # The compiled catalog is memory-mapped, it is opened the first time the DM tools or the race and class lists need it
+        self.catalog = None
+        self.catalog_opened = False
+        self.catalog_results = []
+        self.races = ['Human', 'Elf', 'Dwarf', 'Orc', 'Halfling', 'Gnome', 'Half-Elf', 'Half-Orc', 'Tiefling', 'Dragonborn']
+        self.classes = ['Fighter', 'Wizard', 'Rogue', 'Cleric', 'Barbarian', 'Bard', 'Druid', 'Monk', 'Paladin', 'Ranger', 'Sorcerer', 'Warlock']
+        if is_dm is None:
+            is_dm, player_number = self.select_role()
+        self.session.set_role(is_dm, player_number)
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(expand=True, fill='both', padx=10, pady=10)
+
+        # Chat Tab
+        self.chat_frame = tk.Frame(self.notebook, bg='#2E2E2E')
+        self.notebook.add(self.chat_frame, text='Chat')
+        self.chat_area = LogView(self.chat_frame, readonly=True, wrap=tk.WORD, height=20, width=50, bg='#4A4A4A', fg='white', insertbackground='white', state='disabled')
+        self.chat_area.pack(pady=10)
+        self.chat_area.tag_config('enemy', foreground='red', font=('Arial', 10, 'bold'))
+        self.chat_area.tag_config('location', foreground='blue', font=('Arial', 10, 'bold'))
+        self.chat_area.tag_config('whisper', foreground='#C39BD3', font=('Arial', 10, 'italic'))
+        # Network frames are queued and handled on the Tk thread about once per display frame
+        self.pump = UpdatePump(self.root, self.session.dispatch, interval_ms=16)
+        self.pump.add_flusher(self.chat_area.flush)
+        self.message_entry = tk.Entry(self.chat_frame, width=40, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.message_entry.pack(pady=5)
+        self.send_button = tk.Button(self.chat_frame, text="Send", command=self.send_message, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.send_button.pack()
+        search_frame = tk.Frame(self.chat_frame, bg='#2E2E2E')
+        search_frame.pack(pady=5)
+        self.search_entry = tk.Entry(search_frame, width=30, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.search_entry.pack(side=tk.LEFT, padx=5)
+        self.search_button = tk.Button(search_frame, text="Search History", command=self.search_chat, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.search_button.pack(side=tk.LEFT)
+
+        # Character Tab
+        self.char_frame = tk.Frame(self.notebook, bg='#2E2E2E')
+        self.notebook.add(self.char_frame, text='Character Sheet')
+        self.create_character_gui()
+
+        # Combat Tab
+        self.combat_frame = tk.Frame(self.notebook, bg='#2E2E2E')
+        self.notebook.add(self.combat_frame, text='Combat')
+        self.create_combat_gui()
+
+        # Map Tab, the canvas is only built once there is a map to show
+        self.map_frame = tk.Frame(self.notebook, bg='#2E2E2E')
+        self.notebook.add(self.map_frame, text='Map')
+        self.map_view = None
+        self.map_location = None
+
+        # DM Tab, its widgets are only built the first time it is opened
+        self.player_stats_log = None
+        if self.session.is_dm:
+            self.dm_frame = tk.Frame(self.notebook, bg='#2E2E2E')
+            self.notebook.add(self.dm_frame, text='DM Tools')
+            self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+
+        # Setup logging
+        setup_logging()
+
+    def create_character_gui(self):
+        # Center the content
+        self.char_frame.columnconfigure(0, weight=1)
+        self.char_frame.columnconfigure(1, weight=1)
+        self.char_frame.rowconfigure(14, weight=1)
+
+        # Container frame for centering
+        container = tk.Frame(self.char_frame, bg='#F0F0F0')
+        container.grid(row=0, column=0, columnspan=2, sticky='nsew', padx=20, pady=20)
+
+        # Labels and Entries
+        tk.Label(container, text="Name:").grid(row=0, column=0, sticky='e', pady=5)
+        self.name_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
+        self.name_entry.grid(row=0, column=1, sticky='ew', pady=5)
+
+        tk.Label(container, text="Race:").grid(row=1, column=0, sticky='e', pady=5)
+        self.race_combo = ttk.Combobox(container, values=self.races, postcommand=self.load_choices)
+        self.race_combo.grid(row=1, column=1, sticky='ew', pady=5)
+
+        tk.Label(container, text="Class:").grid(row=2, column=0, sticky='e', pady=5)
+        self.class_combo = ttk.Combobox(container, values=self.classes, postcommand=self.load_choices)
+        self.class_combo.grid(row=2, column=1, sticky='ew', pady=5)
+
+        tk.Label(container, text="Level:").grid(row=3, column=0, sticky='e', pady=5)
+        self.level_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
+        self.level_entry.grid(row=3, column=1, sticky='ew', pady=5)
+
+        # HP and MP
+        tk.Label(container, text="HP:").grid(row=4, column=0, sticky='e', pady=5)
+        self.hp_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
+        self.hp_entry.grid(row=4, column=1, sticky='ew', pady=5)
+
+        tk.Label(container, text="MP:").grid(row=5, column=0, sticky='e', pady=5)
+        self.mp_entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
+        self.mp_entry.grid(row=5, column=1, sticky='ew', pady=5)
+
+        # Stats
+        stats = ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA']
+        self.stat_entries = {}
+        for i, stat in enumerate(stats):
+            tk.Label(container, text=f"{stat}:").grid(row=6+i, column=0, sticky='e', pady=5)
+            entry = tk.Entry(container, bg='#E0E0E0', fg='black', insertbackground='black')
+            entry.grid(row=6+i, column=1, sticky='ew', pady=5)
+            self.stat_entries[stat] = entry
+
+        # Special Skills
+        tk.Label(container, text="Special Skills:").grid(row=12, column=0, sticky='ne', pady=5)
+        self.skills_text = tk.Text(container, height=4, width=30, bg='#E0E0E0', fg='black', insertbackground='black')
+        self.skills_text.grid(row=12, column=1, sticky='ew', pady=5)
+
+        # Buttons
+        button_frame = tk.Frame(container, bg='#F0F0F0')
+        button_frame.grid(row=13, column=0, columnspan=2, pady=10)
+        self.save_button = tk.Button(button_frame, text="Save Character", command=self.save_character, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.save_button.pack(side=tk.LEFT, padx=5)
+        self.generate_button = tk.Button(button_frame, text="Generate Random Character", command=self.generate_random, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.generate_button.pack(side=tk.LEFT, padx=5)
+
+        # Display Area
+        self.char_display = scrolledtext.ScrolledText(container, wrap=tk.WORD, height=10, width=40, bg='#E0E0E0', fg='black', insertbackground='black')
+        self.char_display.grid(row=14, column=0, columnspan=2, sticky='nsew', pady=10)
+
+        # Configure container for responsiveness
+        container.columnconfigure(1, weight=1)
+        container.rowconfigure(14, weight=1)
+
+    def save_character(self):
+        name = self.name_entry.get()
+        race = self.race_combo.get()
+        class_type = self.class_combo.get()
+        level = int(self.level_entry.get()) if self.level_entry.get() else 1
+        hp = int(self.hp_entry.get()) if self.hp_entry.get() else 10
+        mp = int(self.mp_entry.get()) if self.mp_entry.get() else 10
+        stats = {stat: int(entry.get()) if entry.get() else 10 for stat, entry in self.stat_entries.items()}
+        special_skills = self.skills_text.get("1.0", tk.END).strip().split('\n') if self.skills_text.get("1.0", tk.END).strip() else []
+        character = Character(name, race, class_type, level)
+        character.hp = hp
+        character.mp = mp
+        character.stats = stats
+        character.special_skills = special_skills
+        self.session.character = character
+        self.display_character()
+        # Send player data to server
+        self.session.publish(character)
+        log_event(f"Character saved: {name}, {race}, {class_type}, Level {level}")
+
+    def open_catalog(self):
+        if not self.catalog_opened:
+            from catalog import open_catalog
+            self.catalog = open_catalog()
+            self.catalog_opened = True
+            if self.catalog:
+                self.races = self.catalog.races or self.races
+                self.classes = self.catalog.classes or self.classes
+        return self.catalog
+
+    def load_choices(self):
+        # The catalog's races and classes replace the built-in ones the first time a list drops down
+        if not self.catalog_opened:
+            self.open_catalog()
+            self.race_combo.configure(values=self.races)
+            self.class_combo.configure(values=self.classes)
+
+    def generate_random(self):
+        # Rolls a whole sheet at the level already typed in, every field can still be edited before saving
+        from generator import Generator
+        self.load_choices()
+        level = int(self.level_entry.get()) if self.level_entry.get().isdigit() and int(self.level_entry.get()) > 0 else 1
+        character = next(Generator(races=self.races, classes=self.classes).characters(1, level, level))
+        self.race_combo.set(character.race)
+        self.class_combo.set(character.class_type)
+        for entry, value in ((self.name_entry, character.name), (self.level_entry, character.level), (self.hp_entry, character.hp),
+                             (self.mp_entry, character.mp)):
+            entry.delete(0, tk.END)
+            entry.insert(0, str(value))
+        for stat, entry in self.stat_entries.items():
+            entry.delete(0, tk.END)
+            entry.insert(0, str(character.stats[stat]))
+        self.skills_text.delete("1.0", tk.END)
+        self.skills_text.insert("1.0", '\n'.join(character.special_skills))
+
+    def display_character(self):
+        character = self.session.character
+        if character:
+            skills_str = '\n'.join(character.special_skills) if character.special_skills else 'None'
+            info = f"Name: {character.name}\nRace: {character.race}\nClass: {character.class_type}\nLevel: {character.level}\nStats: {character.stats}\nSpecial Skills:\n{skills_str}"
+            self.char_display.delete(1.0, tk.END)
+            self.char_display.insert(tk.END, info)
+
+    def create_combat_gui(self):
+        # Basic combat GUI with initiative order and dice roll button
+        tk.Label(self.combat_frame, text="Initiative Order:").pack()
+        self.initiative_list = tk.Listbox(self.combat_frame, height=10, width=30)
+        self.initiative_list.pack(pady=5)
+
+        self.roll_button = tk.Button(self.combat_frame, text="Roll d20 for Initiative", command=self.roll_initiative)
+        self.roll_button.pack(pady=10)
+        if self.session.is_dm:
+            self.remove_button = tk.Button(self.combat_frame, text="Remove Selected", command=self.remove_selected)
+            self.remove_button.pack()
+
+        self.combat_log = LogView(self.combat_frame, wrap=tk.WORD, height=10, width=50)
+        self.combat_log.pack(pady=10)
+        self.pump.add_flusher(self.combat_log.flush)
+
+    def roll_initiative(self):
+        import dice
+        roll = dice.roll('1d20')
+        character = self.session.character
+        player_name = character.name if character else f"Player {self.session.player_number}"
+        dex = character.stats['DEX'] if character else 10
+        self.session.roll_initiative(player_name, roll, dex)
+        log_event(f"Initiative roll: {roll}")
+
+    def remove_selected(self):
+        names = [self.session.initiative.order[index][2] for index in self.initiative_list.curselection()]
+        for name in names:
+            self.session.remove_combatant(name)
+
+    def handle_initiative(self, payload):
+        if payload['replaced'] is not None:
+            self.initiative_list.delete(payload['replaced'])
+        self.initiative_list.insert(payload['index'], f"{payload['roll']:>3}  {payload['name']}")
+        self.combat_log.append(to_legacy(INITIATIVE, payload))
+
+    def handle_initiative_remove(self, payload):
+        self.initiative_list.delete(payload['index'])
+        self.combat_log.append(to_legacy(INITIATIVE_REMOVE, payload))
+
+    def handle_turn(self, payload):
+        # Only the two rows whose highlight changes are touched
+        if payload['previous'] is not None:
+            self.initiative_list.itemconfig(payload['previous'], background='')
+        if payload['index'] is not None:
+            self.initiative_list.itemconfig(payload['index'], background='#B0B0B0')
+            self.initiative_list.see(payload['index'])
+        self.combat_log.append(to_legacy(TURN, payload))
+
+    def on_tab_changed(self, event):
+        if self.player_stats_log is None and self.notebook.select() == str(self.dm_frame):
+            self.create_dm_gui()
+
+    def create_dm_gui(self):
+        from stats_panel import PlayerStatsPanel
+        from catalog import ENEMY, LOCATION
+        # Configure DM frame for proper layout
+        self.dm_frame.columnconfigure(0, weight=1)
+        self.dm_frame.rowconfigure(0, weight=1)
+
+        # Create a canvas and scrollbar for scrolling
+        canvas = tk.Canvas(self.dm_frame, bg='#2E2E2E', highlightthickness=0)
+        scrollbar = tk.Scrollbar(self.dm_frame, orient="vertical", command=canvas.yview)
+        scrollable_frame = tk.Frame(canvas, bg='#2E2E2E')
+
+        def configure_scroll_region(event):
+            canvas.configure(scrollregion=canvas.bbox("all"))
+
+        def configure_canvas(event):
+            canvas.itemconfig(scrollable_window, width=event.width)
+
+        scrollable_frame.bind("<Configure>", configure_scroll_region)
+        canvas.bind("<Configure>", configure_canvas)
+
+        scrollable_window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
+        canvas.configure(yscrollcommand=scrollbar.set)
+
+        # Pack canvas and scrollbar
+        canvas.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        # DM narration area
+        tk.Label(scrollable_frame, text="DM Narration:", bg='#2E2E2E', fg='white').pack(pady=(10, 5))
+        self.narration_entry = tk.Entry(scrollable_frame, width=50, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.narration_entry.pack(pady=5)
+        self.narrate_button = tk.Button(scrollable_frame, text="Narrate", command=self.send_narration, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.narrate_button.pack(pady=5)
+
+        # DM Edit Player Status
+        tk.Label(scrollable_frame, text="Edit Player Status", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
+        edit_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+        edit_frame.pack(pady=5)
+
+        tk.Label(edit_frame, text="Player Name:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
+        self.edit_player_entry = tk.Entry(edit_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.edit_player_entry.grid(row=0, column=1, padx=5, pady=2)
+
+        tk.Label(edit_frame, text="Stat:", bg='#2E2E2E', fg='white').grid(row=1, column=0, sticky='e', padx=5, pady=2)
+        self.edit_stat_combo = ttk.Combobox(edit_frame, values=['hp', 'mp', 'str', 'dex', 'con', 'int', 'wis', 'cha'])
+        self.edit_stat_combo.grid(row=1, column=1, padx=5, pady=2)
+
+        tk.Label(edit_frame, text="New Value:", bg='#2E2E2E', fg='white').grid(row=2, column=0, sticky='e', padx=5, pady=2)
+        self.edit_value_entry = tk.Entry(edit_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.edit_value_entry.grid(row=2, column=1, padx=5, pady=2)
+
+        self.edit_button = tk.Button(edit_frame, text="Update Status", command=self.send_edit_command, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.edit_button.grid(row=3, column=0, columnspan=2, pady=10)
+
+        # Dice odds, computed exactly instead of by sampling
+        odds_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+        odds_frame.pack(pady=5)
+        tk.Label(odds_frame, text="Dice:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
+        self.odds_expr_entry = tk.Entry(odds_frame, width=12, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.odds_expr_entry.insert(0, '1d20')
+        self.odds_expr_entry.grid(row=0, column=1, padx=5, pady=2)
+        tk.Label(odds_frame, text="Target:", bg='#2E2E2E', fg='white').grid(row=0, column=2, sticky='e', padx=5, pady=2)
+        self.odds_target_entry = tk.Entry(odds_frame, width=5, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.odds_target_entry.insert(0, '15')
+        self.odds_target_entry.grid(row=0, column=3, padx=5, pady=2)
+        self.odds_button = tk.Button(odds_frame, text="Show Odds", command=self.show_odds, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.odds_button.grid(row=0, column=4, padx=5, pady=2)
+
+        # Initiative for enemies and NPCs, the DEX score breaks ties
+        initiative_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+        initiative_frame.pack(pady=5)
+        tk.Label(initiative_frame, text="Combatant:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
+        self.combatant_name_entry = tk.Entry(initiative_frame, width=15, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.combatant_name_entry.grid(row=0, column=1, padx=5, pady=2)
+        tk.Label(initiative_frame, text="DEX:", bg='#2E2E2E', fg='white').grid(row=0, column=2, sticky='e', padx=5, pady=2)
+        self.combatant_dex_entry = tk.Entry(initiative_frame, width=5, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.combatant_dex_entry.insert(0, '10')
+        self.combatant_dex_entry.grid(row=0, column=3, padx=5, pady=2)
+        self.combatant_button = tk.Button(initiative_frame, text="Roll Initiative", command=self.roll_combatant_initiative, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.combatant_button.grid(row=0, column=4, padx=5, pady=2)
+
+        # DM tools
+        self.next_turn_button = tk.Button(scrollable_frame, text="Next Turn", command=self.next_turn, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.next_turn_button.pack(pady=10)
+
+        self.dm_log = LogView(scrollable_frame, wrap=tk.WORD, height=8, width=60, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.dm_log.pack(pady=10)
+        self.pump.add_flusher(self.dm_log.flush)
+
+        # Player Stats Log
+        tk.Label(scrollable_frame, text="Player Stats Log:", bg='#2E2E2E', fg='white').pack(pady=(10, 5))
+        self.player_stats_log = PlayerStatsPanel(scrollable_frame)
+        self.player_stats_log.pack(pady=10)
+        self.pump.add_flusher(self.player_stats_log.flush)
+        for name, data in self.session.player_stats.items():
+            self.player_stats_log.upsert(name, data)
+
+        # Area damage, one roll applied to every selected target in a single batched edit
+        tk.Label(scrollable_frame, text="Area Damage", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
+        area_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+        area_frame.pack(pady=5)
+        self.area_targets = []
+        self.area_target_list = tk.Listbox(area_frame, selectmode=tk.MULTIPLE, height=6, width=30, exportselection=False)
+        self.area_target_list.grid(row=0, column=0, rowspan=3, padx=5, pady=2)
+        for name in self.session.player_stats:
+            self.add_area_target(name)
+        for kind, name in self.session.sync.published:
+            if kind == ENEMY_DATA:
+                self.add_area_target(name)
+        tk.Label(area_frame, text="Damage:", bg='#2E2E2E', fg='white').grid(row=0, column=1, sticky='e', padx=5, pady=2)
+        self.area_damage_entry = tk.Entry(area_frame, width=10, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.area_damage_entry.insert(0, '8d6')
+        self.area_damage_entry.grid(row=0, column=2, padx=5, pady=2)
+        self.area_half_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(area_frame, text="Half damage", variable=self.area_half_var, bg='#2E2E2E', fg='white', selectcolor='#4A4A4A').grid(row=1, column=1, columnspan=2, pady=2)
+        self.area_button = tk.Button(area_frame, text="Apply Damage", command=self.apply_area_damage, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.area_button.grid(row=2, column=1, columnspan=2, pady=2)
+
+        # Monster manual, searched as you type and spawned into the forms below
+        if self.open_catalog():
+            tk.Label(scrollable_frame, text="Catalog", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
+            catalog_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+            catalog_frame.pack(pady=5)
+            tk.Label(catalog_frame, text="Search:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
+            self.catalog_query_entry = tk.Entry(catalog_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+            self.catalog_query_entry.grid(row=0, column=1, padx=5, pady=2)
+            self.catalog_query_entry.bind('<KeyRelease>', lambda event: self.search_catalog())
+            self.catalog_kind_combo = ttk.Combobox(catalog_frame, values=[ENEMY, LOCATION], width=9, state='readonly')
+            self.catalog_kind_combo.set(ENEMY)
+            self.catalog_kind_combo.grid(row=0, column=2, padx=5, pady=2)
+            self.catalog_kind_combo.bind('<<ComboboxSelected>>', lambda event: self.search_catalog())
+            tk.Label(catalog_frame, text="Type:", bg='#2E2E2E', fg='white').grid(row=1, column=0, sticky='e', padx=5, pady=2)
+            self.catalog_type_combo = ttk.Combobox(catalog_frame, values=[''] + self.catalog.types)
+            self.catalog_type_combo.grid(row=1, column=1, padx=5, pady=2)
+            self.catalog_type_combo.bind('<<ComboboxSelected>>', lambda event: self.search_catalog())
+            filter_frame = tk.Frame(catalog_frame, bg='#2E2E2E')
+            filter_frame.grid(row=2, column=0, columnspan=3, pady=2)
+            self.catalog_filter_entries = {}
+            for column, label in enumerate(("Min level", "Max level", "Max AC")):
+                tk.Label(filter_frame, text=f"{label}:", bg='#2E2E2E', fg='white').grid(row=0, column=column * 2, sticky='e', padx=5)
+                entry = tk.Entry(filter_frame, width=4, bg='#4A4A4A', fg='white', insertbackground='white')
+                entry.grid(row=0, column=column * 2 + 1, padx=5)
+                entry.bind('<KeyRelease>', lambda event: self.search_catalog())
+                self.catalog_filter_entries[label] = entry
+            self.catalog_list = tk.Listbox(catalog_frame, height=8, width=50, exportselection=False)
+            self.catalog_list.grid(row=3, column=0, columnspan=3, padx=5, pady=2)
+            self.catalog_list.bind('<Double-Button-1>', lambda event: self.spawn_from_catalog())
+            self.catalog_spawn_button = tk.Button(catalog_frame, text="Spawn", command=self.spawn_from_catalog, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+            self.catalog_spawn_button.grid(row=4, column=0, columnspan=3, pady=10)
+
+        # Enemy Creation Section
+        tk.Label(scrollable_frame, text="Create Enemy:", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
+        enemy_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+        enemy_frame.pack(pady=5)
+
+        tk.Label(enemy_frame, text="Name:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
+        self.enemy_name_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.enemy_name_entry.grid(row=0, column=1, padx=5, pady=2)
+
+        tk.Label(enemy_frame, text="Type:", bg='#2E2E2E', fg='white').grid(row=1, column=0, sticky='e', padx=5, pady=2)
+        self.enemy_type_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.enemy_type_entry.grid(row=1, column=1, padx=5, pady=2)
+
+        tk.Label(enemy_frame, text="Level:", bg='#2E2E2E', fg='white').grid(row=2, column=0, sticky='e', padx=5, pady=2)
+        self.enemy_level_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.enemy_level_entry.grid(row=2, column=1, padx=5, pady=2)
+
+        tk.Label(enemy_frame, text="HP:", bg='#2E2E2E', fg='white').grid(row=3, column=0, sticky='e', padx=5, pady=2)
+        self.enemy_hp_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.enemy_hp_entry.grid(row=3, column=1, padx=5, pady=2)
+
+        tk.Label(enemy_frame, text="AC:", bg='#2E2E2E', fg='white').grid(row=4, column=0, sticky='e', padx=5, pady=2)
+        self.enemy_ac_entry = tk.Entry(enemy_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.enemy_ac_entry.grid(row=4, column=1, padx=5, pady=2)
+
+        tk.Label(enemy_frame, text="Description:", bg='#2E2E2E', fg='white').grid(row=5, column=0, sticky='ne', padx=5, pady=2)
+        self.enemy_desc_text = tk.Text(enemy_frame, height=3, width=30, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.enemy_desc_text.grid(row=5, column=1, padx=5, pady=2)
+
+        self.create_enemy_button = tk.Button(enemy_frame, text="Create Enemy", command=self.create_enemy, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.create_enemy_button.grid(row=6, column=0, columnspan=2, pady=10)
+
+        # Location Creation Section
+        tk.Label(scrollable_frame, text="Create Location:", bg='#2E2E2E', fg='white', font=('Arial', 12, 'bold')).pack(pady=(20, 10))
+        location_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+        location_frame.pack(pady=5)
+
+        tk.Label(location_frame, text="Name:", bg='#2E2E2E', fg='white').grid(row=0, column=0, sticky='e', padx=5, pady=2)
+        self.location_name_entry = tk.Entry(location_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.location_name_entry.grid(row=0, column=1, padx=5, pady=2)
+
+        tk.Label(location_frame, text="Type:", bg='#2E2E2E', fg='white').grid(row=1, column=0, sticky='e', padx=5, pady=2)
+        self.location_type_entry = tk.Entry(location_frame, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.location_type_entry.grid(row=1, column=1, padx=5, pady=2)
+
+        tk.Label(location_frame, text="Description:", bg='#2E2E2E', fg='white').grid(row=2, column=0, sticky='ne', padx=5, pady=2)
+        self.location_desc_text = tk.Text(location_frame, height=3, width=30, bg='#4A4A4A', fg='white', insertbackground='white')
+        self.location_desc_text.grid(row=2, column=1, padx=5, pady=2)
+
+        # Optional battle map, one text row per map row: . floor, # wall, + door, / open door, ~ water, , rubble
+        tk.Label(location_frame, text="Map:", bg='#2E2E2E', fg='white').grid(row=3, column=0, sticky='ne', padx=5, pady=2)
+        self.location_map_text = tk.Text(location_frame, height=6, width=30, bg='#4A4A4A', fg='white', insertbackground='white', font=('Courier', 9))
+        self.location_map_text.grid(row=3, column=1, padx=5, pady=2)
+
+        self.create_location_button = tk.Button(location_frame, text="Create Location", command=self.create_location, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.create_location_button.grid(row=4, column=0, columnspan=2, pady=10)
+
+        # Tokens on the map shown in the Map tab, owned tokens can be moved by the player of that name
+        token_frame = tk.Frame(scrollable_frame, bg='#2E2E2E')
+        token_frame.pack(pady=5)
+        self.token_entries = {}
+        for column, (label, width) in enumerate((("Token", 12), ("X", 4), ("Y", 4), ("Owner", 12))):
+            tk.Label(token_frame, text=f"{label}:", bg='#2E2E2E', fg='white').grid(row=0, column=column * 2, sticky='e', padx=2)
+            entry = tk.Entry(token_frame, width=width, bg='#4A4A4A', fg='white', insertbackground='white')
+            entry.grid(row=0, column=column * 2 + 1, padx=2)
+            self.token_entries[label] = entry
+        self.place_token_button = tk.Button(token_frame, text="Place Token", command=self.place_token, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.place_token_button.grid(row=1, column=0, columnspan=4, pady=5)
+        self.remove_token_button = tk.Button(token_frame, text="Remove Token", command=self.remove_token, bg='#4CAF50', fg='white', font=('Arial', 10, 'bold'))
+        self.remove_token_button.grid(row=1, column=4, columnspan=4, pady=5)
+
+    def send_narration(self):
+        narration = self.narration_entry.get()
+        if narration:
+            self.send(CHAT, {'text': f"DM: {narration}"})
+            self.narration_entry.delete(0, tk.END)
+            log_event(f"DM narration: {narration}")
+
+    def show_odds(self):
+        import dice
+        expression = self.odds_expr_entry.get()
+        target = self.odds_target_entry.get()
+        try:
+            average = dice.mean(expression)
+            line = f"{expression}: average {average:.2f}"
+            if target.lstrip('-').isdigit():
+                line += f", {dice.chance_at_least(expression, int(target)):.1%} chance of {target} or more"
+        except dice.DiceError as e:
+            line = str(e)
+        self.dm_log.append(line)
+
+    def roll_combatant_initiative(self):
+        import dice
+        name = self.combatant_name_entry.get().strip()
+        dex = self.combatant_dex_entry.get()
+        if name:
+            self.session.roll_initiative(name, dice.roll('1d20'), int(dex) if dex.isdigit() else 10)
+            self.combatant_name_entry.delete(0, tk.END)
+
+    def add_area_target(self, name):
+        if name not in self.area_targets:
+            self.area_targets.append(name)
+            self.area_target_list.insert(tk.END, name)
+
+    def apply_area_damage(self):
+        import dice
+        targets = [self.area_targets[index] for index in self.area_target_list.curselection()]
+        expression = self.area_damage_entry.get()
+        if not targets:
+            return
+        try:
+            damage = int(expression) if expression.isdigit() else dice.roll(expression)
+        except dice.DiceError as e:
+            self.dm_log.append(str(e))
+            return
+        if self.area_half_var.get():
+            damage //= 2
+        self.session.edit([{'name': name, 'stat': 'hp', 'op': '-=', 'value': damage} for name in targets])
+        self.dm_log.append(f"{expression}: {damage} damage to {', '.join(targets)}")
+        self.area_target_list.selection_clear(0, tk.END)
+        log_event("Area damage", damage=damage, targets=targets)
+
+    def next_turn(self):
+        name = self.session.next_turn()
+        if name is None:
+            self.dm_log.append("Nobody has rolled initiative.")
+            return
+        self.dm_log.append(f"Round {self.session.initiative.round}: {name}'s turn.")
+        log_event("Next turn initiated", combatant=name, round=self.session.initiative.round)
+
+    def connect(self):
+        # Received messages are handed to the session on the Tk thread by the pump
+        self.session.connect(self.pump.push)
+
+    def send_message(self):
+        message = self.message_entry.get()
+        if message.startswith("/edit ") and self.session.is_dm:
+            # Batched edits like "/edit Aria, Borin: hp -= 14" go to the server as one message
+            try:
+                self.session.edit_command(message)
+            except ProtocolError as e:
+                self.append_chat(str(e))
+                return
+            self.message_entry.delete(0, tk.END)
+            log_event(f"Sent DM edit command: {message}")
+        elif message.startswith("/w "):
+            # Only the target gets a whisper, the server never sends it to anyone else
+            try:
+                target, text = parse_whisper(message)
+            except ProtocolError as e:
+                self.append_chat(str(e))
+                return
+            self.session.whisper(target, text)
+            self.append_chat(f"You whisper to {target}: {text}", 'whisper')
+            self.message_entry.delete(0, tk.END)
+        elif message:
+            # Display the message in our own chat log
+            self.append_chat(f"You: {message}")
+
+            # Send to server
+            self.send(CHAT, {'text': message})
+            self.message_entry.delete(0, tk.END)
+            log_event(f"Message sent: {message}")
+
+    def send_edit_command(self):
+        player_name = self.edit_player_entry.get()
+        stat = self.edit_stat_combo.get().lower()
+        value = self.edit_value_entry.get()
+        if player_name and stat and value.isdigit():
+            command = {'name': player_name, 'stat': stat, 'value': int(value)}
+            self.send(EDIT, command)
+            self.edit_player_entry.delete(0, tk.END)
+            self.edit_stat_combo.set('')
+            self.edit_value_entry.delete(0, tk.END)
+            log_event(f"Sent DM edit command: {to_legacy(EDIT, command)}")
+
+    def send(self, msg_type, payload):
+        if not self.session.send(msg_type, payload):
+            self.append_chat("Not connected for too long, that wasn't sent")
+
+    def append_chat(self, text, tag=None):
+        self.chat_area.append(text, tag)
+
+    def search_chat(self):
+        text = self.search_entry.get()
+        if not text:
+            return
+        results = self.chat_area.search(text)
+        results_win = tk.Toplevel(self.root)
+        results_win.title(f"Search: {text}")
+        listbox = tk.Listbox(results_win, width=80, height=20)
+        listbox.pack(expand=True, fill='both')
+        for line_no, line in results:
+            listbox.insert(tk.END, f"{line_no + 1}: {line}")
+        if not results:
+            listbox.insert(tk.END, "No matches.")
+
+    def handle_chat(self, payload):
+        self.append_chat(payload['text'])
+
+    def handle_whisper(self, payload):
+        self.append_chat(f"{payload['sender']} whispers: {payload['text']}", 'whisper')
+
+    def handle_stat_update(self, payload):
+        self.append_chat(to_legacy(STAT_UPDATE, payload))
+        self.show_stat(payload['name'], payload['stat'], payload['value'])
+
+    def handle_stat_batch(self, payload):
+        # One chat line for the whole batch, however many targets it hit
+        updates = payload['updates']
+        self.append_chat("DM updated " + ", ".join(f"{u['name']}'s {u['stat']} to {u['value']}" for u in updates))
+        for update in updates:
+            self.show_stat(update['name'], update['stat'], update['value'])
+
+    def show_stat(self, player_name, stat, value):
+        # The session has already updated the models, refresh what's on screen
+        character = self.session.character
+        if character and character.name == player_name:
+            entry = {'hp': self.hp_entry, 'mp': self.mp_entry}.get(stat) or self.stat_entries.get(stat.upper())
+            if entry:
+                entry.delete(0, tk.END)
+                entry.insert(0, value)
+        if self.player_stats_log and player_name in self.session.player_stats:
+            # Only the changed cell is redrawn on the next frame
+            self.player_stats_log.update_stat(player_name, stat, value)
+
+    def handle_player_data(self, payload):
+        self.append_chat(to_legacy(PLAYER_DATA, payload))
+        if self.player_stats_log:
+            self.player_stats_log.upsert(payload['name'], self.session.player_stats[payload['name']])
+            self.add_area_target(payload['name'])
+
+    def handle_enemy_data(self, payload):
+        # Handle enemy data for players
+        enemy_info = f"DM created enemy: {payload['name']} ({payload['enemy_type']}) - Level {payload['level']}, HP {payload['hp']}, AC {payload['ac']}\nDescription: {payload['description']}"
+        self.append_chat(enemy_info, 'enemy')
+
+    def handle_location_data(self, payload):
+        # Handle location data for players
+        location_info = f"DM created location: {payload['name']} ({payload['location_type']})\nDescription: {payload['description']}"
+        self.append_chat(location_info, 'location')
+
+    def handle_patch(self, patch):
+        kind, name, fields = patch['kind'], patch['name'], patch['fields']
+        changes = [f"{key} {value}" for key, value in fields.items() if key != 'stats']
+        changes += [f"{stat} {score}" for stat, score in fields.get('stats', {}).items()]
+        self.append_chat(f"{name} updated: {', '.join(changes)}")
+        if kind == PLAYER_DATA and self.player_stats_log:
+            if name not in self.player_stats_log:
+                self.player_stats_log.upsert(name, self.session.player_stats[name])
+                return
+            for key, value in fields.items():
+                if key == 'stats':
+                    for stat, score in value.items():
+                        self.player_stats_log.update_stat(name, stat, score)
+                elif key == 'class_type':
+                    self.player_stats_log.update_stat(name, 'class', value)
+                elif key in self.session.player_stats[name]:
+                    self.player_stats_log.update_stat(name, key, value)
+
+    def select_role(self):
+        # Create a selection window
+        select_win = tk.Toplevel(self.root)
+        select_win.title("Select Role")
+        select_win.geometry("300x250")
+
+        tk.Label(select_win, text="Server IP:").pack(pady=5)
+        server_ip_var = tk.StringVar(value="localhost")
+        server_ip_entry = tk.Entry(select_win, textvariable=server_ip_var)
+        server_ip_entry.pack()
+
+        tk.Label(select_win, text="Are you a Player or DM?").pack(pady=10)
+
+        role_var = tk.StringVar(value="Player")
+        tk.Radiobutton(select_win, text="Player", variable=role_var, value="Player").pack()
+        tk.Radiobutton(select_win, text="DM", variable=role_var, value="DM").pack()
+
+        tk.Label(select_win, text="Player Number (1-4):").pack(pady=5)
+        player_num_var = tk.StringVar(value="1")
+        player_num_entry = tk.Entry(select_win, textvariable=player_num_var)
+        player_num_entry.pack()
+
+        def confirm():
+            self.session.host = server_ip_var.get()
+            select_win.destroy()
+
+        tk.Button(select_win, text="Confirm", command=confirm).pack(pady=10)
+
+        self.root.wait_window(select_win)
+        return role_var.get() == "DM", int(player_num_var.get()) if player_num_var.get().isdigit() else 1
+
+    def create_enemy(self):
+        name = self.enemy_name_entry.get()
+        enemy_type = self.enemy_type_entry.get()
+        level = int(self.enemy_level_entry.get()) if self.enemy_level_entry.get() else 1
+        hp = int(self.enemy_hp_entry.get()) if self.enemy_hp_entry.get() else 10
+        ac = int(self.enemy_ac_entry.get()) if self.enemy_ac_entry.get() else 10
+        description = self.enemy_desc_text.get("1.0", tk.END).strip()
+
+        enemy = Enemy(name, enemy_type, level, hp, ac, description)
+        self.session.publish(enemy)
+        self.session.store.upsert(enemy)
+        self.add_area_target(name)
+
+        # Clear the form
+        self.enemy_name_entry.delete(0, tk.END)
+        self.enemy_type_entry.delete(0, tk.END)
+        self.enemy_level_entry.delete(0, tk.END)
+        self.enemy_hp_entry.delete(0, tk.END)
+        self.enemy_ac_entry.delete(0, tk.END)
+        self.enemy_desc_text.delete("1.0", tk.END)
+
+        log_event(f"Enemy created: {name}, {enemy_type}, Level {level}")
+
+    def create_location(self):
+        from battle_map import BattleMap, MapError
+        name = self.location_name_entry.get()
+        location_type = self.location_type_entry.get()
+        description = self.location_desc_text.get("1.0", tk.END).strip()
+
+        map_rows = self.location_map_text.get("1.0", tk.END).splitlines()
+        battle_map = None
+        if any(row.strip() for row in map_rows):
+            try:
+                battle_map = BattleMap.from_rows(name, map_rows)
+            except (MapError, UnicodeEncodeError) as e:
+                self.append_chat(f"Map not created: {e}")
+                return
+
+        location = Location(name, location_type, description, battle_map=battle_map)
+        self.session.publish(location)
+        self.session.store.upsert(location)
+        if battle_map:
+            self.session.publish_map(battle_map)
+
+        # Clear the form
+        self.location_name_entry.delete(0, tk.END)
+        self.location_type_entry.delete(0, tk.END)
+        self.location_desc_text.delete("1.0", tk.END)
+        self.location_map_text.delete("1.0", tk.END)
+
+        log_event(f"Location created: {name}, {location_type}")
+
+    def handle_map_data(self, payload):
+        # The latest map shared is the one on screen
+        if self.map_view is None:
+            from map_view import MapView
+            self.map_view = MapView(self.map_frame, on_move=self.move_token, on_toggle=self.toggle_door if self.session.is_dm else None)
+            self.map_view.pack(expand=True, fill='both', padx=5, pady=5)
+        self.map_location = payload['location']
+        self.map_view.show(self.session.maps[self.map_location], self.session.viewer())
+        self.append_chat(f"Map of {payload['location']} is up ({payload['width']}x{payload['height']})", 'location')
+
+    def handle_token(self, payload):
+        if self.map_view and payload['location'] == self.map_location:
+            self.map_view.update(payload['revealed'] + payload['hidden'], [payload['name']])
+
+    def handle_tile(self, payload):
+        if self.map_view and payload['location'] == self.map_location:
+            self.map_view.draw_terrain_row(payload['y'])
+            self.map_view.update(payload['revealed'] + payload['hidden'])
+
+    def move_token(self, name, x, y):
+        self.session.move_token(self.map_location, name, x, y)
+
+    def toggle_door(self, x, y):
+        from battle_map import DOOR, OPEN_DOOR
+        tile = self.session.maps[self.map_location].tile(x, y)
+        if tile in (DOOR, OPEN_DOOR):
+            self.session.set_tile(self.map_location, x, y, OPEN_DOOR if tile == DOOR else DOOR)
+
+    def place_token(self):
+        name = self.token_entries["Token"].get().strip()
+        x, y = self.token_entries["X"].get().strip(), self.token_entries["Y"].get().strip()
+        if not self.map_location or not name or not x.isdigit() or not y.isdigit():
+            return
+        if not self.session.place_token(self.map_location, name, int(x), int(y), self.token_entries["Owner"].get().strip()):
+            self.append_chat(f"{name} can't go at ({x}, {y})")
+
+    def remove_token(self):
+        name = self.token_entries["Token"].get().strip()
+        if self.map_location and name:
+            self.session.remove_token(self.map_location, name)
+
+    def search_catalog(self):
+        from catalog import ENEMY
+        kind = self.catalog_kind_combo.get()
+        filters = {}
+        for label, entry in self.catalog_filter_entries.items():
+            # Locations have no level or AC
+            value = entry.get().strip()
+            filters[label] = int(value) if value.isdigit() and kind == ENEMY else None
+        self.catalog_results = self.catalog.search(self.catalog_query_entry.get(), kind, self.catalog_type_combo.get() or None,
+                                                   filters["Min level"], filters["Max level"], None, filters["Max AC"])
+        self.catalog_list.delete(0, tk.END)
+        for _, name, entry_type, level, ac in self.catalog_results:
+            self.catalog_list.insert(tk.END, f"{name} ({entry_type}) level {level}, AC {ac}" if kind == ENEMY else f"{name} ({entry_type})")
+
+    def spawn_from_catalog(self):
+        from catalog import ENEMY
+        # Only the chosen entry is unpacked, it fills the creation form so the DM can tweak it before creating
+        selection = self.catalog_list.curselection()
+        if not selection:
+            return
+        kind = self.catalog_kind_combo.get()
+        entry = self.catalog.get(kind, self.catalog_results[selection[0]][0])
+        if kind == ENEMY:
+            fields = ((self.enemy_name_entry, entry.name), (self.enemy_type_entry, entry.enemy_type), (self.enemy_level_entry, entry.level),
+                      (self.enemy_hp_entry, entry.hp), (self.enemy_ac_entry, entry.ac))
+            description = self.enemy_desc_text
+        else:
+            fields = ((self.location_name_entry, entry.name), (self.location_type_entry, entry.location_type))
+            description = self.location_desc_text
+        for widget, value in fields:
+            widget.delete(0, tk.END)
+            widget.insert(0, str(value))
+        description.delete("1.0", tk.END)
+        description.insert("1.0", entry.description)
+
+
+
+    def run(self):
+        setup_from_environment()
+        self.connect()
+        self.pump.start()
+        self.root.mainloop()
+
+if __name__ == "__main__":
+    client = DNDClient()
+    client.run()
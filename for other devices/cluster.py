@@ -0,0 +1,335 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from utils import setup_logging, log_event
+from framing import FrameDecoder, FrameError
+from protocol import MessageCodec, ProtocolError, RESUME, SUBSCRIBE
+from server import CampaignServer
+
+# Cluster mode: a front process owns the public port and passes each new connection's socket to the worker process
+# owning its room. Rooms are pinned to workers by a hash of their name, so a table's state, history and journal only
+# ever live in one process and the workers never share anything. A /join naming another worker's room moves the
+# socket again. Processes talk over Unix datagram sockets in a private directory, a datagram can carry file
+# descriptors and that is how a connected socket changes hands.
+BUS_HEADER = struct.Struct('>I')
+# Bodies are sent in pieces of this size, well under the kernel's datagram limit
+PIECE_SIZE = 32 * 1024
+MAX_DATAGRAM = 256 * 1024
+MAX_FDS = 4
+# Legacy clients may never speak first, they go to the default room once this runs out
+FIRST_FRAME_TIMEOUT = 0.5
+HANDOFF_TIMEOUT = 5.0
+HANDOFF_POLL = 0.01
+# A worker that hasn't stopped this long after SIGTERM is killed
+STOP_TIMEOUT = 5.0
+
+def shard(room_name, count):
+    # Must agree across processes, so not hash()
+    return zlib.crc32(room_name.encode('utf-8')) % count
+
+def front_address(directory):
+    return os.path.join(directory, 'front.sock')
+
+def worker_address(directory, index):
+    return os.path.join(directory, f"worker-{index}.sock")
+
+async def detach(reader, writer):
+    # Stops reading a connection and returns what the stream had already buffered, the socket can then be
+    # passed on without a byte going missing. With reading paused and the stream ended here, read() hands over
+    # exactly what is buffered without waiting. It may resume the transport if the stream had paused it for being
+    # full, nothing runs before the second pause. Closing the transport afterwards only drops this process's copy.
+    writer.transport.pause_reading()
+    reader.feed_eof()
+    data = await reader.read()
+    writer.transport.pause_reading()
+    return data
+
+class Bus:
+    # One bound datagram socket to receive on and a connected one per peer to send on. The peer's queue is only
+    # a few datagrams long, so sends never block: what doesn't fit waits in a backlog until the peer reads,
+    # otherwise two processes sending to each other could wait on each other forever.
+    def __init__(self, address):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.sock.setblocking(False)
+        # Address -> (socket, backlog of (buffers, fds))
+        self.peers = {}
+        self.counter = 0
+        # Message id -> (header, fds, pieces) until every piece is in
+        self.pending = {}
+        self.handler = None
+
+    def start(self, handler):
+        # handler(header, body, fds) is called on the event loop for each whole message
+        self.handler = handler
+        asyncio.get_running_loop().add_reader(self.sock.fileno(), self.receive)
+
+    def send(self, address, header, body=b'', fds=()):
+        peer = self.peers.get(address)
+        if peer is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.connect(address)
+            sock.setblocking(False)
+            peer = self.peers[address] = (sock, deque())
+        self.counter += 1
+        message_id = f"{os.getpid()}-{self.counter}"
+        pieces = [body[start:start + PIECE_SIZE] for start in range(0, len(body), PIECE_SIZE)] or [b'']
+        first = json.dumps(dict(header, id=message_id, parts=len(pieces))).encode('utf-8')
+        # Copies, so the caller can close its descriptors while the message still waits in the backlog
+        peer[1].append(([BUS_HEADER.pack(len(first)), first, pieces[0]], [os.dup(fd) for fd in fds]))
+        tag = json.dumps({'id': message_id}).encode('utf-8')
+        for piece in pieces[1:]:
+            peer[1].append(([BUS_HEADER.pack(len(tag)), tag, piece], []))
+        self.flush(address)
+
+    def flush(self, address):
+        sock, backlog = self.peers[address]
+        loop = asyncio.get_running_loop()
+        while backlog:
+            buffers, fds = backlog[0]
+            try:
+                sock.sendmsg(buffers, [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array('i', fds))] if fds else [])
+            except BlockingIOError:
+                loop.add_writer(sock.fileno(), self.flush, address)
+                return
+            backlog.popleft()
+            for fd in fds:
+                os.close(fd)
+        loop.remove_writer(sock.fileno())
+
+    def receive(self):
+        while True:
+            try:
+                data, fds, _, _ = socket.recv_fds(self.sock, MAX_DATAGRAM, MAX_FDS)
+            except BlockingIOError:
+                return
+            (size,) = BUS_HEADER.unpack_from(data)
+            header = json.loads(data[BUS_HEADER.size:BUS_HEADER.size + size])
+            body = data[BUS_HEADER.size + size:]
+            if 'parts' in header:
+                message = self.pending[header['id']] = (header, fds, [body])
+            else:
+                message = self.pending.get(header['id'])
+                if message is None:
+                    continue
+                message[2].append(body)
+            header, fds, pieces = message
+            if len(pieces) == header['parts']:
+                del self.pending[header['id']]
+                self.handler(header, b''.join(pieces), fds)
+
+    def close(self):
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        for sock, backlog in self.peers.values():
+            loop.remove_writer(sock.fileno())
+            sock.close()
+            for _, fds in backlog:
+                for fd in fds:
+                    os.close(fd)
+
+class ShardWorker(CampaignServer):
+    def __init__(self, index, count, directory, **options):
+        super().__init__(**options)
+        self.index = index
+        self.count = count
+        self.directory = directory
+        self.bus = None
+
+    def owns(self, room_name):
+        return shard(room_name, self.count) == self.index
+
+    def report(self, client):
+        # The front routes a RESUME by its token, so it hears which room each session is in now
+        if client.token and client.room:
+            self.bus.send(front_address(self.directory), {'kind': 'session', 'token': client.token, 'room': client.room.name})
+
+    def join(self, client, room_name):
+        super().join(client, room_name)
+        self.report(client)
+
+    def start_session(self, client, resume=None):
+        super().start_session(client, resume)
+        self.report(client)
+
+    def announce(self, text):
+        super().announce(text)
+        for index in range(self.count):
+            if index != self.index:
+                self.bus.send(worker_address(self.directory, index), {'kind': 'announce', 'text': text})
+
+    async def hand_off(self, client, reader, room_name, data):
+        # Everything already queued for the client goes out first, then its socket, its session and the bytes read
+        # past the /join go to the worker owning the room, which carries on as if the /join had happened there
+        self.leave(client)
+        data += await detach(reader, client.writer)
+        transport = client.writer.transport
+        deadline = asyncio.get_running_loop().time() + HANDOFF_TIMEOUT
+        while len(client.queue) or transport.get_write_buffer_size():
+            if transport.is_closing() or asyncio.get_running_loop().time() > deadline:
+                return
+            await asyncio.sleep(HANDOFF_POLL)
+        header = {'kind': 'client', 'room': room_name, 'token': client.token, 'structured': client.structured,
+                  'topics': None if client.requested is None else sorted(client.requested)}
+        try:
+            self.bus.send(worker_address(self.directory, shard(room_name, self.count)), header, data,
+                          [client.writer.get_extra_info('socket').fileno()])
+        except OSError as e:
+            log_event(f"Couldn't hand a client over to room {room_name}: {e}")
+
+    def on_bus(self, header, body, fds):
+        kind = header['kind']
+        if kind in ('connect', 'client') and fds:
+            for fd in fds[1:]:
+                os.close(fd)
+            asyncio.create_task(self.adopt(socket.socket(fileno=fds[0]), header, body))
+        elif kind == 'announce':
+            super().announce(header['text'])
+
+    async def adopt(self, sock, header, body):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        client = self.accept(writer)
+        if header['kind'] == 'client':
+            client.token = header['token']
+            client.structured = header['structured']
+            client.requested = None if header['topics'] is None else frozenset(header['topics'])
+            # Arriving through a /join, the old worker has sent everything it had queued
+            self.switch_room(client, header['room'])
+        else:
+            self.join(client, header['room'])
+        await self.serve_client(client, reader, body)
+
+    async def serve_forever(self):
+        self.bus = Bus(worker_address(self.directory, self.index))
+        self.bus.start(self.on_bus)
+        self.bus.send(front_address(self.directory), {'kind': 'ready', 'worker': self.index})
+        if self.journal_dir:
+            self.flush_task = asyncio.create_task(self.flush_journals())
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            self.close_journals()
+            self.bus.close()
+
+class ClusterFront:
+    # Accepts every connection on the public address, looks at the first frame and passes the socket on.
+    # It never touches a connection again after that, so its own work is one read per client.
+    def __init__(self, directory, count, host='0.0.0.0', port=12345, max_sessions=10000):
+        self.directory = directory
+        self.count = count
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.codec = MessageCodec()
+        # Session token -> room, as reported by the workers
+        self.sessions = OrderedDict()
+        self.bus = Bus(front_address(directory))
+        self.ready = set()
+        self.all_ready = None
+
+    def on_bus(self, header, body, fds):
+        if header['kind'] == 'session':
+            self.sessions[header['token']] = header['room']
+            self.sessions.move_to_end(header['token'])
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        elif header['kind'] == 'ready':
+            self.ready.add(header['worker'])
+            if len(self.ready) == self.count:
+                self.all_ready.set()
+
+    async def route(self, reader, writer):
+        # Reads up to the first frame that isn't a SUBSCRIBE, a client's HELLO or RESUME comes right after it
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + FIRST_FRAME_TIMEOUT
+        decoder = FrameDecoder()
+        data = b''
+        first = None
+        try:
+            while first is None:
+                chunk = await asyncio.wait_for(reader.read(65536), max(deadline - loop.time(), 0))
+                if not chunk:
+                    writer.close()
+                    return
+                data += chunk
+                for frame in decoder.feed(chunk):
+                    try:
+                        first = self.codec.decode(frame)
+                    except ProtocolError:
+                        first = (None, None)
+                    if first[0] != SUBSCRIBE:
+                        break
+                    first = None
+        except asyncio.TimeoutError:
+            pass
+        except (ConnectionError, FrameError):
+            writer.close()
+            return
+        room_name = 'default'
+        if first and first[0] == RESUME:
+            room_name = self.sessions.get(first[1]['token'], 'default')
+        data += await detach(reader, writer)
+        try:
+            self.bus.send(worker_address(self.directory, shard(room_name, self.count)), {'kind': 'connect', 'room': room_name}, data,
+                          [writer.get_extra_info('socket').fileno()])
+        except OSError as e:
+            log_event(f"Couldn't pass a connection to a worker: {e}")
+        writer.close()
+
+    async def serve_forever(self):
+        self.all_ready = asyncio.Event()
+        self.bus.start(self.on_bus)
+        await self.all_ready.wait()
+        server = await asyncio.start_server(self.route, self.host, self.port)
+        log_event(f"Campaign cluster of {self.count} workers listening on {self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.bus.close()
+
+def stop(signum, frame):
+    # terminate() should still close journals and, in the front, take the workers down with it
+    raise SystemExit(0)
+
+def run_worker(index, count, directory, options):
+    signal.signal(signal.SIGTERM, stop)
+    setup_logging()
+    try:
+        asyncio.run(ShardWorker(index, count, directory, **options).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+def serve_cluster(host, port, workers, **options):
+    # options are passed on to every worker's CampaignServer
+    directory = tempfile.mkdtemp(prefix='dnd-cluster-')
+    processes = [multiprocessing.Process(target=run_worker, args=(index, workers, directory, options), name=f"worker-{index}", daemon=True)
+                 for index in range(workers)]
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        front = ClusterFront(directory, workers, host, port, options.get('max_sessions', 10000))
+        for process in processes:
+            process.start()
+        asyncio.run(front.serve_forever())
+    finally:
+        # Only the workers that got started, so a failed start() or front setup shows its own error
+        started = [process for process in processes if process.pid is not None]
+        for process in started:
+            process.terminate()
+        for process in started:
+            # SIGTERM can be lost if it lands while a fresh worker is still forking
+            process.join(STOP_TIMEOUT)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,163 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from models import Character, Enemy, Encounter
+from dice import DiceRoller
+from utils import load_from_file
+
+MAX_ROUNDS = 100
+WIN = 'win'
+LOSS = 'loss'
+TIMEOUT = 'timeout'
+
+def modifier(score):
+    return (score - 10) // 2
+
+class Combatant:
+    __slots__ = ('entity', 'is_party', 'hp', 'ac', 'attack_bonus', 'damage_sides', 'damage_bonus', 'dex', 'initiative')
+
+    def __init__(self, entity, is_party):
+        self.entity = entity
+        self.is_party = is_party
+        self.hp = entity.hp
+        self.ac = entity.ac
+        stats = entity.stats
+        ability = max(modifier(stats['STR']), modifier(stats['DEX']))
+        self.attack_bonus = ability + 2 + (entity.level - 1) // 4
+        self.damage_sides = 8 if is_party else 6
+        self.damage_bonus = ability + (0 if is_party else entity.level // 2)
+        self.dex = stats['DEX']
+        self.initiative = 0
+
+    @property
+    def name(self):
+        return self.entity.name
+
+class CombatEngine:
+    def __init__(self, encounter, roller=None):
+        self.encounter = encounter
+        self.roller = roller or DiceRoller()
+        self.combatants = []
+        self.turn = 0
+        self.round = 0
+
+    def start(self):
+        rand = self.roller.random
+        self.combatants = [Combatant(c, True) for c in self.encounter.characters]
+        self.combatants += [Combatant(e, False) for e in self.encounter.enemies]
+        for combatant in self.combatants:
+            combatant.initiative = rand.randint(1, 20) + modifier(combatant.dex)
+        # Highest roll goes first, DEX breaks ties
+        self.combatants.sort(key=lambda c: (c.initiative, c.dex), reverse=True)
+        self.encounter.initiative = [(c.name, c.initiative) for c in self.combatants]
+        self.turn = 0
+        self.round = 1
+
+    def side_alive(self, is_party):
+        return any(c.hp > 0 and c.is_party == is_party for c in self.combatants)
+
+    def is_over(self):
+        return not self.side_alive(True) or not self.side_alive(False)
+
+    def attack(self, attacker, target):
+        rand = self.roller.random
+        roll = rand.randint(1, 20)
+        if roll == 1 or (roll != 20 and roll + attacker.attack_bonus < target.ac):
+            return 0
+        dice_count = 2 if roll == 20 else 1
+        damage = sum(rand.randint(1, attacker.damage_sides) for _ in range(dice_count)) + attacker.damage_bonus
+        damage = max(1, damage)
+        target.hp -= damage
+        return damage
+
+    def next_turn(self):
+        attacker = self.combatants[self.turn]
+        result = None
+        if attacker.hp > 0:
+            targets = [c for c in self.combatants if c.hp > 0 and c.is_party != attacker.is_party]
+            if targets:
+                # Focus fire on the weakest opponent still standing
+                target = min(targets, key=lambda c: c.hp)
+                result = (attacker, target, self.attack(attacker, target))
+        self.turn += 1
+        if self.turn == len(self.combatants):
+            self.turn = 0
+            self.round += 1
+        return result
+
+    def run(self, max_rounds=MAX_ROUNDS):
+        # Returns the outcome and the round the deciding blow fell in, next_turn has moved on by then
+        self.start()
+        finished = 0
+        while not self.is_over():
+            if self.round > max_rounds:
+                return TIMEOUT, max_rounds
+            finished = self.round
+            self.next_turn()
+        return (WIN if self.side_alive(True) else LOSS), finished
+
+def _run_trials(party, enemies, trials, seed):
+    encounter = Encounter("Simulation")
+    for data in party:
+        encounter.add_character(Character.from_dict(data))
+    for data in enemies:
+        encounter.add_enemy(Enemy.from_dict(data))
+    engine = CombatEngine(encounter, DiceRoller(seed))
+    wins = 0
+    timeouts = 0
+    # Rounds to finish of the fights that were decided, a timeout isn't a result
+    rounds = {}
+    for _ in range(trials):
+        outcome, finished = engine.run()
+        if outcome == TIMEOUT:
+            timeouts += 1
+            continue
+        wins += outcome == WIN
+        rounds[finished] = rounds.get(finished, 0) + 1
+    return wins, timeouts, rounds
+
+def simulate(party, enemies, trials=100000, workers=None, seed=None):
+    # Each worker gets one contiguous chunk and sends back only counts
+    workers = workers or os.cpu_count() or 1
+    party = [c.to_dict() for c in party]
+    enemies = [e.to_dict() for e in enemies]
+    chunks = [trials // workers + (1 if i < trials % workers else 0) for i in range(workers)]
+    seeds = [None if seed is None else seed * 1000003 + i for i in range(workers)]
+    if workers == 1:
+        results = [_run_trials(party, enemies, trials, seeds[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_trials, [party] * workers, [enemies] * workers, chunks, seeds))
+    wins = 0
+    timeouts = 0
+    rounds = {}
+    for chunk_wins, chunk_timeouts, chunk_rounds in results:
+        wins += chunk_wins
+        timeouts += chunk_timeouts
+        for count, hits in chunk_rounds.items():
+            rounds[count] = rounds.get(count, 0) + hits
+    decided = trials - timeouts
+    return {'trials': trials, 'win_rate': wins / trials if trials else 0.0,
+            'loss_rate': (decided - wins) / trials if trials else 0.0, 'timeouts': timeouts,
+            'rounds': dict(sorted(rounds.items())), 'mean_rounds': sum(r * n for r, n in rounds.items()) / decided if decided else 0.0}
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo encounter balancing")
+    parser.add_argument('party', help="JSON file with a list of characters")
+    parser.add_argument('enemies', help="JSON file with a list of enemies")
+    parser.add_argument('--trials', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    party = [Character.from_dict(data) for data in load_from_file(args.party)]
+    enemies = [Enemy.from_dict(data) for data in load_from_file(args.enemies)]
+    report = simulate(party, enemies, args.trials, args.workers, args.seed)
+    print(f"Party win rate: {report['win_rate']:.1%}, loss rate: {report['loss_rate']:.1%} over {report['trials']} fights, "
+          f"{report['mean_rounds']:.1f} rounds on average")
+    for rounds, count in report['rounds'].items():
+        print(f"  {rounds:>3} rounds: {count}")
+    if report['timeouts']:
+        print(f"  undecided after {MAX_ROUNDS} rounds: {report['timeouts']}")
+
+if __name__ == "__main__":
+    main()
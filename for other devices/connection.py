@@ -0,0 +1,170 @@
+import socket
+import threading
+import random
+import time
+from framing import send_frame, message_frames, FrameDecoder, FrameError, SendQueue
+from protocol import ProtocolError, HELLO, SESSION, RESUME, SUBSCRIBE, PROTOCOL_VERSION, BULK_TYPES
+from utils import log_event
+from metrics import METRICS, SIZE_BUCKETS
+
+# Urgent frames can overtake queued bulk ones, so sequence numbers arrive out of order by at most
+# the server's per-client queue length. Duplicates are tracked over that window.
+REORDER_WINDOW = 256
+
+class Connection:
+    def __init__(self, host, port, codec, on_messages, on_resync=None, initial_backoff=0.5, max_backoff=30.0, max_pending=1000):
+        self.host = host
+        self.port = port
+        self.codec = codec
+        self.on_messages = on_messages
+        self.on_resync = on_resync
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        self.sock = None
+        self.token = None
+        # Topics to declare on every connect, None to get everything
+        self.topics = None
+        # Highest sequence number received, and which recent ones we've seen
+        self.last_seq = 0
+        self.seen = set()
+        self.connected = threading.Event()
+        self.stopped = False
+        # Outgoing frames, kept while offline and sent once the session is back
+        self.queue = SendQueue(max_pending)
+        self.queue_changed = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        threading.Thread(target=self.write_loop, daemon=True).start()
+
+    def close(self):
+        self.stopped = True
+        with self.queue_changed:
+            self.queue_changed.notify()
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def send(self, msg_type, payload):
+        # Never blocks the caller, the writer thread does the socket I/O
+        with METRICS.span('encode_seconds', type=msg_type):
+            urgent = msg_type not in BULK_TYPES
+            frames = message_frames(self.codec.encode(msg_type, payload), urgent)
+        METRICS.count('messages_sent', type=msg_type)
+        with self.queue_changed:
+            if self.queue.push(frames, urgent):
+                self.queue_changed.notify()
+                return True
+        # Offline for so long the queue filled up, the caller decides whether to tell the user
+        METRICS.count('messages_dropped', type=msg_type)
+        log_event(f"Send queue full, dropped a message of type {msg_type}")
+        return False
+
+    def write_loop(self):
+        while True:
+            with self.queue_changed:
+                data = None
+                while not self.stopped:
+                    if self.connected.is_set():
+                        data = self.queue.peek()
+                        generation = self.queue.generation
+                        if data is not None:
+                            break
+                    self.queue_changed.wait()
+                if self.stopped:
+                    return
+                sock = self.sock
+            try:
+                with METRICS.span('send_seconds'):
+                    sock.sendall(data)
+                METRICS.observe('write_bytes', len(data), SIZE_BUCKETS)
+            except OSError:
+                # Left queued, run() reconnects and the frame goes out again on the new socket
+                with self.queue_changed:
+                    if self.sock is sock:
+                        self.connected.clear()
+                continue
+            with self.queue_changed:
+                # A reconnect since the peek has rewound the queue, the new socket sends this again
+                self.queue.commit(generation)
+
+    def handshake(self, sock):
+        # The subscription goes first so the catch-up after HELLO or RESUME is already filtered
+        if self.topics is not None:
+            send_frame(sock, self.codec.encode(SUBSCRIBE, {'topics': self.topics}))
+        if self.token:
+            # Ask from the bottom of the reorder window, duplicates are dropped on arrival
+            last_seq = max(0, self.last_seq - REORDER_WINDOW)
+            send_frame(sock, self.codec.encode(RESUME, {'token': self.token, 'last_seq': last_seq}))
+        else:
+            send_frame(sock, self.codec.encode(HELLO, {'version': PROTOCOL_VERSION}))
+
+    def run(self):
+        attempt = 0
+        while not self.stopped:
+            sock = None
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=10)
+                sock.settimeout(None)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.handshake(sock)
+                with self.queue_changed:
+                    self.sock = sock
+                    self.queue.rewind()
+                    self.connected.set()
+                    self.queue_changed.notify()
+                attempt = 0
+                self.receive(sock)
+            except (OSError, FrameError) as e:
+                log_event(f"Connection to {self.host}:{self.port} lost: {e}")
+            finally:
+                self.connected.clear()
+                if sock:
+                    sock.close()
+            if self.stopped:
+                break
+            # Exponential backoff with jitter so a whole table doesn't reconnect in lockstep
+            delay = min(self.max_backoff, self.initial_backoff * 2 ** attempt)
+            attempt += 1
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+    def receive(self, sock):
+        decoder = FrameDecoder()
+        while True:
+            messages = []
+            for frame in decoder.recv_into(sock):
+                try:
+                    with METRICS.span('decode_seconds'):
+                        seq, msg_type, payload = self.codec.decode_sequenced(frame)
+                except ProtocolError:
+                    METRICS.count('bad_frames')
+                    continue
+                METRICS.count('messages_received', type=msg_type)
+                if seq is not None:
+                    if seq in self.seen or seq <= self.last_seq - REORDER_WINDOW:
+                        continue
+                    self.seen.add(seq)
+                    if seq > self.last_seq:
+                        self.last_seq = seq
+                        if len(self.seen) > REORDER_WINDOW * 2:
+                            self.seen = {seen for seen in self.seen if seen > seq - REORDER_WINDOW}
+                if msg_type == SESSION:
+                    self.start_session(payload)
+                else:
+                    messages.append((msg_type, payload))
+            if messages:
+                self.on_messages(messages)
+
+    def start_session(self, session):
+        resumed = session['token'] == self.token and session['resumed']
+        self.token = session['token']
+        if not resumed:
+            self.last_seq = session['seq']
+            self.seen = set()
+            if self.on_resync:
+                self.on_resync()
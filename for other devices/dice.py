@@ -0,0 +1,245 @@
+import re
+import random
+from array import array
+from functools import lru_cache
+from itertools import combinations_with_replacement
+from math import factorial, prod
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Exploding dice stop re-rolling after this many extra dice, which keeps
+# exact distributions finite and matches what bulk rolling does
+EXPLODE_DEPTH = 8
+# Expressions are typed by hand and rolled on the UI thread, a typo shouldn't freeze it
+MAX_DICE = 100
+MAX_SIDES = 1000
+# Roughly half a second each: pairs of totals multiplied while convolving, multisets walked for keep
+MAX_CONVOLUTION_WORK = 2000000
+MAX_KEEP_COMBINATIONS = 100000
+
+TERM_PATTERN = re.compile(r'\s*([+-])?\s*(?:(\d*)d(\d+)(!)?(?:(kh|kl|dh|dl|k|d)(\d+))?|(\d+))\s*', re.IGNORECASE)
+
+class DiceError(ValueError):
+    pass
+
+class DiceTerm:
+    __slots__ = ('sign', 'count', 'sides', 'explode', 'keep', 'keep_highest')
+
+    def __init__(self, sign, count, sides, explode=False, keep=None, keep_highest=True):
+        self.sign = sign
+        self.count = count
+        self.sides = sides
+        self.explode = explode
+        self.keep = keep
+        self.keep_highest = keep_highest
+
+class DicePlan:
+    def __init__(self, expression, terms, constant):
+        self.expression = expression
+        self.terms = terms
+        self.constant = constant
+
+    def __repr__(self):
+        return f"DicePlan({self.expression!r})"
+
+@lru_cache(maxsize=256)
+def compile_expression(expression):
+    terms = []
+    constant = 0
+    position = 0
+    text = expression.strip()
+    if not text:
+        raise DiceError("Empty dice expression")
+    dice_count = 0
+    while position < len(text):
+        match = TERM_PATTERN.match(text, position)
+        if not match or match.end() == position or position and not match.group(1):
+            raise DiceError(f"Can't parse dice expression {expression!r} at position {position}")
+        sign = -1 if match.group(1) == '-' else 1
+        if match.group(7):
+            constant += sign * int(match.group(7))
+        else:
+            count = int(match.group(2) or 1)
+            sides = int(match.group(3))
+            if count < 1 or sides < 1:
+                raise DiceError(f"Invalid dice in {expression!r}")
+            if sides > MAX_SIDES:
+                raise DiceError(f"Dice in {expression!r} have more than {MAX_SIDES} sides")
+            dice_count += count
+            if dice_count > MAX_DICE:
+                raise DiceError(f"{expression!r} rolls more than {MAX_DICE} dice")
+            keep, keep_highest = None, True
+            if match.group(5):
+                mode, amount = match.group(5).lower(), int(match.group(6))
+                if mode in ('kh', 'k'):
+                    keep = amount
+                elif mode == 'kl':
+                    keep, keep_highest = amount, False
+                elif mode in ('dl', 'd'):
+                    keep = count - amount
+                else:
+                    keep, keep_highest = count - amount, False
+                if not 0 < keep <= count:
+                    raise DiceError(f"Can't keep {keep} of {count} dice in {expression!r}")
+                if keep == count:
+                    keep = None
+            if match.group(4) and sides == 1:
+                raise DiceError("A d1 can't explode")
+            terms.append(DiceTerm(sign, count, sides, bool(match.group(4)), keep, keep_highest))
+        position = match.end()
+    return DicePlan(expression, tuple(terms), constant)
+
+class DiceRoller:
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.random = random.Random(seed)
+        self.generator = np.random.default_rng(seed) if np is not None else None
+
+    def roll(self, expression):
+        plan = compile_expression(expression)
+        return plan.constant + sum(term.sign * self._roll_term(term) for term in plan.terms)
+
+    def _roll_die(self, sides, explode):
+        total = face = self.random.randint(1, sides)
+        if explode:
+            for _ in range(EXPLODE_DEPTH):
+                if face != sides:
+                    break
+                face = self.random.randint(1, sides)
+                total += face
+        return total
+
+    def _roll_term(self, term):
+        dice = [self._roll_die(term.sides, term.explode) for _ in range(term.count)]
+        if term.keep is not None:
+            dice.sort(reverse=term.keep_highest)
+            dice = dice[:term.keep]
+        return sum(dice)
+
+    def roll_many(self, expression, n):
+        plan = compile_expression(expression)
+        if self.generator is None:
+            return array('q', (self.roll(expression) for _ in range(n)))
+        totals = np.full(n, plan.constant, dtype=np.int64)
+        for term in plan.terms:
+            totals += term.sign * self._roll_term_batch(term, n)
+        return totals
+
+    def _roll_term_batch(self, term, n):
+        rng = self.generator
+        faces = rng.integers(1, term.sides + 1, size=(n, term.count), dtype=np.int64)
+        if term.explode:
+            totals = faces.copy()
+            live = faces == term.sides
+            for _ in range(EXPLODE_DEPTH):
+                live_count = int(live.sum())
+                if not live_count:
+                    break
+                extra = rng.integers(1, term.sides + 1, size=live_count, dtype=np.int64)
+                totals[live] += extra
+                live[live] = extra == term.sides
+            faces = totals
+        if term.keep is not None:
+            faces = np.sort(faces, axis=1)
+            faces = faces[:, -term.keep:] if term.keep_highest else faces[:, :term.keep]
+        return faces.sum(axis=1)
+
+def _die_distribution(sides, explode):
+    if not explode:
+        return {face: 1 / sides for face in range(1, sides + 1)}
+    distribution = {}
+    chance = 1.0
+    for depth in range(EXPLODE_DEPTH + 1):
+        base = sides * depth
+        for face in range(1, sides):
+            distribution[base + face] = chance / sides
+        chance /= sides
+    distribution[sides * (EXPLODE_DEPTH + 1)] = chance
+    return distribution
+
+def _span(sides, explode):
+    # How many different totals one die can show
+    return sides * (EXPLODE_DEPTH + 1) if explode else sides
+
+def _convolution_work(plan):
+    # Pairs of totals _distribution will multiply, worked out from the size of each intermediate result
+    work = 0
+    size = 1
+    for term in plan.terms:
+        span = _span(term.sides, term.explode)
+        if term.keep is None:
+            term_size = 1
+            for _ in range(term.count):
+                work += term_size * span
+                term_size += span - 1
+        else:
+            term_size = term.keep * (span - 1) + 1
+        work += size * term_size
+        size += term_size - 1
+    return work
+
+def _convolve(left, right, sign=1):
+    result = {}
+    for a, pa in left.items():
+        for b, pb in right.items():
+            total = a + sign * b
+            result[total] = result.get(total, 0.0) + pa * pb
+    return result
+
+def _term_distribution(term):
+    die = _die_distribution(term.sides, term.explode)
+    if term.keep is None:
+        distribution = {0: 1.0}
+        for _ in range(term.count):
+            distribution = _convolve(distribution, die)
+        return distribution
+    # Walk every multiset of faces once, weighted by how many orderings produce it
+    faces = sorted(die)
+    combinations = factorial(len(faces) + term.count - 1) // (factorial(term.count) * factorial(len(faces) - 1))
+    if combinations > MAX_KEEP_COMBINATIONS:
+        raise DiceError(f"{term.count}d{term.sides} with keep is too large for an exact distribution")
+    orderings = factorial(term.count)
+    distribution = {}
+    for roll in combinations_with_replacement(faces, term.count):
+        counts = {}
+        for face in roll:
+            counts[face] = counts.get(face, 0) + 1
+        weight = orderings // prod(factorial(c) for c in counts.values())
+        chance = weight * prod(die[face] ** c for face, c in counts.items())
+        kept = roll[-term.keep:] if term.keep_highest else roll[:term.keep]
+        total = sum(kept)
+        distribution[total] = distribution.get(total, 0.0) + chance
+    return distribution
+
+@lru_cache(maxsize=128)
+def _distribution(expression):
+    plan = compile_expression(expression)
+    if _convolution_work(plan) > MAX_CONVOLUTION_WORK:
+        raise DiceError(f"{expression} is too large for an exact distribution")
+    distribution = {plan.constant: 1.0}
+    for term in plan.terms:
+        distribution = _convolve(distribution, _term_distribution(term), term.sign)
+    return tuple(sorted(distribution.items()))
+
+def distribution(expression):
+    # Exact probability of every total, memoized per expression
+    return dict(_distribution(expression))
+
+def mean(expression):
+    return sum(total * chance for total, chance in _distribution(expression))
+
+def chance_at_least(expression, target):
+    return sum(chance for total, chance in _distribution(expression) if total >= target)
+
+default_roller = DiceRoller()
+
+def roll(expression):
+    return default_roller.roll(expression)
+
+def roll_many(expression, n):
+    return default_roller.roll_many(expression, n)
@@ -0,0 +1,200 @@
+import struct
+from collections import deque
+from metrics import METRICS, SIZE_BUCKETS
+
+# Every frame on the wire is a 4 byte big-endian length followed by the payload
+HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Large bulk frames are cut into chunks so urgent frames can go out between them.
+# A chunk payload is CHUNK_MAGIC, a flag byte (1 if more chunks follow) and a piece of the original frame.
+# Urgent frames are never chunked and bulk messages go out one after another, so chunks of two frames
+# never interleave and no stream ids are needed.
+CHUNK_MAGIC = 0xFC
+CHUNK_SIZE = 4096
+MAX_BATCH_SIZE = 64 * 1024
+
+def encode_frame(payload):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return HEADER.pack(len(payload)) + payload
+
+def send_frame(sock, payload):
+    sock.sendall(encode_frame(payload))
+
+def split_frame(payload, chunk_size=CHUNK_SIZE):
+    # Returns the encoded frames to send for payload, a single frame if it is small enough
+    if len(payload) <= chunk_size:
+        return [encode_frame(payload)]
+    view = memoryview(payload)
+    frames = []
+    for start in range(0, len(payload), chunk_size):
+        more = 1 if start + chunk_size < len(payload) else 0
+        frames.append(encode_frame(bytes((CHUNK_MAGIC, more)) + view[start:start + chunk_size]))
+    return frames
+
+def message_frames(payload, urgent):
+    # An urgent frame can overtake a half sent bulk message, so it always goes whole
+    return [encode_frame(payload)] if urgent else split_frame(payload)
+
+class FrameError(Exception):
+    pass
+
+class SendQueue:
+    # Outgoing frames in two lanes. Urgent frames always go first, bulk messages go out one chunk
+    # at a time so a big description never sits in front of an initiative roll.
+    # Not thread-safe, callers lock around it.
+    def __init__(self, limit=1000):
+        self.limit = limit
+        self.urgent = deque()
+        # Each bulk entry is the list of frames of one message, position is how far into the first one we are
+        self.bulk = deque()
+        self.position = 0
+        self.peeked = 0
+        # Bumped by every rewind, so a write that was peeked before one can't commit after it
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.urgent) + len(self.bulk)
+
+    def push(self, frames, urgent=True):
+        if len(self) >= self.limit:
+            return False
+        if urgent:
+            self.urgent.extend(frames)
+        else:
+            self.bulk.append(frames)
+        return True
+
+    def peek(self):
+        # Everything urgent joined into one write, or else the next bulk chunk
+        if self.urgent:
+            parts = []
+            size = 0
+            for frame in self.urgent:
+                if parts and size + len(frame) > MAX_BATCH_SIZE:
+                    break
+                parts.append(frame)
+                size += len(frame)
+            self.peeked = len(parts)
+            return b''.join(parts)
+        self.peeked = 0
+        return self.bulk[0][self.position] if self.bulk else None
+
+    def commit(self, generation=None):
+        # Drops what the last peek returned once it has been written
+        if generation is not None and generation != self.generation:
+            return
+        if self.peeked:
+            for _ in range(self.peeked):
+                self.urgent.popleft()
+            self.peeked = 0
+        elif self.bulk:
+            self.position += 1
+            if self.position == len(self.bulk[0]):
+                self.bulk.popleft()
+                self.position = 0
+
+    def flush_bulk(self):
+        # Moves the unsent bulk frames behind the urgent ones as one write, so nothing pushed later can overtake them
+        if not self.bulk:
+            return
+        parts = self.bulk.popleft()[self.position:]
+        for frames in self.bulk:
+            parts.extend(frames)
+        self.bulk.clear()
+        self.position = 0
+        self.urgent.append(b''.join(parts))
+
+    def rewind(self):
+        # A new connection knows nothing of a half sent message, start it over
+        self.position = 0
+        self.peeked = 0
+        self.generation += 1
+
+class FrameDecoder:
+    def __init__(self, buffer_size=65536):
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        # Pieces of a chunked frame received so far
+        self.partial = None
+
+    def _make_room(self, needed):
+        # Compact unread bytes to the front, grow only when a single frame needs it
+        pending = self.end - self.start
+        if self.start:
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        if len(self.buffer) - self.end < needed:
+            self.view.release()
+            self.buffer.extend(bytes(max(needed, len(self.buffer))))
+            self.view = memoryview(self.buffer)
+
+    def recv_into(self, sock):
+        if len(self.buffer) - self.end < 4096:
+            self._make_room(4096)
+        count = sock.recv_into(self.view[self.end:])
+        if count == 0:
+            raise ConnectionError("Connection closed by server")
+        METRICS.observe('recv_bytes', count, SIZE_BUCKETS)
+        self.end += count
+        return self.frames()
+
+    def feed(self, data):
+        if len(self.buffer) - self.end < len(data):
+            self._make_room(len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+        return self.frames()
+
+    def unread(self):
+        # Bytes fed in but not yet returned as frames, back in wire format so another decoder can take over the stream
+        head = encode_frame(bytes((CHUNK_MAGIC, 1)) + self.partial) if self.partial else b''
+        return head + bytes(self.view[self.start:self.end])
+
+    def frames(self):
+        frames = []
+        header_size = HEADER.size
+        while self.end - self.start >= header_size:
+            (length,) = HEADER.unpack_from(self.buffer, self.start)
+            if length > MAX_FRAME_SIZE:
+                raise FrameError(f"Frame of {length} bytes exceeds limit")
+            frame_end = self.start + header_size + length
+            if frame_end > self.end:
+                if frame_end - self.start > len(self.buffer):
+                    self._make_room(frame_end - self.start)
+                break
+            frame = bytes(self.view[self.start + header_size:frame_end])
+            self.start = frame_end
+            if frame and frame[0] == CHUNK_MAGIC:
+                frame = self._chunk(frame)
+                if frame is None:
+                    continue
+            frames.append(frame)
+        if self.start == self.end:
+            self.start = self.end = 0
+        return frames
+
+    def _chunk(self, frame):
+        if len(frame) < 2:
+            raise FrameError("Truncated chunk")
+        if self.partial is None:
+            self.partial = bytearray()
+        self.partial += memoryview(frame)[2:]
+        if len(self.partial) > MAX_FRAME_SIZE:
+            raise FrameError("Chunked frame exceeds limit")
+        if frame[1]:
+            return None
+        whole = bytes(self.partial)
+        self.partial = None
+        return whole
+
+def receive_batches(sock, handler, decoder=None):
+    # Hands every complete frame of a read to the handler in one call
+    decoder = decoder or FrameDecoder()
+    while True:
+        frames = decoder.recv_into(sock)
+        if frames:
+            handler(frames)
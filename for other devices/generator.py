@@ -0,0 +1,431 @@
+import argparse
+import itertools
+import json
+import random
+import secrets
+import sys
+import time
+from array import array
+from dice import distribution
+from models import Character, Enemy, STATS, STAT_INDEX
+
+CHARACTERS, ENEMIES = 'characters', 'enemies'
+# Generation runs in chunks of this many models, each from its own seed, so a seeded run comes out the same
+# whether one process makes every chunk or a pool shares them out
+CHUNK_SIZE = 1000
+ABILITY_ROLL = '4d6kh3'
+# Monsters of a kind differ from their template by this much per stat
+ENEMY_SPREAD = '1d5-3'
+STR, DEX, CON = STAT_INDEX['STR'], STAT_INDEX['DEX'], STAT_INDEX['CON']
+
+# Ability score bonuses in STATS order
+RACE_MODIFIERS = {
+    'Human': (1, 1, 1, 1, 1, 1),
+    'Elf': (0, 2, 0, 1, 0, 0),
+    'Dwarf': (0, 0, 2, 0, 1, 0),
+    'Orc': (2, 0, 1, 0, 0, 0),
+    'Halfling': (0, 2, 0, 0, 0, 1),
+    'Gnome': (0, 0, 1, 2, 0, 0),
+    'Half-Elf': (0, 1, 1, 0, 0, 2),
+    'Half-Orc': (2, 0, 1, 0, 0, 0),
+    'Tiefling': (0, 0, 0, 1, 0, 2),
+    'Dragonborn': (2, 0, 0, 0, 0, 1),
+}
+# How common each race is in a town, anything else weighs 1
+RACE_WEIGHTS = {'Human': 8, 'Half-Elf': 2, 'Elf': 3, 'Dwarf': 3, 'Halfling': 3, 'Gnome': 2, 'Half-Orc': 2, 'Orc': 1,
+                'Tiefling': 1, 'Dragonborn': 1}
+
+# hit die, abilities best score first, base AC, most DEX bonus the armour allows (None for no limit),
+# MP per level, spellcasting ability
+CLASSES = {
+    'Fighter': (10, ('STR', 'CON', 'DEX', 'WIS', 'CHA', 'INT'), 16, 0, 0, None),
+    'Wizard': (6, ('INT', 'CON', 'DEX', 'WIS', 'CHA', 'STR'), 10, None, 4, 'INT'),
+    'Rogue': (8, ('DEX', 'CON', 'INT', 'WIS', 'CHA', 'STR'), 11, None, 0, None),
+    'Cleric': (8, ('WIS', 'CON', 'STR', 'CHA', 'DEX', 'INT'), 16, 2, 3, 'WIS'),
+    'Barbarian': (12, ('STR', 'CON', 'DEX', 'WIS', 'CHA', 'INT'), 12, None, 0, None),
+    'Bard': (8, ('CHA', 'DEX', 'CON', 'WIS', 'INT', 'STR'), 11, None, 3, 'CHA'),
+    'Druid': (8, ('WIS', 'CON', 'DEX', 'INT', 'CHA', 'STR'), 12, 2, 3, 'WIS'),
+    'Monk': (8, ('DEX', 'WIS', 'CON', 'STR', 'INT', 'CHA'), 12, None, 0, None),
+    'Paladin': (10, ('STR', 'CHA', 'CON', 'WIS', 'DEX', 'INT'), 18, 0, 2, 'CHA'),
+    'Ranger': (10, ('DEX', 'WIS', 'CON', 'STR', 'INT', 'CHA'), 14, 2, 2, 'WIS'),
+    'Sorcerer': (6, ('CHA', 'CON', 'DEX', 'WIS', 'INT', 'STR'), 10, None, 4, 'CHA'),
+    'Warlock': (8, ('CHA', 'CON', 'DEX', 'WIS', 'INT', 'STR'), 11, None, 2, 'CHA'),
+}
+DEFAULT_CLASS = (8, ('CON', 'DEX', 'STR', 'WIS', 'INT', 'CHA'), 11, None, 0, None)
+
+CLASS_SKILLS = {
+    'Fighter': {'Athletics': 5, 'Intimidation': 3, 'Perception': 3, 'Survival': 2, 'Acrobatics': 2, 'History': 1,
+                'Insight': 1, 'Animal Handling': 1, 'Second Wind': 4, 'Action Surge': 2},
+    'Wizard': {'Arcana': 6, 'History': 4, 'Investigation': 3, 'Insight': 2, 'Medicine': 1, 'Religion': 2,
+               'Arcane Recovery': 4, 'Ritual Casting': 2},
+    'Rogue': {'Stealth': 6, 'Sleight of Hand': 4, 'Acrobatics': 3, 'Deception': 3, 'Perception': 3, 'Investigation': 2,
+              'Persuasion': 1, 'Sneak Attack': 5, 'Cunning Action': 2, "Thieves' Cant": 1},
+    'Cleric': {'Religion': 5, 'Medicine': 4, 'Insight': 4, 'Persuasion': 2, 'History': 2, 'Channel Divinity': 3,
+               'Turn Undead': 2},
+    'Barbarian': {'Athletics': 5, 'Survival': 3, 'Intimidation': 3, 'Perception': 2, 'Animal Handling': 2,
+                  'Nature': 1, 'Rage': 5, 'Reckless Attack': 2, 'Danger Sense': 1},
+    'Bard': {'Performance': 6, 'Persuasion': 4, 'Deception': 3, 'History': 2, 'Insight': 2, 'Sleight of Hand': 1,
+             'Bardic Inspiration': 5, 'Song of Rest': 2, 'Jack of All Trades': 1},
+    'Druid': {'Nature': 5, 'Animal Handling': 4, 'Survival': 3, 'Medicine': 3, 'Perception': 2, 'Religion': 1,
+              'Wild Shape': 4, 'Druidic': 1},
+    'Monk': {'Acrobatics': 5, 'Athletics': 3, 'Stealth': 3, 'Insight': 2, 'Religion': 1, 'History': 1,
+             'Martial Arts': 5, 'Flurry of Blows': 2, 'Deflect Missiles': 1},
+    'Paladin': {'Athletics': 4, 'Persuasion': 3, 'Religion': 3, 'Intimidation': 2, 'Insight': 2, 'Medicine': 1,
+                'Lay on Hands': 5, 'Divine Smite': 3, 'Divine Sense': 2},
+    'Ranger': {'Survival': 5, 'Stealth': 4, 'Perception': 4, 'Nature': 3, 'Animal Handling': 2, 'Athletics': 1,
+               'Favored Enemy': 3, 'Natural Explorer': 3},
+    'Sorcerer': {'Arcana': 4, 'Persuasion': 3, 'Deception': 3, 'Intimidation': 2, 'Insight': 2, 'Font of Magic': 4,
+                 'Metamagic': 3},
+    'Warlock': {'Arcana': 4, 'Deception': 4, 'Intimidation': 3, 'History': 2, 'Investigation': 2, 'Religion': 1,
+                'Eldritch Invocations': 4, 'Pact Magic': 3},
+}
+DEFAULT_SKILLS = {'Perception': 3, 'Athletics': 2, 'Insight': 2, 'Persuasion': 2, 'Survival': 2, 'Stealth': 1, 'History': 1}
+
+# Names are two syllables and a surname of two parts, every part drawn from its own weighted table
+COMMON_NAMES = (
+    {'Al': 3, 'Bran': 2, 'Cor': 2, 'Da': 3, 'Ed': 2, 'Ga': 2, 'Hal': 2, 'Jo': 3, 'Ka': 2, 'Li': 2, 'Ma': 3, 'Mer': 1,
+     'Ro': 3, 'Se': 2, 'Tho': 2, 'Wil': 2, 'Ar': 2, 'El': 2},
+    {'n': 4, 'ric': 2, 'da': 3, 'ra': 3, 'win': 2, 'la': 3, 'mond': 1, 'ton': 1, 'bert': 2, 'ry': 2, 'na': 3, 'len': 2,
+     'ya': 1, 'rin': 2},
+    {'Black': 2, 'Stone': 2, 'Ash': 2, 'Green': 2, 'Hill': 2, 'Oak': 2, 'River': 1, 'Thorn': 1, 'Wood': 2, 'Brook': 1,
+     'Fair': 1, 'Gold': 1, 'Red': 1, 'Storm': 1, 'Marsh': 1},
+    {'wood': 2, 'ford': 2, 'well': 2, 'ley': 2, 'ton': 3, 'by': 1, 'hart': 1, 'field': 2, 'more': 1, 'wick': 1,
+     'brook': 1, 'smith': 2},
+)
+ORC_NAMES = (
+    {'Dench': 2, 'Feng': 2, 'Gell': 2, 'Hen': 2, 'Hol': 2, 'Imsh': 1, 'Kes': 2, 'Ront': 2, 'Shump': 1, 'Thok': 2,
+     'Bag': 2, 'Emen': 1, 'Ov': 2, 'Suth': 1, 'Vol': 2},
+    {'': 4, 'a': 3, 'k': 2, 'ag': 2, 'gar': 2, 'ush': 2, 'rak': 2},
+    {'Bone': 2, 'Blood': 2, 'Skull': 2, 'Red': 1, 'Black': 1, 'Iron': 1},
+    {'splitter': 2, 'fang': 2, 'tusk': 2, 'eye': 1, 'crusher': 2, 'hand': 1},
+)
+NAMES = {
+    'Elf': (
+        {'Ae': 3, 'Ela': 2, 'Fae': 2, 'Gal': 2, 'Il': 2, 'Lia': 2, 'Mi': 2, 'Syl': 2, 'Tha': 2, 'Cae': 1, 'Ny': 1},
+        {'ndra': 2, 'rith': 2, 'wyn': 2, 'riel': 3, 'lian': 2, 'thas': 2, 'nor': 2, 'ssa': 2, 'lis': 2},
+        {'Moon': 2, 'Star': 2, 'Silver': 2, 'Dawn': 1, 'Leaf': 1, 'Wind': 2, 'Night': 1, 'Sun': 1},
+        {'whisper': 2, 'brook': 1, 'shade': 2, 'song': 2, 'blossom': 1, 'bough': 1, 'fall': 1},
+    ),
+    'Dwarf': (
+        {'Bal': 2, 'Bro': 2, 'Dur': 3, 'Gim': 1, 'Kil': 2, 'Thor': 2, 'Bru': 2, 'Har': 2, 'Ris': 1, 'Em': 1, 'Dag': 2,
+         'Vond': 1},
+        {'in': 4, 'ar': 2, 'ek': 2, 'rim': 2, 'dan': 2, 'gar': 2, 'li': 1, 'ra': 2, 'wyn': 1},
+        {'Iron': 3, 'Stone': 2, 'Anvil': 1, 'Copper': 1, 'Battle': 2, 'Deep': 1, 'Fire': 2, 'Hammer': 2},
+        {'forge': 2, 'beard': 2, 'fist': 2, 'helm': 2, 'delve': 1, 'hammer': 1, 'shield': 2},
+    ),
+    'Halfling': (
+        {'Mer': 2, 'Pip': 2, 'Ro': 2, 'Bil': 2, 'Cor': 1, 'Lav': 1, 'Ly': 2, 'Os': 1, 'Sera': 1, 'Wel': 1, 'Cal': 2,
+         'An': 2},
+        {'ry': 3, 'pin': 2, 'sie': 2, 'bo': 2, 'do': 2, 'la': 2, 'ric': 1, 'wyn': 1, 'ko': 1},
+        {'Tea': 1, 'Good': 3, 'High': 2, 'Tall': 1, 'Under': 2, 'Green': 2, 'Brush': 1, 'Thorn': 1},
+        {'leaf': 2, 'barrel': 2, 'gather': 2, 'hill': 3, 'foot': 2, 'bottle': 1, 'topple': 1},
+    ),
+    'Gnome': (
+        {'Al': 2, 'Bod': 2, 'Fonk': 1, 'Glim': 2, 'Nis': 2, 'Or': 1, 'Zook': 1, 'Bim': 2, 'Ell': 2, 'Ni': 2, 'Roy': 1,
+         'Wren': 1},
+        {'ston': 2, 'dimple': 1, 'kin': 2, 'bo': 2, 'wick': 2, 'ella': 2, 'ni': 2, 'ryn': 1, 'lin': 2},
+        {'Beren': 2, 'Folk': 2, 'Nack': 1, 'Tim': 2, 'Gar': 2, 'Mur': 1, 'Nin': 1, 'Raul': 1},
+        {'gel': 2, 'or': 2, 'le': 2, 'bers': 2, 'nig': 1, 'rick': 2, 'nor': 1},
+    ),
+    'Tiefling': (
+        {'Ak': 1, 'Am': 2, 'Bar': 2, 'Dam': 2, 'Ek': 1, 'Ia': 1, 'Kal': 2, 'Leu': 1, 'Mor': 2, 'Nem': 2, 'Cri': 1,
+         'Ori': 1, 'Rie': 1, 'Ski': 1},
+        {'menos': 2, 'non': 2, 'akas': 2, 'os': 2, 'ados': 1, 'emon': 2, 'ka': 2, 'la': 2, 'ta': 1, 'via': 1},
+        {'Hope': 2, 'Glory': 1, 'Ardent': 1, 'Sorrow': 2, 'Torment': 1, 'Reverie': 1, 'Creed': 1, 'Quill': 1},
+        {'': 1},
+    ),
+    'Dragonborn': (
+        {'Ar': 2, 'Bal': 2, 'Bha': 1, 'Don': 2, 'Ghe': 1, 'Hes': 2, 'Kri': 2, 'Med': 1, 'Meh': 1, 'Nad': 2, 'Pan': 1,
+         'Pat': 1, 'Sora': 1, 'Thava': 1},
+        {'jhan': 2, 'asar': 2, 'rash': 2, 'aar': 2, 'sh': 1, 'kan': 2, 'rinn': 2, 'ra': 1, 'nn': 1, 'zys': 1},
+        {'Clethtin': 1, 'Daarden': 2, 'Delmi': 1, 'Drache': 2, 'Kepesh': 1, 'Kerr': 2, 'Myas': 1, 'Nemmo': 1,
+         'Nori': 1, 'Ophin': 1},
+        {'thiallor': 1, 'drian': 2, 'rev': 1, 'dandion': 1, 'kmolik': 1, 'hylon': 2, 'tan': 1, 'nis': 1, 'xius': 1},
+    ),
+    'Orc': ORC_NAMES,
+    'Half-Orc': ORC_NAMES,
+}
+
+# name, enemy type, lowest level, hit die, AC, stats in STATS order, weighted abilities, description, how common
+ENEMY_TEMPLATES = (
+    ('Goblin', 'Humanoid', 1, 6, 15, (8, 14, 10, 10, 8, 8), {'Nimble Escape': 3, 'Ambush': 1},
+     "A small, sneaky creature with a rusty blade", 6),
+    ('Bandit', 'Humanoid', 1, 8, 12, (11, 12, 12, 10, 10, 10), {'Cheap Shot': 2, 'Pack Tactics': 1},
+     "A desperate cutthroat working the roads", 5),
+    ('Cultist', 'Humanoid', 1, 8, 12, (11, 12, 10, 10, 11, 10), {'Dark Devotion': 3, 'Sacrificial Dagger': 1},
+     "A hooded zealot muttering prayers", 3),
+    ('Wolf', 'Beast', 1, 8, 13, (12, 15, 12, 3, 12, 6), {'Pack Tactics': 3, 'Keen Hearing and Smell': 2, 'Knockdown Bite': 2},
+     "A lean grey wolf hunting with its pack", 5),
+    ('Skeleton', 'Undead', 1, 8, 13, (10, 14, 15, 6, 8, 5), {'Vulnerable to Bludgeoning': 3, 'Undead Fortitude': 1},
+     "Rattling bones animated by old magic", 4),
+    ('Zombie', 'Undead', 1, 8, 8, (13, 6, 16, 3, 6, 5), {'Undead Fortitude': 3, 'Relentless': 1},
+     "A shambling corpse that will not stay down", 4),
+    ('Orc', 'Humanoid', 2, 8, 13, (16, 12, 16, 7, 11, 10), {'Aggressive': 3, 'Battle Cry': 1},
+     "A hulking raider with a greataxe", 3),
+    ('Ghoul', 'Undead', 2, 8, 12, (13, 15, 10, 7, 10, 6), {'Paralyzing Claws': 3, 'Stench': 1},
+     "A grave-robbing fiend with a paralysing touch", 2),
+    ('Imp', 'Fiend', 2, 4, 13, (6, 17, 13, 11, 12, 14), {'Invisibility': 2, 'Poison Sting': 2, 'Shapechanger': 1},
+     "A tiny devil with a barbed tail", 1),
+    ('Giant Spider', 'Beast', 3, 10, 14, (14, 16, 12, 2, 11, 4), {'Poison Bite': 3, 'Web': 3, 'Spider Climb': 2},
+     "A spider the size of a horse", 2),
+    ('Ogre', 'Giant', 4, 10, 11, (19, 8, 16, 5, 7, 7), {'Crushing Blow': 2, 'Thrown Boulder': 1},
+     "A brutish giant with a tree-trunk club", 1),
+    ('Troll', 'Giant', 5, 10, 15, (18, 13, 20, 7, 9, 7), {'Regeneration': 4, 'Keen Smell': 1},
+     "A lanky green horror whose wounds close as you watch", 1),
+)
+
+def modifier(score):
+    return (score - 10) // 2
+
+class WeightedTable:
+    # Cumulative weights are worked out once, random.choices then only bisects
+    __slots__ = ('items', 'cumulative')
+
+    def __init__(self, weights):
+        # weights is {item: weight} or (item, weight) pairs
+        pairs = list(weights.items() if hasattr(weights, 'items') else weights)
+        self.items = [item for item, _ in pairs]
+        self.cumulative = list(itertools.accumulate(weight for _, weight in pairs))
+
+    def pick(self, rng):
+        return rng.choices(self.items, cum_weights=self.cumulative)[0]
+
+    def sample(self, rng, k):
+        return rng.choices(self.items, cum_weights=self.cumulative, k=k)
+
+    def distinct(self, rng, k):
+        # Draws until k different items come up, fine while tables are much longer than k
+        k = min(k, len(self.items))
+        chosen = []
+        while len(chosen) < k:
+            item = self.pick(rng)
+            if item not in chosen:
+                chosen.append(item)
+        return chosen
+
+def dice_table(expression):
+    # Drawing from the exact distribution of an expression is the same as rolling it, and thousands of rolls
+    # are one random.choices call
+    return WeightedTable(sorted(distribution(expression).items()))
+
+class Generator:
+    # Makes complete characters and monsters. The same seed always gives the same models.
+    def __init__(self, seed=None, races=None, classes=None):
+        self.random = random.Random(seed)
+        races = races or list(RACE_MODIFIERS)
+        classes = classes or list(CLASSES)
+        self.races = WeightedTable((race, RACE_WEIGHTS.get(race, 1)) for race in races)
+        self.classes = WeightedTable((class_type, 1) for class_type in classes)
+        self.abilities = dice_table(ABILITY_ROLL)
+        self.spread = dice_table(ENEMY_SPREAD)
+        self.names = {}
+        self.skills = {}
+        # (race, class) -> (slot each rolled score goes to best first, its racial bonus, class row)
+        self.templates = {}
+
+    def name_tables(self, race):
+        tables = self.names.get(race)
+        if tables is None:
+            tables = self.names[race] = tuple(WeightedTable(part) for part in NAMES.get(race, COMMON_NAMES))
+        return tables
+
+    def name(self, race):
+        first, second, family, suffix = self.name_tables(race)
+        rng = self.random
+        return f"{first.pick(rng)}{second.pick(rng)} {family.pick(rng)}{suffix.pick(rng)}"
+
+    def template(self, race, class_type):
+        template = self.templates.get((race, class_type))
+        if template is None:
+            row = CLASSES.get(class_type, DEFAULT_CLASS)
+            modifiers = RACE_MODIFIERS.get(race, (0,) * len(STATS))
+            slots = tuple(STAT_INDEX[stat] for stat in row[1])
+            template = self.templates[(race, class_type)] = (slots, tuple(modifiers[slot] for slot in slots), row)
+        return template
+
+    def skill_table(self, class_type):
+        table = self.skills.get(class_type)
+        if table is None:
+            table = self.skills[class_type] = WeightedTable(CLASS_SKILLS.get(class_type, DEFAULT_SKILLS))
+        return table
+
+    def characters(self, count, min_level=1, max_level=1):
+        # Yields count characters, everything random for a batch is drawn in a handful of bulk calls
+        rng = self.random
+        levels = range(min_level, max_level + 1)
+        for start in range(0, count, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, count - start)
+            races = self.races.sample(rng, size)
+            classes = self.classes.sample(rng, size)
+            rolled = rng.choices(levels, k=size)
+            scores = self.abilities.sample(rng, size * len(STATS))
+            for i in range(size):
+                yield self.character(races[i], classes[i], rolled[i], scores[i * 6:i * 6 + 6])
+
+    def character(self, race, class_type, level, scores):
+        slots, bonuses, (hit_die, _, base_ac, dex_cap, mp_per_level, casting) = self.template(race, class_type)
+        scores.sort(reverse=True)
+        values = array('h', scores)
+        for rank, slot in enumerate(slots):
+            values[slot] = scores[rank] + bonuses[rank]
+        character = Character(self.name(race), race, class_type, level)
+        character._stats.values = values
+        con = modifier(values[CON])
+        # Full hit die at first level, the average after
+        character.hp = max(hit_die + con + (level - 1) * (hit_die // 2 + 1 + con), level)
+        dex = modifier(values[DEX])
+        character.ac = base_ac + (dex if dex_cap is None else min(dex, dex_cap))
+        character.mp = mp_per_level * level + max(modifier(values[STAT_INDEX[casting]]), 0) if casting else 0
+        character.special_skills = self.skill_table(class_type).distinct(self.random, 2 + level // 4)
+        return character
+
+    def enemies(self, count, min_level=1, max_level=1, types=None):
+        # Yields count monsters from the templates that fit the level range and types, commoner ones more often
+        templates = [template for template in ENEMY_TEMPLATES
+                     if template[2] <= max_level and (not types or template[1] in types)]
+        if not templates:
+            raise ValueError(f"No monsters of level {max_level} or lower" + (f" of type {', '.join(types)}" if types else ""))
+        table = WeightedTable((template, template[-1]) for template in templates)
+        rng = self.random
+        levels = range(min_level, max_level + 1)
+        for start in range(0, count, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, count - start)
+            chosen = table.sample(rng, size)
+            rolled = rng.choices(levels, k=size)
+            spread = self.spread.sample(rng, size * len(STATS))
+            for i in range(size):
+                yield self.enemy(chosen[i], rolled[i], spread[i * 6:i * 6 + 6])
+
+    def enemy(self, template, level, spread):
+        name, enemy_type, lowest, hit_die, ac, stats, abilities, description, _ = template
+        level = max(level, lowest)
+        values = array('h', map(int.__add__, stats, spread))
+        con = modifier(values[CON])
+        enemy = Enemy(name, enemy_type, level, max(level * (hit_die // 2 + 1 + con), 1), ac + (level - lowest) // 3, description)
+        enemy._stats.values = values
+        table = self.skills.get(name)
+        if table is None:
+            table = self.skills[name] = WeightedTable(abilities)
+        enemy.special_abilities = table.distinct(self.random, 1 + (level - lowest) // 4)
+        return enemy
+
+def make_chunk(kind, count, seed, options):
+    generator = Generator(seed, options.get('races'), options.get('classes'))
+    if kind == CHARACTERS:
+        return generator.characters(count, options.get('min_level', 1), options.get('max_level', 1))
+    return generator.enemies(count, options.get('min_level', 1), options.get('max_level', 1), options.get('types'))
+
+def packed_chunk(task):
+    # Runs in a pool worker, packed records are much cheaper to send back than pickled models
+    return [model.to_bytes() for model in make_chunk(*task)]
+
+def unique_names(models):
+    # Names are keys in the campaign store and at the table, repeats get a number: Goblin, Goblin 2, Goblin 3
+    seen = {}
+    for model in models:
+        repeats = seen.get(model.name, 0) + 1
+        seen[model.name] = repeats
+        if repeats > 1:
+            model.name = f"{model.name} {repeats}"
+        yield model
+
+def _generate(kind, count, seed, workers, options):
+    tasks = ((kind, min(CHUNK_SIZE, count - start), f"{seed}:{start // CHUNK_SIZE}", options)
+             for start in range(0, count, CHUNK_SIZE))
+    if workers <= 1:
+        for task in tasks:
+            yield from make_chunk(*task)
+        return
+    import multiprocessing
+    model = Character if kind == CHARACTERS else Enemy
+    with multiprocessing.Pool(workers) as pool:
+        # A few chunks per worker at a time, so a slow consumer doesn't leave the whole batch waiting in memory
+        while True:
+            window = list(itertools.islice(tasks, workers * 4))
+            if not window:
+                break
+            for records in pool.imap(packed_chunk, window):
+                for record in records:
+                    yield model.from_bytes(record)
+
+def generate(kind, count, seed=None, workers=1, **options):
+    # Lazily yields count CHARACTERS or ENEMIES. options: races, classes, min_level, max_level and, for
+    # enemies, types. Chunk n is always made from seed:n, so workers only change how fast the same models come.
+    if kind not in (CHARACTERS, ENEMIES):
+        raise ValueError(f"Can't generate {kind!r}")
+    if seed is None:
+        seed = secrets.randbits(64)
+    return unique_names(_generate(kind, count, seed, workers, options))
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def write_jsonl(models, out):
+    # One model's to_dict() per line, read back with Character.from_dict / Enemy.from_dict
+    count = 0
+    for batch in batched(models, CHUNK_SIZE):
+        out.write(''.join(json.dumps(model.to_dict(), separators=(',', ':')) + '\n' for model in batch))
+        count += len(batch)
+    return count
+
+def write_store(models, store):
+    # One transaction per chunk, readers of the store see the batch arrive a chunk at a time
+    count = 0
+    for batch in batched(models, CHUNK_SIZE):
+        store.upsert_many(batch)
+        count += len(batch)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate NPCs or monsters in bulk as JSON lines or into a campaign store")
+    parser.add_argument('kind', choices=(CHARACTERS, ENEMIES))
+    parser.add_argument('count', type=int)
+    parser.add_argument('--seed', default=None, help="same seed, same output, whatever the worker count")
+    parser.add_argument('--min-level', type=int, default=1)
+    parser.add_argument('--max-level', type=int, default=None, help="defaults to --min-level")
+    parser.add_argument('--race', dest='races', action='append', help="may be repeated, defaults to every race")
+    parser.add_argument('--class', dest='classes', action='append', help="may be repeated, defaults to every class")
+    parser.add_argument('--type', dest='types', action='append', help="monster type, may be repeated")
+    parser.add_argument('--catalog', action='store_true', help="pick races and classes from the game catalog")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--out', default='-', help="JSON lines file, - for stdout")
+    parser.add_argument('--store', default=None, help="campaign database to write to instead of JSON lines")
+    args = parser.parse_args()
+    max_level = args.max_level if args.max_level is not None else args.min_level
+    if args.count < 0 or args.min_level < 1 or max_level < args.min_level:
+        parser.error("count must be positive and levels 1 <= min <= max")
+    races, classes = args.races, args.classes
+    if args.catalog:
+        from catalog import open_catalog
+        catalog = open_catalog()
+        if catalog:
+            races, classes = races or catalog.races, classes or catalog.classes
+            catalog.close()
+    options = {'races': races, 'classes': classes, 'min_level': args.min_level, 'max_level': max_level, 'types': args.types}
+    try:
+        models = generate(args.kind, args.count, args.seed, args.workers, **options)
+        start = time.perf_counter()
+        if args.store:
+            from campaign_store import CampaignStore
+            store = CampaignStore(args.store)
+            try:
+                count = write_store(models, store)
+            finally:
+                store.close()
+        elif args.out == '-':
+            count = write_jsonl(models, sys.stdout)
+        else:
+            with open(args.out, 'w', encoding='utf-8') as out:
+                count = write_jsonl(models, out)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+    print(f"{count} {args.kind} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):,.0f}/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
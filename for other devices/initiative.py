@@ -0,0 +1,76 @@
+import heapq
+from bisect import bisect_left, insort
+
+class InitiativeTracker:
+    # Turn order is highest roll first, DEX breaks ties and the name keeps every client's order identical.
+    # Entries are [-roll, -dex, name, alive] so heapq's min-heap pops the next combatant to act.
+    def __init__(self):
+        self.entries = {}
+        # Sorted keys of everyone in the fight, only used to find display positions
+        self.order = []
+        # Still to act this round, and already acted and waiting for the next one
+        self.pending = []
+        self.done = []
+        self.active = None
+        # Entry of the latest turn, kept even if that combatant has since been removed
+        self.current = None
+        self.round = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def position(self, name):
+        entry = self.entries.get(name)
+        return bisect_left(self.order, tuple(entry[:3])) if entry else None
+
+    def add(self, name, roll, dex=10):
+        # Returns (old position if this is a re-roll, new position)
+        replaced = self.remove(name) if name in self.entries else None
+        entry = [-roll, -dex, name, True]
+        self.entries[name] = entry
+        insort(self.order, tuple(entry[:3]))
+        # Someone joining after their slot has passed this round waits for the next one
+        heapq.heappush(self.done if self.current and entry < self.current else self.pending, entry)
+        return replaced, self.position(name)
+
+    def remove(self, name):
+        # Returns the position the combatant was shown at. Heap entries are only marked dead and dropped when popped.
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return None
+        key = tuple(entry[:3])
+        index = bisect_left(self.order, key)
+        del self.order[index]
+        entry[3] = False
+        if self.active == name:
+            self.active = None
+        return index
+
+    def next_turn(self):
+        # Returns the name of the combatant whose turn it is now, or None if nobody is left
+        if self.current and self.current[3]:
+            heapq.heappush(self.done, self.current)
+        self.round = self.round or 1
+        while True:
+            if not self.pending:
+                if not self.entries:
+                    self.active = self.current = None
+                    return None
+                self.round += 1
+                self.pending, self.done = self.done, []
+            entry = heapq.heappop(self.pending)
+            if entry[3]:
+                self.current = entry
+                self.active = entry[2]
+                return self.active
+
+    def set_active(self, name, round_number):
+        # Followers take the DM's word for whose turn it is instead of running the queue themselves
+        self.active = name
+        self.round = round_number
+
+    def clear(self):
+        self.__init__()
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import struct
+import time
+from bisect import bisect_right
+from urllib.parse import quote
+from protocol import MessageCodec, ProtocolError, TYPE_TAGS, PLAYER_DATA, ENEMY_DATA, LOCATION_DATA, PATCH, STAT_UPDATE, STAT_BATCH, INITIATIVE, INITIATIVE_REMOVE, TURN
+from state_sync import TableState, MAP_TYPES
+
+# A journal directory holds one segment per snapshot: NNNNNNNNNN.snap is the table as of that seq and
+# NNNNNNNNNN.log every message broadcast after it. Recovery loads the newest snapshot and replays only its log,
+# older segments are kept so the table can be rebuilt as it was at any earlier point.
+SNAPSHOT_INTERVAL = 10000
+BUFFER_SIZE = 64 * 1024
+FLUSH_INTERVAL = 1.0
+# encoded message length, wall clock time, room seq, message type tag
+RECORD = struct.Struct('>IdIB')
+# Only these change the table, replay steps over everything else without decoding it
+STATE_TAGS = {TYPE_TAGS[msg_type] for msg_type in (PLAYER_DATA, ENEMY_DATA, LOCATION_DATA, PATCH, STAT_UPDATE, STAT_BATCH,
+                                                   INITIATIVE, INITIATIVE_REMOVE, TURN) + MAP_TYPES}
+
+def room_path(directory, room_name):
+    # Room names come from /join, so they're quoted before going anywhere near a path
+    return os.path.join(directory, 'room-' + quote(room_name, safe=''))
+
+class Journal:
+    def __init__(self, path, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.codec = MessageCodec(binary=True)
+        self.file = None
+        # Messages in the open log, a snapshot is due once there are snapshot_interval of them
+        self.pending = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, seq, suffix):
+        return os.path.join(self.path, f"{seq:010d}.{suffix}")
+
+    def segments(self):
+        # Snapshot seqs, oldest first
+        return sorted(int(name[:-5]) for name in os.listdir(self.path) if name.endswith('.snap'))
+
+    def snapshot_header(self, seq):
+        with open(self._file(seq, 'snap'), 'rb') as f:
+            return json.loads(f.readline())
+
+    def load_snapshot(self, seq):
+        with open(self._file(seq, 'snap'), 'rb') as f:
+            header = json.loads(f.readline())
+            return TableState.from_dict(json.loads(f.readline())), header
+
+    def write_snapshot(self, table, seq):
+        # Written aside and renamed into place, a crash leaves either the old segment or the new one
+        path = self._file(seq, 'snap')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(json.dumps({'seq': seq, 'time': time.time()}).encode('utf-8') + b'\n')
+            f.write(json.dumps(table.to_dict(), separators=(',', ':')).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def replay(self, segment, table, stop_seq=None, stop_time=None):
+        # Applies the segment's log to table, up to and including stop_seq or stop_time.
+        # Returns (last seq applied, bytes of whole records read, records read).
+        seq = segment
+        try:
+            with open(self._file(segment, 'log'), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return seq, 0, 0
+        view = memoryview(data)
+        offset = count = 0
+        while offset + RECORD.size <= len(data):
+            length, when, record_seq, tag = RECORD.unpack_from(data, offset)
+            end = offset + RECORD.size + length
+            if end > len(data):
+                # The tail of a write that never finished
+                break
+            if (stop_seq is not None and record_seq > stop_seq) or (stop_time is not None and when > stop_time):
+                break
+            if tag in STATE_TAGS:
+                table.apply(*self.codec.decode(view[offset + RECORD.size:end]))
+            seq = record_seq
+            offset = end
+            count += 1
+        return seq, offset, count
+
+    def recover(self):
+        # Returns (table, seq) as of the last message written and opens the log for appending
+        segments = self.segments()
+        if not segments:
+            table, seq = TableState(), 0
+            self.write_snapshot(table, seq)
+            segment = end = 0
+        else:
+            segment = segments[-1]
+            table, _ = self.load_snapshot(segment)
+            seq, end, self.pending = self.replay(segment, table)
+        self.file = open(self._file(segment, 'log'), 'ab', buffering=BUFFER_SIZE)
+        # Cut off a half-written record so new ones don't land after it
+        self.file.truncate(end)
+        return table, seq
+
+    def state_at(self, seq=None, when=None):
+        # Fast-forward: start from the newest snapshot at or before the target and replay only what follows it
+        segments = self.segments()
+        if not segments:
+            return TableState(), 0
+        if seq is not None:
+            index = bisect_right(segments, seq) - 1
+        elif when is not None:
+            times = _Times(self, segments)
+            index = bisect_right(times, when) - 1
+        else:
+            index = len(segments) - 1
+        if index < 0:
+            return TableState(), 0
+        table, _ = self.load_snapshot(segments[index])
+        last, _, _ = self.replay(segments[index], table, seq, when)
+        return table, last
+
+    def encode(self, seq, msg_type, payload):
+        # Raises ProtocolError for a payload the binary layout can't hold, so callers can refuse it before
+        # anything changes
+        try:
+            frame = self.codec.encode(msg_type, payload)
+        except (struct.error, KeyError, TypeError, AttributeError, UnicodeEncodeError) as e:
+            raise ProtocolError(f"Can't journal {msg_type}: {e}")
+        return RECORD.pack(len(frame), time.time(), seq, TYPE_TAGS[msg_type]) + frame
+
+    def write(self, record):
+        self.file.write(record)
+        self.pending += 1
+
+    def append(self, seq, msg_type, payload):
+        self.write(self.encode(seq, msg_type, payload))
+
+    def due(self):
+        return self.pending >= self.snapshot_interval
+
+    def rotate(self, table, seq):
+        # Compacts everything so far into a snapshot and starts a new log after it
+        self.close()
+        self.write_snapshot(table, seq)
+        self.file = open(self._file(seq, 'log'), 'ab', buffering=BUFFER_SIZE)
+        self.pending = 0
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+class _Times:
+    # Sequence view of snapshot times so bisect only reads the headers it needs
+    def __init__(self, journal, segments):
+        self.journal = journal
+        self.segments = segments
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __getitem__(self, index):
+        return self.journal.snapshot_header(self.segments[index])['time']
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a room's table from its journal")
+    parser.add_argument('directory', help="journal directory of the server")
+    parser.add_argument('--room', default='default')
+    parser.add_argument('--seq', type=int, default=None, help="stop after this message")
+    parser.add_argument('--time', type=float, default=None, help="stop at this Unix time")
+    args = parser.parse_args()
+    journal = Journal(room_path(args.directory, args.room))
+    table, seq = journal.state_at(args.seq, args.time)
+    print(f"Room {args.room} at message {seq}:")
+    for (kind, name), payload in table.entities.items():
+        details = f"HP {payload['hp']}" if 'hp' in payload else payload.get('location_type', '')
+        print(f"  {kind:<14} {name} {details}")
+    for name, (roll, dex) in sorted(table.initiative.items(), key=lambda item: (-item[1][0], -item[1][1], item[0])):
+        print(f"  initiative     {name} {roll} (DEX {dex})")
+    if table.turn:
+        print(f"  turn           {table.turn[0]}, round {table.turn[1]}")
+    for location, battle_map in table.maps.items():
+        print(f"  map            {location} {battle_map.width}x{battle_map.height}, {len(battle_map.tokens)} tokens")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import mmap
+import re
+import tempfile
+from array import array
+from bisect import bisect_right
+from tkinter import scrolledtext
+from ui_pump import BufferedText
+
+class Scrollback:
+    # Append-only file of trimmed lines, read back through mmap without loading it whole
+    def __init__(self, path=None):
+        self.file = open(path, 'w+b') if path else tempfile.TemporaryFile()
+        self.offsets = array('q')
+        self.size = 0
+        self.map = None
+        self.mapped_size = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, lines):
+        data = bytearray()
+        for line in lines:
+            self.offsets.append(self.size + len(data))
+            data += line.encode('utf-8') + b'\n'
+        self.file.write(data)
+        self.size += len(data)
+
+    def _view(self):
+        if self.mapped_size != self.size:
+            self.file.flush()
+            if self.map:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+            self.mapped_size = self.size
+        return self.map
+
+    def lines(self, start, stop):
+        if start >= stop:
+            return []
+        end = self.offsets[stop] if stop < len(self.offsets) else self.size
+        data = self._view()[self.offsets[start]:end]
+        return data.decode('utf-8').split('\n')[:stop - start]
+
+    def search(self, pattern, limit):
+        if not self.size:
+            return []
+        results = []
+        view = self._view()
+        for match in pattern.finditer(view):
+            line_no = bisect_right(self.offsets, match.start()) - 1
+            if results and results[-1][0] == line_no:
+                continue
+            results.append((line_no, self.lines(line_no, line_no + 1)[0]))
+            if len(results) >= limit:
+                break
+        return results
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+class LogView(BufferedText):
+    def __init__(self, parent, max_lines=2000, load_chunk=200, spill_path=None, readonly=False, **options):
+        super().__init__(scrolledtext.ScrolledText(parent, **options), readonly)
+        self.max_lines = max_lines
+        self.load_chunk = load_chunk
+        self.scrollback = Scrollback(spill_path)
+        # Global line number of the first line in the widget; earlier lines live in the scrollback
+        self.top = 0
+        self.loading = False
+        self.widget.configure(yscrollcommand=self.on_scroll)
+
+    def __getattr__(self, name):
+        # Anything not handled here goes straight to the text widget (pack, tag_config, ...)
+        return getattr(self.widget, name)
+
+    def line_count(self):
+        return int(self.widget.index('end-1c').split('.')[0])
+
+    def flush(self):
+        super().flush()
+        count = self.line_count()
+        at_bottom = self.widget.yview()[1] >= 0.999
+        # Don't yank history out from under someone reading it unless the widget gets far too big
+        if count > self.max_lines and (at_bottom or count > self.max_lines * 2):
+            self.trim(count - self.max_lines)
+
+    def trim(self, count):
+        lines = self.widget.get('1.0', f'{count + 1}.0').split('\n')[:count]
+        already_spilled = len(self.scrollback) - self.top
+        if already_spilled < count:
+            self.scrollback.append(lines[max(already_spilled, 0):])
+        if self.readonly:
+            self.widget.config(state='normal')
+        self.widget.delete('1.0', f'{count + 1}.0')
+        if self.readonly:
+            self.widget.config(state='disabled')
+        self.top += count
+
+    def on_scroll(self, first, last):
+        self.vbar.set(first, last)
+        if float(first) <= 0.0 and self.top > 0 and not self.loading:
+            self.loading = True
+            self.widget.after_idle(self.load_older)
+
+    def load_older(self):
+        self.loading = False
+        start = max(0, self.top - self.load_chunk)
+        lines = self.scrollback.lines(start, self.top)
+        if not lines:
+            return
+        if self.readonly:
+            self.widget.config(state='normal')
+        self.widget.insert('1.0', '\n'.join(lines) + '\n')
+        if self.readonly:
+            self.widget.config(state='disabled')
+        self.widget.yview(f'{len(lines) + 1}.0')
+        self.top = start
+
+    def search(self, text, limit=200, regex=False):
+        # Searches the spilled history on disk and the lines still in the widget
+        flags = re.IGNORECASE
+        source = text if regex else re.escape(text)
+        results = self.scrollback.search(re.compile(source.encode('utf-8'), flags), limit)
+        spilled = len(self.scrollback)
+        pattern = re.compile(source, flags)
+        widget_lines = self.widget.get('1.0', 'end-1c').split('\n')
+        for offset, line in enumerate(widget_lines):
+            line_no = self.top + offset
+            if line_no >= spilled and pattern.search(line) and len(results) < limit:
+                results.append((line_no, line))
+        return results
+
+    def close(self):
+        self.scrollback.close()
@@ -0,0 +1,156 @@
+import tkinter as tk
+from battle_map import FLOOR, WALL, DOOR, OPEN_DOOR, WATER, RUBBLE
+
+TILE_SIZE = 16
+COLORS = {FLOOR: '#C8B89A', WALL: '#3A3A3A', DOOR: '#8B5A2B', OPEN_DOOR: '#D2A679', WATER: '#4A7FB5', RUBBLE: '#9C8F7A'}
+# Tokens: your own, other players' and the DM's
+TOKEN_COLORS = ('#4CAF50', '#2980B9', '#C0392B')
+# Fog states of a tile
+VISIBLE, REMEMBERED, UNSEEN = 0, 1, 2
+
+class MapView:
+    # Terrain and fog are drawn as one rectangle per run of equal tiles in a row, and a change only
+    # redraws the rows it touched, so a big map stays a few thousand canvas items
+    def __init__(self, parent, on_move=None, on_toggle=None, tile_size=TILE_SIZE):
+        self.frame = tk.Frame(parent, bg='#2E2E2E')
+        self.canvas = tk.Canvas(self.frame, bg='black', highlightthickness=0)
+        x_scroll = tk.Scrollbar(self.frame, orient='horizontal', command=self.canvas.xview)
+        y_scroll = tk.Scrollbar(self.frame, orient='vertical', command=self.canvas.yview)
+        self.canvas.configure(xscrollcommand=x_scroll.set, yscrollcommand=y_scroll.set)
+        x_scroll.pack(side='bottom', fill='x')
+        y_scroll.pack(side='right', fill='y')
+        self.canvas.pack(side='left', fill='both', expand=True)
+        self.canvas.bind('<Button-1>', self.on_click)
+        if on_toggle:
+            self.canvas.bind('<Button-3>', self.on_right_click)
+        self.on_move = on_move
+        self.on_toggle = on_toggle
+        self.tile_size = tile_size
+        self.battle_map = None
+        self.viewer = None
+        self.selected = None
+        # Token name -> (oval, label) canvas items
+        self.token_items = {}
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def show(self, battle_map, viewer=None):
+        # viewer is the player whose fog is drawn, None shows the whole map
+        self.battle_map = battle_map
+        self.viewer = viewer
+        self.selected = None
+        self.token_items = {}
+        self.canvas.delete('all')
+        size = self.tile_size
+        self.canvas.configure(scrollregion=(0, 0, battle_map.width * size, battle_map.height * size))
+        for y in range(battle_map.height):
+            self.draw_terrain_row(y)
+            self.draw_fog_row(y)
+        for name in battle_map.tokens:
+            self.draw_token(name)
+
+    def _runs(self, y, state):
+        # (first x, last x, state) for each run of tiles in row y that state() gives the same value
+        start, current = 0, state(0, y)
+        for x in range(1, self.battle_map.width):
+            value = state(x, y)
+            if value != current:
+                yield start, x - 1, current
+                start, current = x, value
+        yield start, self.battle_map.width - 1, current
+
+    def _rectangle(self, x0, x1, y, tags, **options):
+        size = self.tile_size
+        return self.canvas.create_rectangle(x0 * size, y * size, (x1 + 1) * size, (y + 1) * size, outline='', tags=tags, **options)
+
+    def draw_terrain_row(self, y):
+        tag = f'terrain{y}'
+        self.canvas.delete(tag)
+        for x0, x1, terrain in self._runs(y, self.battle_map.tile):
+            self._rectangle(x0, x1, y, ('terrain', tag), fill=COLORS[terrain])
+        self.canvas.tag_lower(tag)
+
+    def _fog(self, x, y):
+        if self.battle_map.visible(self.viewer, x, y):
+            return VISIBLE
+        return REMEMBERED if self.battle_map.explored(self.viewer, x, y) else UNSEEN
+
+    def draw_fog_row(self, y):
+        if self.viewer is None:
+            return
+        tag = f'fog{y}'
+        self.canvas.delete(tag)
+        for x0, x1, state in self._runs(y, self._fog):
+            if state == UNSEEN:
+                self._rectangle(x0, x1, y, ('fog', tag), fill='black')
+            elif state == REMEMBERED:
+                self._rectangle(x0, x1, y, ('fog', tag), fill='black', stipple='gray50')
+        self.canvas.tag_raise('token')
+
+    def draw_token(self, name):
+        token = self.battle_map.tokens.get(name)
+        items = self.token_items.get(name)
+        if token is None:
+            if items:
+                self.canvas.delete(*items)
+                del self.token_items[name]
+            if self.selected == name:
+                self.selected = None
+            return
+        size = self.tile_size
+        x, y = token.x * size, token.y * size
+        if items is None:
+            color = TOKEN_COLORS[0] if self.viewer is not None and token.owner == self.viewer else TOKEN_COLORS[1 if token.owner else 2]
+            items = self.token_items[name] = (
+                self.canvas.create_oval(x + 1, y + 1, x + size - 1, y + size - 1, fill=color, outline='white', tags='token'),
+                self.canvas.create_text(x + size // 2, y + size // 2, text=name[:1], fill='white', font=('Arial', 8, 'bold'), tags='token'))
+        else:
+            self.canvas.coords(items[0], x + 1, y + 1, x + size - 1, y + size - 1)
+            self.canvas.coords(items[1], x + size // 2, y + size // 2)
+        # Players don't see other tokens standing in their fog
+        shown = self.viewer is None or token.owner == self.viewer or self.battle_map.visible(self.viewer, token.x, token.y)
+        for item in items:
+            self.canvas.itemconfigure(item, state='normal' if shown else 'hidden')
+
+    def update(self, tiles, names=()):
+        # Redraws the fog of the rows holding tiles, and the tokens that moved or now stand in or out of sight
+        width = self.battle_map.width
+        rows = {tile // width for tile in tiles}
+        for y in rows:
+            self.draw_fog_row(y)
+        names = set(names)
+        if rows:
+            names.update(name for name, token in self.battle_map.tokens.items() if token.y in rows)
+        for name in names:
+            self.draw_token(name)
+
+    def tile_at(self, event):
+        size = self.tile_size
+        x, y = int(self.canvas.canvasx(event.x) // size), int(self.canvas.canvasy(event.y) // size)
+        if 0 <= x < self.battle_map.width and 0 <= y < self.battle_map.height:
+            return x, y
+        return None
+
+    def on_click(self, event):
+        # Click one of your tokens to pick it up, then a tile to move it there
+        if self.battle_map is None:
+            return
+        tile = self.tile_at(event)
+        if tile is None:
+            return
+        mine = [name for name in self.battle_map.within(tile[0], tile[1], 0)
+                if self.viewer is None or self.battle_map.tokens[name].owner == self.viewer]
+        if mine:
+            if self.selected in self.token_items:
+                self.canvas.itemconfigure(self.token_items[self.selected][0], outline='white')
+            self.selected = mine[0]
+            self.canvas.itemconfigure(self.token_items[self.selected][0], outline='yellow')
+        elif self.selected and self.on_move:
+            self.on_move(self.selected, *tile)
+
+    def on_right_click(self, event):
+        if self.battle_map is not None:
+            tile = self.tile_at(event)
+            if tile:
+                self.on_toggle(*tile)
@@ -0,0 +1,276 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+PREFIX = 'dnd_'
+# Histogram upper bounds: seconds from 10 us to 2.5 s, bytes from 64 B to 1 MB, and queue depths
+TIME_BUCKETS = (1e-5, 2.5e-5, 1e-4, 2.5e-4, 1e-3, 2.5e-3, 1e-2, 2.5e-2, 0.1, 0.25, 1.0, 2.5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+SNAPSHOT_INTERVAL = 10.0
+PROFILE_INTERVAL = 0.005
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bound plus the overflow slot, not cumulative until exported
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Span:
+    __slots__ = ('metrics', 'key', 'start')
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics._observe(self.key, time.perf_counter() - self.start, TIME_BUCKETS)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class Metrics:
+    # Every call returns straight away while disabled. Finer-grained functions (model serialization, dice)
+    # aren't touched at all until enable() wraps them.
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        # (name, sorted label pairs) -> value or Histogram
+        self.counters = {}
+        self.histograms = {}
+        self.patched = []
+
+    def count(self, name, value=1, /, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, /, **labels):
+        if self.enabled:
+            self._observe((name, tuple(sorted(labels.items()))), value, buckets)
+
+    def _observe(self, key, value, buckets):
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def span(self, name, /, **labels):
+        # with metrics.span('dispatch_seconds', type=msg_type): ...
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, (name, tuple(sorted(labels.items()))))
+
+    def timed(self, function, name, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._observe(key, time.perf_counter() - start, TIME_BUCKETS)
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    def patch(self, owner, attribute, name, /, **labels):
+        # Swaps a module function or class method for a timed one until disable()
+        original = owner.__dict__[attribute]
+        if isinstance(original, classmethod):
+            replacement = classmethod(self.timed(original.__func__, name, **labels))
+        else:
+            replacement = self.timed(original, name, **labels)
+        setattr(owner, attribute, replacement)
+        self.patched.append((owner, attribute, original))
+
+    def enable(self):
+        if self.enabled:
+            return
+        import dice
+        import models
+        import utils
+        for cls in (models.Character, models.Enemy, models.Location):
+            for attribute in ('to_dict', 'from_dict', 'to_bytes', 'from_bytes'):
+                self.patch(cls, attribute, 'serialize_seconds', model=cls.__name__, method=attribute)
+        self.patch(dice, 'roll', 'dice_seconds', function='dice.roll')
+        self.patch(utils, 'roll_dice', 'dice_seconds', function='utils.roll_dice')
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        for owner, attribute, original in reversed(self.patched):
+            setattr(owner, attribute, original)
+        self.patched = []
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'time': time.time(),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self.counters.items()],
+                'histograms': [{'name': name, 'labels': dict(labels), 'buckets': list(histogram.bounds), 'counts': list(histogram.counts),
+                                'sum': histogram.sum, 'count': histogram.count}
+                               for (name, labels), histogram in self.histograms.items()],
+            }
+
+    def prometheus(self):
+        # Text exposition format, counters get the _total suffix and histograms cumulative buckets
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (histogram.bounds, list(histogram.counts), histogram.sum, histogram.count))
+                                for key, histogram in self.histograms.items())
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+        for (name, labels), (bounds, counts, total, count) in histograms:
+            metric = PREFIX + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket in zip(bounds + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+METRICS = Metrics()
+
+def serve(port, host='127.0.0.1'):
+    # Prometheus scrapes http://host:port/metrics, localhost only unless asked otherwise.
+    # http.server pulls in email and ssl, so it is only imported once an exporter is wanted.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = METRICS.prometheus().encode('utf-8'), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(METRICS.snapshot()).encode('utf-8'), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+def write_snapshots(path, interval=SNAPSHOT_INTERVAL):
+    def loop():
+        while True:
+            time.sleep(interval)
+            save_snapshot(path)
+    threading.Thread(target=loop, name='metrics-snapshot', daemon=True).start()
+    atexit.register(save_snapshot, path)
+
+def save_snapshot(path):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(METRICS.snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+class SamplingProfiler:
+    # Samples one thread's stack every interval and counts them in the folded format
+    # ("outer;inner;innermost count" per line) that flamegraph.pl and speedscope read
+    def __init__(self, thread=None, interval=PROFILE_INTERVAL):
+        self.thread_id = (thread or threading.main_thread()).ident
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run, name='profiler', daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def setup_from_environment():
+    # DND_METRICS_PORT serves /metrics, DND_METRICS_FILE writes JSON snapshots and DND_PROFILE
+    # samples the main thread into a folded stack file on exit. Nothing is enabled without them.
+    port = os.environ.get('DND_METRICS_PORT')
+    path = os.environ.get('DND_METRICS_FILE')
+    profile = os.environ.get('DND_PROFILE')
+    if port or path:
+        METRICS.enable()
+    if port:
+        serve(int(port))
+    if path:
+        write_snapshots(path)
+    if profile:
+        profiler = SamplingProfiler()
+        profiler.start()
+        atexit.register(profiler.dump, profile)
@@ -1,53 +1,255 @@
-import json
-
-class Character:
-    def __init__(self, name, race, class_type, level=1):
-        self.name = name
-        self.race = race
-        self.class_type = class_type
-        self.level = level
-        self.stats = {'STR': 10, 'DEX': 10, 'CON': 10, 'INT': 10, 'WIS': 10, 'CHA': 10}
-        self.hp = 10
-        self.mp = 10
-        self.ac = 10
-        self.special_skills = []
-
-    def to_json(self):
-        return json.dumps(self.__dict__)
-
-class Encounter:
-    def __init__(self, name):
-        self.name = name
-        self.characters = []
-        self.initiative = []
-
-    def add_character(self, character):
-        self.characters.append(character)
-
-    def to_json(self):
-        return json.dumps({'name': self.name, 'characters': [c.__dict__ for c in self.characters]})
-
-class Enemy:
-    def __init__(self, name, enemy_type, level=1, hp=10, ac=10, description=""):
-        self.name = name
-        self.enemy_type = enemy_type
-        self.level = level
-        self.hp = hp
-        self.ac = ac
-        self.description = description
-        self.stats = {'STR': 10, 'DEX': 10, 'CON': 10, 'INT': 10, 'WIS': 10, 'CHA': 10}
-        self.special_abilities = []
-
-    def to_json(self):
-        return json.dumps(self.__dict__)
-
-class Location:
-    def __init__(self, name, location_type, description="", npcs=None, points_of_interest=None):
-        self.name = name
-        self.location_type = location_type
-        self.description = description
-        self.npcs = npcs or []
-        self.points_of_interest = points_of_interest or []
-
-    def to_json(self):
-        return json.dumps(self.__dict__)
+import json
+import struct
+from array import array
+from collections.abc import MutableMapping
+
+STATS = ('STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA')
+STAT_INDEX = {stat: i for i, stat in enumerate(STATS)}
+DEFAULT_STATS = array('h', [10] * len(STATS))
+
+STR_LENGTH = struct.Struct('<I')
+LIST_COUNT = struct.Struct('<H')
+CHARACTER_STRUCT = struct.Struct('<iiii6h')
+ENEMY_STRUCT = struct.Struct('<iii6h')
+
+class Stats(MutableMapping):
+    # The six ability scores in one fixed-order array instead of a dict per entity
+    __slots__ = ('values',)
+
+    def __init__(self, values=None):
+        self.values = array('h', DEFAULT_STATS)
+        if values is not None:
+            self.update(values)
+
+    def __getitem__(self, stat):
+        return self.values[STAT_INDEX[stat]]
+
+    def __setitem__(self, stat, value):
+        self.values[STAT_INDEX[stat]] = value
+
+    def __delitem__(self, stat):
+        raise TypeError("Ability scores can't be removed")
+
+    def __contains__(self, stat):
+        return stat in STAT_INDEX
+
+    def __iter__(self):
+        return iter(STATS)
+
+    def __len__(self):
+        return len(STATS)
+
+    def update(self, values=(), **kwargs):
+        # Writes straight into the array, skipping MutableMapping's generic path
+        scores = self.values
+        for stat, value in (values.items() if hasattr(values, 'items') else values):
+            scores[STAT_INDEX[stat]] = value
+        for stat, value in kwargs.items():
+            scores[STAT_INDEX[stat]] = value
+
+    def __repr__(self):
+        return repr(dict(zip(STATS, self.values)))
+
+    def to_dict(self):
+        return dict(zip(STATS, self.values))
+
+def _pack_strings(out, *strings):
+    for value in strings:
+        data = value.encode('utf-8')
+        out += STR_LENGTH.pack(len(data))
+        out += data
+
+def _pack_list(out, items):
+    out += LIST_COUNT.pack(len(items))
+    _pack_strings(out, *items)
+
+def _unpack_strings(view, offset, count):
+    strings = []
+    for _ in range(count):
+        (length,) = STR_LENGTH.unpack_from(view, offset)
+        offset += STR_LENGTH.size
+        strings.append(str(view[offset:offset + length], 'utf-8'))
+        offset += length
+    return strings, offset
+
+def _unpack_list(view, offset):
+    (count,) = LIST_COUNT.unpack_from(view, offset)
+    return _unpack_strings(view, offset + LIST_COUNT.size, count)
+
+class Character:
+    __slots__ = ('name', 'race', 'class_type', 'level', '_stats', 'hp', 'mp', 'ac', 'special_skills')
+
+    def __init__(self, name, race, class_type, level=1):
+        self.name = name
+        self.race = race
+        self.class_type = class_type
+        self.level = level
+        self._stats = Stats()
+        self.hp = 10
+        self.mp = 10
+        self.ac = 10
+        self.special_skills = []
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @stats.setter
+    def stats(self, values):
+        # Assignment replaces, abilities missing from values go back to the default
+        self._stats = Stats(values)
+
+    def to_dict(self):
+        return {'name': self.name, 'race': self.race, 'class_type': self.class_type, 'level': self.level,
+                'stats': self._stats.to_dict(), 'hp': self.hp, 'mp': self.mp, 'ac': self.ac,
+                'special_skills': list(self.special_skills)}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def to_bytes(self):
+        out = bytearray(CHARACTER_STRUCT.pack(self.level, self.hp, self.mp, self.ac, *self._stats.values))
+        _pack_strings(out, self.name, self.race, self.class_type)
+        _pack_list(out, self.special_skills)
+        return bytes(out)
+
+    @classmethod
+    def from_dict(cls, data):
+        character = cls(data['name'], data['race'], data['class_type'], data.get('level', 1))
+        character.stats.update(data.get('stats', {}))
+        character.hp = data.get('hp', 10)
+        character.mp = data.get('mp', 10)
+        character.ac = data.get('ac', 10)
+        character.special_skills = list(data.get('special_skills', []))
+        return character
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    @classmethod
+    def from_bytes(cls, data):
+        view = memoryview(data)
+        fields = CHARACTER_STRUCT.unpack_from(view)
+        (name, race, class_type), offset = _unpack_strings(view, CHARACTER_STRUCT.size, 3)
+        character = cls(name, race, class_type, fields[0])
+        character.hp, character.mp, character.ac = fields[1:4]
+        character._stats.values = array('h', fields[4:])
+        character.special_skills, _ = _unpack_list(view, offset)
+        return character
+
+class Encounter:
+    def __init__(self, name):
+        self.name = name
+        self.characters = []
+        self.enemies = []
+        self.initiative = []
+
+    def add_character(self, character):
+        self.characters.append(character)
+
+    def add_enemy(self, enemy):
+        self.enemies.append(enemy)
+
+    def to_json(self):
+        return json.dumps({'name': self.name, 'characters': [c.to_dict() for c in self.characters],
+                           'enemies': [e.to_dict() for e in self.enemies]})
+
+class Enemy:
+    __slots__ = ('name', 'enemy_type', 'level', 'hp', 'ac', 'description', '_stats', 'special_abilities')
+
+    def __init__(self, name, enemy_type, level=1, hp=10, ac=10, description=""):
+        self.name = name
+        self.enemy_type = enemy_type
+        self.level = level
+        self.hp = hp
+        self.ac = ac
+        self.description = description
+        self._stats = Stats()
+        self.special_abilities = []
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @stats.setter
+    def stats(self, values):
+        # Assignment replaces, abilities missing from values go back to the default
+        self._stats = Stats(values)
+
+    def to_dict(self):
+        return {'name': self.name, 'enemy_type': self.enemy_type, 'level': self.level, 'hp': self.hp,
+                'ac': self.ac, 'description': self.description, 'stats': self._stats.to_dict(),
+                'special_abilities': list(self.special_abilities)}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def to_bytes(self):
+        out = bytearray(ENEMY_STRUCT.pack(self.level, self.hp, self.ac, *self._stats.values))
+        _pack_strings(out, self.name, self.enemy_type, self.description)
+        _pack_list(out, self.special_abilities)
+        return bytes(out)
+
+    @classmethod
+    def from_dict(cls, data):
+        enemy = cls(data['name'], data['enemy_type'], data.get('level', 1), data.get('hp', 10), data.get('ac', 10), data.get('description', ""))
+        enemy.stats.update(data.get('stats', {}))
+        enemy.special_abilities = list(data.get('special_abilities', []))
+        return enemy
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    @classmethod
+    def from_bytes(cls, data):
+        view = memoryview(data)
+        fields = ENEMY_STRUCT.unpack_from(view)
+        (name, enemy_type, description), offset = _unpack_strings(view, ENEMY_STRUCT.size, 3)
+        enemy = cls(name, enemy_type, fields[0], fields[1], fields[2], description)
+        enemy._stats.values = array('h', fields[3:])
+        enemy.special_abilities, _ = _unpack_list(view, offset)
+        return enemy
+
+class Location:
+    __slots__ = ('name', 'location_type', 'description', 'npcs', 'points_of_interest', 'battle_map')
+
+    def __init__(self, name, location_type, description="", npcs=None, points_of_interest=None, battle_map=None):
+        self.name = name
+        self.location_type = location_type
+        self.description = description
+        self.npcs = npcs or []
+        self.points_of_interest = points_of_interest or []
+        # Optional battle_map.BattleMap, sent on its own as MAP_DATA so location updates stay small
+        self.battle_map = battle_map
+
+    def to_dict(self):
+        return {'name': self.name, 'location_type': self.location_type, 'description': self.description,
+                'npcs': list(self.npcs), 'points_of_interest': list(self.points_of_interest)}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def to_bytes(self):
+        out = bytearray()
+        _pack_strings(out, self.name, self.location_type, self.description)
+        _pack_list(out, self.npcs)
+        _pack_list(out, self.points_of_interest)
+        return bytes(out)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['location_type'], data.get('description', ""), list(data.get('npcs', [])), list(data.get('points_of_interest', [])))
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    @classmethod
+    def from_bytes(cls, data):
+        view = memoryview(data)
+        (name, location_type, description), offset = _unpack_strings(view, 0, 3)
+        npcs, offset = _unpack_list(view, offset)
+        points_of_interest, _ = _unpack_list(view, offset)
+        return cls(name, location_type, description, npcs, points_of_interest)
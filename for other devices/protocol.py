@@ -0,0 +1,410 @@
+import json
+import re
+import struct
+import zlib
+from models import Character, Enemy, Location
+
+PROTOCOL_VERSION = 1
+# 0xFF and 0xFE never start a UTF-8 string, so binary frames can't be confused with text
+BINARY_MAGIC = 0xFF
+SEQUENCED_MAGIC = 0xFE
+# A compressed frame is this byte followed by the deflated frame
+COMPRESSED_MAGIC = 0xFD
+COMPRESS_THRESHOLD = 512
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+HELLO = 'hello'
+CHAT = 'chat'
+PLAYER_DATA = 'player_data'
+ENEMY_DATA = 'enemy_data'
+LOCATION_DATA = 'location_data'
+EDIT = 'edit'
+STAT_UPDATE = 'stat_update'
+SESSION = 'session'
+RESUME = 'resume'
+PATCH = 'patch'
+SNAPSHOT_REQUEST = 'snapshot_request'
+INITIATIVE = 'initiative'
+INITIATIVE_REMOVE = 'initiative_remove'
+TURN = 'turn'
+EDIT_BATCH = 'edit_batch'
+STAT_BATCH = 'stat_batch'
+MAP_DATA = 'map_data'
+TOKEN_PLACE = 'token_place'
+TOKEN_MOVE = 'token_move'
+TOKEN_REMOVE = 'token_remove'
+TILE_SET = 'tile_set'
+SUBSCRIBE = 'subscribe'
+WHISPER = 'whisper'
+
+STATS = ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA']
+
+# Field layout of each message type, used by the binary encoding
+SCHEMAS = {
+    HELLO: [('version', 'int')],
+    CHAT: [('text', 'str')],
+    PLAYER_DATA: [('name', 'str'), ('race', 'str'), ('class_type', 'str'), ('level', 'int'), ('hp', 'int'),
+                  ('mp', 'int'), ('ac', 'int'), ('stats', 'stats'), ('special_skills', 'list'), ('rev', 'int')],
+    ENEMY_DATA: [('name', 'str'), ('enemy_type', 'str'), ('level', 'int'), ('hp', 'int'), ('ac', 'int'),
+                 ('description', 'str'), ('stats', 'stats'), ('special_abilities', 'list'), ('rev', 'int')],
+    LOCATION_DATA: [('name', 'str'), ('location_type', 'str'), ('description', 'str'), ('npcs', 'list'),
+                    ('points_of_interest', 'list'), ('rev', 'int')],
+    EDIT: [('name', 'str'), ('stat', 'str'), ('value', 'int')],
+    STAT_UPDATE: [('name', 'str'), ('stat', 'str'), ('value', 'int')],
+    SESSION: [('token', 'str'), ('seq', 'int'), ('resumed', 'int')],
+    RESUME: [('token', 'str'), ('last_seq', 'int')],
+    PATCH: [('kind', 'str'), ('name', 'str'), ('base', 'int'), ('rev', 'int'), ('fields', 'json')],
+    SNAPSHOT_REQUEST: [('kind', 'str'), ('name', 'str')],
+    INITIATIVE: [('name', 'str'), ('roll', 'int'), ('dex', 'int')],
+    INITIATIVE_REMOVE: [('name', 'str')],
+    TURN: [('name', 'str'), ('round', 'int')],
+    EDIT_BATCH: [('edits', 'json')],
+    STAT_BATCH: [('updates', 'json')],
+    MAP_DATA: [('location', 'str'), ('width', 'int'), ('height', 'int'), ('tiles', 'str'), ('tokens', 'json')],
+    TOKEN_PLACE: [('location', 'str'), ('name', 'str'), ('x', 'int'), ('y', 'int'), ('owner', 'str'), ('sight', 'int')],
+    TOKEN_MOVE: [('location', 'str'), ('name', 'str'), ('x', 'int'), ('y', 'int')],
+    TOKEN_REMOVE: [('location', 'str'), ('name', 'str')],
+    TILE_SET: [('location', 'str'), ('x', 'int'), ('y', 'int'), ('tile', 'str')],
+    SUBSCRIBE: [('topics', 'json')],
+    WHISPER: [('sender', 'str'), ('target', 'str'), ('text', 'str')],
+}
+# What each 'json' field must hold: its container type and the type of every item in it. Items given as a message
+# type are checked against that type's schema.
+JSON_FIELDS = {
+    'fields': (dict, None),
+    'edits': (list, dict),
+    'updates': (list, STAT_UPDATE),
+    'tokens': (list, list),
+    'topics': (list, None),
+}
+# Tags are positions in SCHEMAS, so new types must only ever be appended
+TYPE_TAGS = {msg_type: tag for tag, msg_type in enumerate(SCHEMAS)}
+TAG_TYPES = list(SCHEMAS)
+# Entity state can wait behind interactive traffic, everything else is sent first
+BULK_TYPES = {PLAYER_DATA, ENEMY_DATA, LOCATION_DATA, PATCH, MAP_DATA}
+
+# Preset deflate dictionary of what our messages are made of, so even short descriptions compress.
+# zlib favours matches near the end, so the most common strings come last.
+# Changing it breaks compatibility with every deployed client.
+COMPRESSION_DICTIONARY = ' '.join([
+    "the a an of and to in is it that with for on as at by from his her their they them you your this there which",
+    "ancient dark stone forest cave dungeon castle tower village city tavern inn temple ruins crypt tomb swamp river",
+    "mountain road bridge gate door wall hall chamber room corridor stairs torch shadow light fire water ice wind",
+    "dragon goblin orc troll skeleton zombie wolf bandit cultist giant spider undead demon devil beast creature",
+    "sword axe bow arrow shield armor spell magic potion scroll gold coins treasure chest altar throne statue",
+    "attack damage hit points saving throw roll initiative turn round advantage disadvantage check",
+    "small large huge sneaky cunning vicious fierce old abandoned hidden secret cold damp smell sound",
+    "Strength Dexterity Constitution Intelligence Wisdom Charisma Fighter Wizard Rogue Cleric Ranger Paladin",
+    "Human Elf Dwarf Halfling Gnome Half-Elf Half-Orc Tiefling Dragonborn Humanoid NPC npcs points_of_interest",
+    '"special_abilities":[],"special_skills":[],"description":"',
+    '"stats":{"STR":10,"DEX":10,"CON":10,"INT":10,"WIS":10,"CHA":10},',
+    '{"v":1,"t":"location_data","d":{"name":"',
+    '"location_type":"',
+    '{"v":1,"t":"enemy_data","d":{"name":"',
+    '"enemy_type":"',
+    '"level":1,"hp":10,"ac":10,"rev":1',
+    '{"v":1,"t":"chat","d":{"text":"DM: ',
+]).encode('utf-8')
+
+# Channels the server sorts broadcasts into. A client that subscribes only gets the channels it names,
+# one that never does gets everything as before, except whispers.
+TABLE_TOPIC = 'table'
+COMBAT_TOPIC = 'combat'
+DM_TOPIC = 'dm'
+# Every player's private channel, for the DM
+PLAYER_TOPICS = 'player:*'
+DM_NAME = 'DM'
+
+MODEL_TYPES = {Character: PLAYER_DATA, Enemy: ENEMY_DATA, Location: LOCATION_DATA}
+TYPE_MODELS = {msg_type: model for model, msg_type in MODEL_TYPES.items()}
+
+LEGACY_INITIATIVE = re.compile(r"(.+) rolled a (\d+) for initiative\.$")
+EDIT_OPS = ('=', '+=', '-=')
+EDIT_TERM = re.compile(r"\s*(\w+)\s*([+-]?=)\s*(-?\d+)\s*$")
+WHISPER_COMMAND = re.compile(r"/w\s+([^:]+?)\s*:\s*(.+)$", re.DOTALL)
+
+HEADER = struct.Struct('>BBB')
+SEQ = struct.Struct('>I')
+INT = struct.Struct('>i')
+LENGTH = struct.Struct('>I')
+COUNT = struct.Struct('>H')
+STAT_BLOCK = struct.Struct('>6h')
+# Ranges the binary layout can carry
+INT_RANGE = range(-2 ** 31, 2 ** 31)
+STAT_RANGE = range(-2 ** 15, 2 ** 15)
+MAX_ITEMS = 0xFFFF
+
+class ProtocolError(Exception):
+    pass
+
+def check_payload(msg_type, payload):
+    # Everything decoded is checked against its schema, so handlers can index a payload without guarding
+    # and anything accepted can be re-encoded in binary for the journal
+    if not isinstance(payload, dict):
+        raise ProtocolError(f"{msg_type} payload is not an object")
+    for field, kind in SCHEMAS[msg_type]:
+        if field not in payload:
+            raise ProtocolError(f"{msg_type} is missing {field!r}")
+        value = payload[field]
+        if kind == 'int':
+            valid = isinstance(value, int) and value in INT_RANGE
+        elif kind == 'str':
+            valid = isinstance(value, str)
+        elif kind == 'stats':
+            valid = isinstance(value, dict) and all(isinstance(value.get(stat), int) and value[stat] in STAT_RANGE for stat in STATS)
+        elif kind == 'list':
+            valid = isinstance(value, list) and len(value) <= MAX_ITEMS and all(isinstance(item, str) for item in value)
+        else:
+            container, item_type = JSON_FIELDS.get(field, (object, None))
+            valid = isinstance(value, container)
+            if valid and item_type in SCHEMAS:
+                for item in value:
+                    check_payload(item_type, item)
+            elif valid and item_type:
+                valid = all(isinstance(item, item_type) for item in value)
+        if not valid:
+            raise ProtocolError(f"{msg_type} has a bad {field!r}: {value!r:.80}")
+
+def player_topic(name):
+    # A player's sheet and stat changes, seen by them and the DM
+    return 'player:' + name
+
+def whisper_topic(name):
+    return 'whisper:' + name
+
+def model_message(model, rev=0):
+    payload = model.to_dict()
+    payload['rev'] = rev
+    return MODEL_TYPES[type(model)], payload
+
+def message_model(msg_type, payload):
+    return TYPE_MODELS[msg_type].from_dict(payload)
+
+def compress_frame(frame):
+    compressor = zlib.compressobj(6, zdict=COMPRESSION_DICTIONARY)
+    return bytes((COMPRESSED_MAGIC,)) + compressor.compress(frame) + compressor.flush()
+
+def decompress_frame(frame):
+    decompressor = zlib.decompressobj(zdict=COMPRESSION_DICTIONARY)
+    try:
+        data = decompressor.decompress(memoryview(frame)[1:], MAX_DECOMPRESSED_SIZE)
+    except zlib.error as e:
+        raise ProtocolError(f"Bad compressed frame: {e}")
+    if decompressor.unconsumed_tail:
+        raise ProtocolError("Compressed frame expands past the size limit")
+    return data
+
+def _pack_str(out, value):
+    data = value.encode('utf-8')
+    out += LENGTH.pack(len(data))
+    out += data
+
+def encode_binary(msg_type, payload, seq=None):
+    if seq is None:
+        out = bytearray(HEADER.pack(BINARY_MAGIC, PROTOCOL_VERSION, TYPE_TAGS[msg_type]))
+    else:
+        out = bytearray(HEADER.pack(SEQUENCED_MAGIC, PROTOCOL_VERSION, TYPE_TAGS[msg_type]))
+        out += SEQ.pack(seq)
+    for field, kind in SCHEMAS[msg_type]:
+        value = payload[field]
+        if kind == 'int':
+            out += INT.pack(value)
+        elif kind == 'str':
+            _pack_str(out, value)
+        elif kind == 'json':
+            _pack_str(out, json.dumps(value, separators=(',', ':')))
+        elif kind == 'stats':
+            out += STAT_BLOCK.pack(*(value[stat] for stat in STATS))
+        else:
+            out += COUNT.pack(len(value))
+            for item in value:
+                _pack_str(out, item)
+    return bytes(out)
+
+def decode_binary(frame):
+    view = memoryview(frame)
+    magic, version, tag = HEADER.unpack_from(view)
+    if tag >= len(TAG_TYPES):
+        raise ProtocolError(f"Unknown message tag {tag} (protocol version {version})")
+    msg_type = TAG_TYPES[tag]
+    offset = HEADER.size
+    seq = None
+    payload = {}
+    try:
+        if magic == SEQUENCED_MAGIC:
+            (seq,) = SEQ.unpack_from(view, offset)
+            offset += SEQ.size
+        for field, kind in SCHEMAS[msg_type]:
+            if kind == 'int':
+                (payload[field],) = INT.unpack_from(view, offset)
+                offset += INT.size
+            elif kind == 'str':
+                payload[field], offset = _unpack_str(view, offset)
+            elif kind == 'json':
+                text, offset = _unpack_str(view, offset)
+                payload[field] = json.loads(text)
+            elif kind == 'stats':
+                payload[field] = dict(zip(STATS, STAT_BLOCK.unpack_from(view, offset)))
+                offset += STAT_BLOCK.size
+            else:
+                (count,) = COUNT.unpack_from(view, offset)
+                offset += COUNT.size
+                items = []
+                for _ in range(count):
+                    item, offset = _unpack_str(view, offset)
+                    items.append(item)
+                payload[field] = items
+    except (struct.error, ValueError) as e:
+        raise ProtocolError(f"Malformed {msg_type} frame: {e}")
+    return seq, msg_type, payload
+
+def _unpack_str(view, offset):
+    (length,) = LENGTH.unpack_from(view, offset)
+    offset += LENGTH.size
+    if offset + length > len(view):
+        raise struct.error("string runs past end of frame")
+    return str(view[offset:offset + length], 'utf-8'), offset + length
+
+def encode_json(msg_type, payload, seq=None):
+    envelope = {'v': PROTOCOL_VERSION, 't': msg_type, 'd': payload}
+    if seq is not None:
+        envelope['s'] = seq
+    return json.dumps(envelope, separators=(',', ':')).encode('utf-8')
+
+def to_legacy(msg_type, payload):
+    # Renders a message in the original space separated text protocol
+    if msg_type == CHAT:
+        return payload['text']
+    if msg_type == PLAYER_DATA:
+        stats_str = ' '.join(str(payload['stats'][s]) for s in STATS)
+        skills_str = ','.join(payload['special_skills'])
+        return (f"PLAYER_DATA {payload['name']} {payload['race']} {payload['class_type']} {payload['level']} "
+                f"{payload['hp']} {payload['mp']} {stats_str} {skills_str}")
+    if msg_type == ENEMY_DATA:
+        return (f"ENEMY_DATA {payload['name']} {payload['enemy_type']} {payload['level']} {payload['hp']} "
+                f"{payload['ac']} {payload['description'].replace(' ', '_')}")
+    if msg_type == LOCATION_DATA:
+        return f"LOCATION_DATA {payload['name']} {payload['location_type']} {payload['description'].replace(' ', '_')}"
+    if msg_type == EDIT:
+        return f"/edit_{payload['stat']} {payload['name']} {payload['value']}"
+    if msg_type == STAT_UPDATE:
+        return f"DM updated {payload['name']}'s {payload['stat']} to {payload['value']}"
+    if msg_type == INITIATIVE:
+        return f"{payload['name']} rolled a {payload['roll']} for initiative."
+    if msg_type == INITIATIVE_REMOVE:
+        return f"{payload['name']} is out of the fight."
+    if msg_type == TURN:
+        return f"Round {payload['round']}: {payload['name']}'s turn."
+    if msg_type == STAT_BATCH:
+        return '\n'.join(to_legacy(STAT_UPDATE, update) for update in payload['updates'])
+    return None
+
+def parse_edit_command(text):
+    # "/edit Aria, Borin: hp -= 14, mp -= 2; Cleo: hp += 5" -> one edit per target and stat
+    edits = []
+    for group in text[len("/edit "):].split(';'):
+        if not group.strip():
+            continue
+        names, separator, terms = group.partition(':')
+        names = [name.strip() for name in names.split(',') if name.strip()]
+        if not separator or not names:
+            raise ProtocolError(f"Expected 'names: stat op value' in {group.strip()!r}")
+        for term in terms.split(','):
+            match = EDIT_TERM.match(term)
+            if not match:
+                raise ProtocolError(f"Can't read {term.strip()!r}, expected something like 'hp -= 14'")
+            stat, op, value = match.groups()
+            edits += [{'name': name, 'stat': stat.lower(), 'op': op, 'value': int(value)} for name in names]
+    if not edits:
+        raise ProtocolError("Nothing to edit")
+    return edits
+
+def parse_whisper(text):
+    # "/w Player 2: meet me behind the inn" -> (target, text)
+    match = WHISPER_COMMAND.match(text.strip())
+    if not match:
+        raise ProtocolError("Expected '/w name: message'")
+    return match.group(1), match.group(2)
+
+def parse_legacy(text):
+    # Compatibility shim for clients that still speak the text protocol
+    parts = text.split()
+    try:
+        if text.startswith("PLAYER_DATA") and len(parts) >= 13:
+            character = Character(parts[1], parts[2], parts[3], int(parts[4]))
+            character.hp = int(parts[5])
+            character.mp = int(parts[6])
+            character.stats = {stat: int(value) for stat, value in zip(STATS, parts[7:13])}
+            skills_str = ' '.join(parts[13:])
+            character.special_skills = skills_str.split(',') if skills_str else []
+            return model_message(character)
+        if text.startswith("ENEMY_DATA") and len(parts) >= 6:
+            description = ' '.join(parts[6:]).replace('_', ' ')
+            return model_message(Enemy(parts[1], parts[2], int(parts[3]), int(parts[4]), int(parts[5]), description))
+        if text.startswith("LOCATION_DATA") and len(parts) >= 3:
+            description = ' '.join(parts[3:]).replace('_', ' ')
+            return model_message(Location(parts[1], parts[2], description))
+        if text.startswith("/edit_") and len(parts) >= 3:
+            return EDIT, {'name': ' '.join(parts[1:-1]), 'stat': parts[0][len("/edit_"):].lower(), 'value': int(parts[-1])}
+        if text.startswith("DM updated") and len(parts) >= 6 and parts[2].endswith("'s"):
+            return STAT_UPDATE, {'name': parts[2][:-2], 'stat': parts[3], 'value': int(parts[5])}
+        if text.startswith("/edit "):
+            return EDIT_BATCH, {'edits': parse_edit_command(text)}
+        match = LEGACY_INITIATIVE.match(text)
+        if match:
+            # Old clients only announce the roll, they don't know their DEX
+            return INITIATIVE, {'name': match.group(1), 'roll': int(match.group(2)), 'dex': 10}
+    except (ValueError, ProtocolError):
+        pass
+    return CHAT, {'text': text}
+
+class MessageCodec:
+    def __init__(self, binary=False, compress_threshold=COMPRESS_THRESHOLD):
+        self.binary = binary
+        self.compress_threshold = compress_threshold
+
+    def encode(self, msg_type, payload, seq=None):
+        if self.binary:
+            frame = encode_binary(msg_type, payload, seq)
+        else:
+            frame = encode_json(msg_type, payload, seq)
+        if self.compress_threshold is not None and len(frame) > self.compress_threshold:
+            compressed = compress_frame(frame)
+            if len(compressed) < len(frame):
+                return compressed
+        return frame
+
+    def decode(self, frame):
+        return self.decode_sequenced(frame)[1:]
+
+    def decode_sequenced(self, frame):
+        # Returns (seq, msg_type, payload), seq is None for unsequenced frames
+        if frame and frame[0] == COMPRESSED_MAGIC:
+            frame = decompress_frame(frame)
+        if not frame:
+            return None, CHAT, {'text': ''}
+        if frame[0] in (BINARY_MAGIC, SEQUENCED_MAGIC):
+            seq, msg_type, payload = decode_binary(frame)
+        else:
+            envelope = _envelope(frame) if frame[:1] == b'{' else None
+            if envelope:
+                seq, msg_type, payload = envelope.get('s'), envelope['t'], envelope.get('d')
+                if seq is not None and not (isinstance(seq, int) and seq >= 0):
+                    raise ProtocolError(f"Bad sequence number {seq!r:.20}")
+            else:
+                try:
+                    seq, (msg_type, payload) = None, parse_legacy(bytes(frame).decode('utf-8'))
+                except UnicodeDecodeError:
+                    raise ProtocolError("Frame is neither structured nor UTF-8 text")
+        check_payload(msg_type, payload)
+        return seq, msg_type, payload
+
+def _envelope(frame):
+    # The JSON envelope of a structured frame, None if this is text that happens to start with a brace
+    try:
+        envelope = json.loads(frame)
+    except ValueError:
+        return None
+    if isinstance(envelope, dict) and envelope.get('t') in SCHEMAS:
+        return envelope
+    return None
@@ -0,0 +1,4 @@
+@echo off
+echo Starting D&D Campaign Server...
+python server.py
+pause
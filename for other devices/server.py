@@ -0,0 +1,522 @@
+import argparse
+import asyncio
+import secrets
+from collections import OrderedDict, deque
+from utils import setup_logging, log_event
+from framing import encode_frame, message_frames, FrameDecoder, FrameError, SendQueue, CHUNK_SIZE
+from protocol import (MessageCodec, ProtocolError, to_legacy, HELLO, SESSION, RESUME, CHAT, PLAYER_DATA, ENEMY_DATA, EDIT, STAT_UPDATE, PATCH,
+                      SNAPSHOT_REQUEST, EDIT_BATCH, STAT_BATCH, EDIT_OPS, BULK_TYPES, INITIATIVE, INITIATIVE_REMOVE, TURN, SUBSCRIBE, WHISPER,
+                      TABLE_TOPIC, COMBAT_TOPIC, DM_TOPIC, PLAYER_TOPICS, DM_NAME, player_topic, whisper_topic)
+from state_sync import TableState, stat_value, stat_fits, EDITABLE_STATS
+from journal import Journal, room_path, SNAPSHOT_INTERVAL, FLUSH_INTERVAL
+from metrics import METRICS, SIZE_BUCKETS, COUNT_BUCKETS, setup_from_environment
+
+COMBAT_TYPES = {INITIATIVE, INITIATIVE_REMOVE, TURN}
+MAX_TOPICS = 64
+
+def subscribed(topics, topic):
+    return topic in topics or topic.partition(':')[0] + ':*' in topics
+
+def dm_only(topic):
+    # The DM's own channels and every player's, whoever subscribes to them gets the DM seat or nothing
+    return topic in (DM_TOPIC, PLAYER_TOPICS, whisper_topic(DM_NAME))
+
+def visible(topics, msg_type, payload, topic):
+    # The part of a message a client subscribed to topics gets, None if it gets nothing
+    if topics is None:
+        # Legacy clients still see every sheet as they always did, but never a whisper or what is meant for the DM
+        return None if msg_type == WHISPER or topic == DM_TOPIC else payload
+    if msg_type == STAT_BATCH:
+        # One topic per update, a player only hears about their own
+        updates = [update for update, update_topic in zip(payload['updates'], topic) if subscribed(topics, update_topic)]
+        if len(updates) == len(payload['updates']):
+            return payload
+        return {'updates': updates} if updates else None
+    return payload if subscribed(topics, topic) else None
+
+class ClientConnection:
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        # A small transport buffer, otherwise bulk chunks pile up in it ahead of urgent frames
+        writer.transport.set_write_buffer_limits(high=CHUNK_SIZE * 4)
+        self.queue = SendQueue(queue_size)
+        self.ready = asyncio.Event()
+        self.room = None
+        # Clients that never say HELLO are sent the legacy text protocol
+        self.structured = False
+        self.token = None
+        # Topics from the client's SUBSCRIBE, None until it sends one, and those of them its room lets it have
+        self.requested = None
+        self.topics = None
+        self.closed = False
+        self.write_task = None
+
+    def push(self, frames, urgent=True):
+        if not self.queue.push(frames, urgent):
+            return False
+        self.ready.set()
+        return True
+
+    async def write_loop(self):
+        try:
+            while True:
+                await self.ready.wait()
+                # Urgent frames that piled up go out as one write, bulk messages one chunk per write
+                data = self.queue.peek()
+                if data is None:
+                    self.ready.clear()
+                    continue
+                self.queue.commit()
+                METRICS.observe('write_bytes', len(data), SIZE_BUCKETS)
+                self.writer.write(data)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.write_task:
+            self.write_task.cancel()
+        self.writer.close()
+
+class Room:
+    def __init__(self, name, codec, history_size, journal=None):
+        self.name = name
+        self.codec = codec
+        self.clients = set()
+        self.table = TableState()
+        self.seq = 0
+        # Recent broadcasts kept so a reconnecting client can catch up
+        self.history = deque(maxlen=history_size)
+        self.expiry = None
+        # Session token holding the DM seat, and the token that published each player, so private channels stay private
+        self.dm = None
+        self.owners = {}
+        # Every broadcast is journaled, so the table survives a server restart
+        self.journal = journal
+        if journal:
+            self.table, self.seq = journal.recover()
+
+    def broadcast(self, msg_type, payload, exclude=None, legacy=None, record=None):
+        # record is the message's journal record from journal_record(), made before the table changed
+        with METRICS.span('broadcast_seconds', type=msg_type):
+            self._broadcast(msg_type, payload, exclude, legacy, record)
+        METRICS.count('messages_sent', type=msg_type)
+        METRICS.observe('broadcast_fanout', len(self.clients), COUNT_BUCKETS)
+
+    def topic(self, msg_type, payload):
+        # The channel a message goes out on, STAT_BATCH gets one per update
+        if msg_type == PLAYER_DATA:
+            return player_topic(payload['name'])
+        if msg_type in (PATCH, SNAPSHOT_REQUEST):
+            if payload['kind'] == PLAYER_DATA:
+                return player_topic(payload['name'])
+            # Only the DM publishes enemies and locations, so only the DM can answer for them
+            return TABLE_TOPIC if msg_type == PATCH else DM_TOPIC
+        if msg_type == STAT_UPDATE:
+            return self.stat_topic(payload['name'])
+        if msg_type == STAT_BATCH:
+            return [self.stat_topic(update['name']) for update in payload['updates']]
+        if msg_type in COMBAT_TYPES:
+            return COMBAT_TOPIC
+        if msg_type == WHISPER:
+            return whisper_topic(payload['target'])
+        return TABLE_TOPIC
+
+    def present(self, token):
+        return any(client.token == token for client in self.clients)
+
+    def is_dm(self, client):
+        return client.token is not None and client.token == self.dm
+
+    def take_dm_seat(self, client):
+        # First come, and held until its session is gone from the room
+        if client.token is None:
+            return False
+        if self.dm is None or self.dm == client.token or not self.present(self.dm):
+            self.dm = client.token
+            return True
+        return False
+
+    def permits(self, client, topic):
+        kind, _, name = topic.partition(':')
+        if name == '*':
+            # No one, not even the DM, hears every whisper
+            return False
+        if kind in ('player', 'whisper'):
+            # Only the channels of a character this session published itself
+            return client.token is not None and self.owners.get(name) == client.token
+        return True
+
+    def authorize(self, client):
+        # Narrows what the client asked for to what it may have here, again whenever its session, room or characters change
+        requested = client.requested
+        if requested is None:
+            client.topics = None
+            return
+        dm = any(dm_only(topic) for topic in requested) and self.take_dm_seat(client)
+        client.topics = frozenset(topic for topic in requested if (dm if dm_only(topic) else self.permits(client, topic)))
+        if len(client.topics) < len(requested):
+            log_event(f"Room {self.name}: refused topics {sorted(requested - client.topics)}")
+
+    def claim_player(self, sender, name):
+        # A character belongs to the session that published it first, while that session is still at the table.
+        # Returns True if sender just became its owner.
+        owner = self.owners.get(name)
+        if owner == sender.token or self.is_dm(sender):
+            return False
+        if owner is not None and self.present(owner):
+            raise ProtocolError(f"{name} belongs to another player")
+        if sender.token is None:
+            return False
+        self.owners[name] = sender.token
+        return True
+
+    def stat_topic(self, name):
+        # A player's numbers are between them and the DM, an enemy taking damage is part of the fight
+        return player_topic(name) if (PLAYER_DATA, name) in self.table.entities else COMBAT_TOPIC
+
+    def encode_for(self, structured, msg_type, payload, legacy=None):
+        if structured:
+            return message_frames(self.codec.encode(msg_type, payload, self.seq), msg_type not in BULK_TYPES)
+        # Text clients don't understand chunks or compression
+        text = legacy or to_legacy(msg_type, payload)
+        return [encode_frame(text)] if text else []
+
+    def journal_record(self, msg_type, payload):
+        # Encoded before the table, seq or history change, so a payload the journal can't hold is refused with the
+        # room untouched and replay always matches what clients saw
+        return self.journal.encode(self.seq + 1, msg_type, payload) if self.journal else None
+
+    def _broadcast(self, msg_type, payload, exclude, legacy, record):
+        if self.journal and record is None:
+            record = self.journal_record(msg_type, payload)
+        topic = self.topic(msg_type, payload)
+        self.seq += 1
+        self.history.append((self.seq, exclude.token if exclude else None, msg_type, payload, topic))
+        if self.journal:
+            self.journal.write(record)
+            if self.journal.due():
+                self.journal.rotate(self.table, self.seq)
+        # Encode at most once per wire format, every recipient of the whole message queues the same frames
+        encoded = {}
+        urgent = msg_type not in BULK_TYPES
+        for client in list(self.clients):
+            if client is exclude:
+                continue
+            view = visible(client.topics, msg_type, payload, topic)
+            if view is None:
+                continue
+            if view is payload:
+                frames = encoded.get(client.structured)
+                if frames is None:
+                    frames = encoded[client.structured] = self.encode_for(client.structured, msg_type, payload, legacy)
+            else:
+                frames = self.encode_for(client.structured, msg_type, view)
+            if not frames:
+                continue
+            if not client.push(frames, urgent):
+                log_event(f"Dropping slow client from room {self.name}")
+                self.remove(client)
+                client.close()
+
+    def remove(self, client):
+        self.clients.discard(client)
+
+    def send_to(self, client, msg_type, payload):
+        if client.structured:
+            urgent = msg_type not in BULK_TYPES
+            client.push(message_frames(self.codec.encode(msg_type, payload), urgent), urgent)
+        else:
+            text = to_legacy(msg_type, payload)
+            if text:
+                client.push([encode_frame(text)], msg_type not in BULK_TYPES)
+
+    def catch_up(self, client):
+        # A newcomer gets the table as it stands instead of waiting for everyone to send again
+        for msg_type, payload in self.table.messages():
+            view = visible(client.topics, msg_type, payload, self.topic(msg_type, payload))
+            if view is not None:
+                self.send_to(client, msg_type, view)
+
+    def missed(self, client, last_seq):
+        # Frames a resuming client hasn't seen, or None if the history no longer covers the gap
+        oldest = self.history[0][0] if self.history else self.seq + 1
+        if last_seq > self.seq or last_seq + 1 < oldest:
+            return None
+        frames = []
+        for seq, origin, msg_type, payload, topic in self.history:
+            if seq > last_seq and origin != client.token:
+                view = visible(client.topics, msg_type, payload, topic)
+                if view is not None:
+                    frames.append(encode_frame(self.codec.encode(msg_type, view, seq)))
+        return frames
+
+    def handle(self, sender, msg_type, payload):
+        if msg_type in (STAT_UPDATE, STAT_BATCH):
+            # Only the server produces these, from edits it has checked
+            raise ProtocolError(f"{msg_type} can't come from a client, send an edit")
+        if msg_type == EDIT:
+            self.apply_edit(payload)
+            return
+        if msg_type == EDIT_BATCH:
+            self.apply_edit_batch(sender, payload['edits'])
+            return
+        if msg_type == SNAPSHOT_REQUEST:
+            entity = self.table.entities.get((payload['kind'], payload['name']))
+            if entity:
+                # The server sees every patch, so it can answer without bothering the owner, if the sender may see it
+                if visible(sender.topics, payload['kind'], entity, self.topic(payload['kind'], entity)) is not None:
+                    self.send_to(sender, payload['kind'], entity)
+                return
+        legacy = None
+        record = self.journal_record(msg_type, payload)
+        claimed = False
+        if msg_type == PLAYER_DATA or msg_type == PATCH and payload['kind'] == PLAYER_DATA:
+            claimed = self.claim_player(sender, payload['name'])
+        self.table.apply(msg_type, payload)
+        if msg_type == PATCH:
+            entity = self.table.entities.get((payload['kind'], payload['name']))
+            if entity:
+                # Legacy clients can't apply patches, they get the whole record instead
+                legacy = to_legacy(payload['kind'], entity)
+        self.broadcast(msg_type, payload, exclude=sender, legacy=legacy, record=record)
+        if claimed:
+            self.authorize(sender)
+
+    def apply_edit(self, edit):
+        stat, player_name, value = edit['stat'], edit['name'], edit['value']
+        if stat not in EDITABLE_STATS or value < 0 or not stat_fits(stat, value) or (PLAYER_DATA, player_name) not in self.table.entities:
+            return
+        update = {'name': player_name, 'stat': stat, 'value': value}
+        record = self.journal_record(STAT_UPDATE, update)
+        self.table.apply(STAT_UPDATE, update)
+        self.broadcast(STAT_UPDATE, update, record=record)
+        log_event(f"Room {self.name}: {player_name}'s {stat} set to {value}")
+
+    def apply_edit_batch(self, sender, edits):
+        # Every edit is checked before any is applied, so a bad target leaves the table untouched
+        values = {}
+        for edit in edits:
+            name, stat, op, amount = edit.get('name'), edit.get('stat'), edit.get('op', '='), edit.get('value')
+            entity = self.table.entities.get((PLAYER_DATA, name)) or self.table.entities.get((ENEMY_DATA, name))
+            if entity is None or stat not in EDITABLE_STATS or op not in EDIT_OPS or not isinstance(amount, int):
+                self.send_to(sender, CHAT, {'text': f"Edit rejected: can't apply {stat} {op} {amount} to {name}"})
+                return
+            key = (name, stat)
+            current = values.get(key, stat_value(entity, stat))
+            if current is None:
+                self.send_to(sender, CHAT, {'text': f"Edit rejected: {name} has no {stat}"})
+                return
+            if op == '+=':
+                current += amount
+            elif op == '-=':
+                current -= amount
+            else:
+                current = amount
+            # Damage past zero just leaves you at zero
+            values[key] = max(current, 0)
+            if not stat_fits(stat, values[key]):
+                self.send_to(sender, CHAT, {'text': f"Edit rejected: {name}'s {stat} would be out of range"})
+                return
+        update = {'updates': [{'name': name, 'stat': stat, 'value': value} for (name, stat), value in values.items()]}
+        record = self.journal_record(STAT_BATCH, update)
+        self.table.apply(STAT_BATCH, update)
+        self.broadcast(STAT_BATCH, update, record=record)
+        log_event(f"Room {self.name}: applied {len(edits)} edits to {len({name for name, _ in values})} entities")
+
+class CampaignServer:
+    def __init__(self, host='0.0.0.0', port=12345, queue_size=256, history_size=1024, max_sessions=10000, room_grace=300,
+                 journal_dir=None, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.host = host
+        self.port = port
+        self.journal_dir = journal_dir
+        self.snapshot_interval = snapshot_interval
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.max_sessions = max_sessions
+        self.room_grace = room_grace
+        self.codec = MessageCodec()
+        self.rooms = {}
+        self.sessions = OrderedDict()
+
+    def join(self, client, room_name):
+        self.leave(client)
+        room = self.rooms.get(room_name)
+        if room is None:
+            journal = Journal(room_path(self.journal_dir, room_name), self.snapshot_interval) if self.journal_dir else None
+            room = self.rooms[room_name] = Room(room_name, self.codec, self.history_size, journal)
+        if room.expiry:
+            room.expiry.cancel()
+            room.expiry = None
+        room.clients.add(client)
+        client.room = room
+        if client.token:
+            self.sessions[client.token] = room_name
+
+    def switch_room(self, client, room_name):
+        # Sequence numbers are per room, so a session moving rooms is told the new room's before any of its messages.
+        # What the old room queued goes out first, behind it nothing of the new room can be mistaken for old.
+        self.join(client, room_name)
+        client.room.authorize(client)
+        if client.structured:
+            client.queue.flush_bulk()
+            client.push([encode_frame(self.codec.encode(SESSION, {'token': client.token, 'seq': client.room.seq, 'resumed': 0}))])
+        client.room.catch_up(client)
+
+    def leave(self, client):
+        room = client.room
+        if room:
+            room.remove(client)
+            client.room = None
+            if not room.clients and room.expiry is None:
+                # Empty tables linger for a while so dropped players can resume
+                room.expiry = asyncio.get_running_loop().call_later(self.room_grace, self.expire_room, room)
+
+    def expire_room(self, room):
+        room.expiry = None
+        if not room.clients and self.rooms.get(room.name) is room:
+            del self.rooms[room.name]
+            if room.journal:
+                room.journal.close()
+
+    def start_session(self, client, resume=None):
+        client.structured = True
+        missed = None
+        room_name = self.sessions.get(resume['token']) if resume else None
+        if room_name is not None:
+            client.token = resume['token']
+            self.sessions.move_to_end(client.token)
+            self.join(client, room_name)
+        else:
+            client.token = secrets.token_hex(8)
+            self.sessions[client.token] = client.room.name
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        room = client.room
+        room.authorize(client)
+        if room_name is not None:
+            missed = room.missed(client, resume['last_seq'])
+        client.push([encode_frame(self.codec.encode(SESSION, {'token': client.token, 'seq': room.seq, 'resumed': int(missed is not None)}))])
+        if missed:
+            # Frames are length-prefixed, so the whole catch-up can go out as one queue entry
+            client.push([b''.join(missed)])
+        elif missed is None:
+            room.catch_up(client)
+
+    def owns(self, room_name):
+        # A cluster worker only holds some of the rooms, see cluster.py
+        return True
+
+    def announce(self, text):
+        for room in list(self.rooms.values()):
+            room.broadcast(CHAT, {'text': f"[Announcement] {text}"})
+
+    def accept(self, writer):
+        client = ClientConnection(writer, self.queue_size)
+        client.write_task = asyncio.create_task(client.write_loop())
+        return client
+
+    async def handle_client(self, reader, writer):
+        client = self.accept(writer)
+        self.join(client, 'default')
+        await self.serve_client(client, reader)
+
+    async def serve_client(self, client, reader, data=b''):
+        # data is anything already read off the connection before it got here
+        decoder = FrameDecoder()
+        try:
+            while not client.closed:
+                if not data:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                METRICS.observe('recv_bytes', len(data), SIZE_BUCKETS)
+                frames = decoder.feed(data)
+                data = b''
+                for index, frame in enumerate(frames):
+                    try:
+                        with METRICS.span('decode_seconds'):
+                            msg_type, payload = self.codec.decode(frame)
+                    except ProtocolError:
+                        METRICS.count('bad_frames')
+                        continue
+                    METRICS.count('messages_received', type=msg_type)
+                    if msg_type == HELLO:
+                        self.start_session(client)
+                    elif msg_type == RESUME:
+                        self.start_session(client, payload)
+                    elif msg_type == SUBSCRIBE:
+                        # The codec has checked topics is a list, not what is in it. The room decides which private
+                        # channels the client really gets, again once its session has started.
+                        client.requested = frozenset(topic for topic in payload['topics'][:MAX_TOPICS] if isinstance(topic, str))
+                        client.room.authorize(client)
+                    elif msg_type == CHAT and payload['text'].startswith("/join "):
+                        room_name = payload['text'][len("/join "):].strip() or 'default'
+                        if not self.owns(room_name):
+                            rest = b''.join(encode_frame(frame) for frame in frames[index + 1:])
+                            await self.hand_off(client, reader, room_name, rest + decoder.unread())
+                            return
+                        self.switch_room(client, room_name)
+                    elif msg_type == CHAT and payload['text'].startswith("/announce "):
+                        # Goes to every room on every worker, so only a room's DM may send it
+                        if client.room.is_dm(client):
+                            self.announce(payload['text'][len("/announce "):].strip())
+                        else:
+                            client.room.send_to(client, CHAT, {'text': "Only the DM can make announcements"})
+                    else:
+                        try:
+                            with METRICS.span('handle_seconds', type=msg_type):
+                                client.room.handle(client, msg_type, payload)
+                        except ProtocolError as e:
+                            METRICS.count('bad_frames')
+                            log_event(f"Refused a message in room {client.room.name}: {e}")
+        except (ConnectionError, FrameError):
+            pass
+        finally:
+            self.leave(client)
+            client.close()
+
+    async def flush_journals(self):
+        # Journal writes are buffered, a crash loses at most this long of them
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            for room in list(self.rooms.values()):
+                if room.journal:
+                    room.journal.flush()
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        log_event(f"Campaign server listening on {self.host}:{self.port}")
+        if self.journal_dir:
+            self.flush_task = asyncio.create_task(self.flush_journals())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close_journals()
+
+    def close_journals(self):
+        for room in self.rooms.values():
+            if room.journal:
+                room.journal.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="D&D campaign server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=12345)
+    parser.add_argument('--journal', default='journal', help="directory for room journals, empty to keep nothing")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes, rooms are spread across them (Unix only)")
+    args = parser.parse_args()
+    setup_logging()
+    if args.workers > 1:
+        from cluster import serve_cluster
+        serve_cluster(args.host, args.port, args.workers, journal_dir=args.journal or None)
+        return
+    setup_from_environment()
+    asyncio.run(CampaignServer(args.host, args.port, journal_dir=args.journal or None).serve_forever())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+from models import Character
+from connection import Connection
+from protocol import (MessageCodec, message_model, CHAT, PLAYER_DATA, ENEMY_DATA, LOCATION_DATA, STAT_UPDATE, PATCH, SNAPSHOT_REQUEST,
+                      INITIATIVE, INITIATIVE_REMOVE, TURN, EDIT_BATCH, STAT_BATCH, MAP_DATA, TOKEN_PLACE, TOKEN_MOVE, TOKEN_REMOVE, TILE_SET,
+                      SUBSCRIBE, WHISPER, TABLE_TOPIC, COMBAT_TOPIC, DM_TOPIC, PLAYER_TOPICS, DM_NAME, player_topic, whisper_topic,
+                      parse_edit_command, parse_whisper)
+from state_sync import StateSync, MAP_TYPES
+from initiative import InitiativeTracker
+from metrics import METRICS
+
+class Session:
+    # Everything about being at the table that doesn't need a display: the connection,
+    # the published and replicated entities, the DM's player table and message dispatch
+    def __init__(self, host='localhost', port=12345, binary=False):
+        self.host = host
+        self.port = port
+        self.codec = MessageCodec(binary)
+        self.sync = StateSync()
+        self.connection = None
+        self.is_dm = False
+        self.player_number = 1
+        self.character = None
+        self.player_stats = {}
+        self.store = None
+        self.initiative = InitiativeTracker()
+        # Battle maps keyed by location name, with fog kept for this player's tokens
+        self.maps = {}
+        self.handlers = {
+            CHAT: self.handle_chat,
+            PLAYER_DATA: self.handle_player_data,
+            ENEMY_DATA: self.handle_entity_data,
+            LOCATION_DATA: self.handle_entity_data,
+            STAT_UPDATE: self.handle_stat_update,
+            STAT_BATCH: self.handle_stat_batch,
+            PATCH: self.handle_patch,
+            SNAPSHOT_REQUEST: self.handle_snapshot_request,
+            INITIATIVE: self.handle_initiative,
+            INITIATIVE_REMOVE: self.handle_initiative_remove,
+            TURN: self.handle_turn,
+            WHISPER: self.handle_chat,
+        }
+        for msg_type in MAP_TYPES:
+            self.handlers[msg_type] = self.handle_map
+        # Front-end callbacks keyed by message type, called after the session has applied the message
+        self.subscribers = {}
+
+    def subscribe(self, msg_type, callback):
+        self.subscribers.setdefault(msg_type, []).append(callback)
+
+    def notify(self, msg_type, payload):
+        for callback in self.subscribers.get(msg_type, ()):
+            callback(payload)
+
+    def set_role(self, is_dm, player_number=1):
+        self.is_dm = is_dm
+        self.player_number = player_number
+        if is_dm:
+            self.load_campaign()
+
+    def load_campaign(self):
+        # Only the DM keeps a campaign store, so players never pay for sqlite
+        from campaign_store import CampaignStore
+        self.store = CampaignStore()
+        for character in self.store.characters():
+            self.remember_player(character.to_dict())
+
+    def connect(self, deliver=None):
+        # deliver lets a front-end move message handling onto its own thread, it must end up calling dispatch
+        self.connection = Connection(self.host, self.port, self.codec, deliver or self.dispatch_all, on_resync=self.resync)
+        self.connection.topics = self.topics()
+        self.connection.start()
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        if self.store:
+            self.store.close()
+
+    def send(self, msg_type, payload):
+        return self.connection.send(msg_type, payload)
+
+    def resync(self):
+        # The server couldn't replay what we missed, so send full copies of what we publish
+        for kind, name in list(self.sync.published):
+            self.send(*self.sync.snapshot(kind, name))
+
+    def publish(self, model):
+        # Only the fields that changed since the last send go over the wire
+        message = self.sync.outgoing(model)
+        if message:
+            self.send(*message)
+        if model is self.character and self.connection:
+            self.update_topics()
+
+    def name(self):
+        # What other people call us in whispers
+        return DM_NAME if self.is_dm else self.viewer()
+
+    def topics(self):
+        # Declared at connect time from the role. The DM hears every player's private channel, a player only
+        # their own. The server holds the DM seat for the first DM in a room and gives a player the channels of
+        # the character they published, so a player needs a character before anyone can whisper to them.
+        if self.is_dm:
+            return [TABLE_TOPIC, COMBAT_TOPIC, DM_TOPIC, PLAYER_TOPICS, whisper_topic(DM_NAME)]
+        topics = [TABLE_TOPIC, COMBAT_TOPIC]
+        if self.character:
+            topics += [player_topic(self.character.name), whisper_topic(self.character.name)]
+        return topics
+
+    def update_topics(self):
+        # Once a player has named their character the server has to know to send them its channel
+        topics = self.topics()
+        if topics != self.connection.topics:
+            self.connection.topics = topics
+            self.send(SUBSCRIBE, {'topics': topics})
+
+    def whisper(self, target, text):
+        self.send(WHISPER, {'sender': self.name(), 'target': target, 'text': text})
+
+    def whisper_command(self, text):
+        # "/w Player 2: meet me behind the inn", raises ProtocolError if it can't be read
+        self.whisper(*parse_whisper(text))
+
+    def dispatch_all(self, messages):
+        for message in messages:
+            self.dispatch(message)
+
+    def dispatch(self, message):
+        msg_type, payload = message
+        handler = self.handlers.get(msg_type)
+        if handler:
+            with METRICS.span('dispatch_seconds', type=msg_type):
+                handler(msg_type, payload)
+
+    def handle_chat(self, msg_type, payload):
+        self.notify(msg_type, payload)
+
+    def handle_entity_data(self, msg_type, payload):
+        self.sync.receive_snapshot(msg_type, payload)
+        self.notify(msg_type, payload)
+
+    def handle_player_data(self, msg_type, payload):
+        self.sync.receive_snapshot(msg_type, payload)
+        if self.is_dm:
+            self.remember_player(payload)
+            self.store.upsert(message_model(PLAYER_DATA, payload))
+        self.notify(msg_type, payload)
+
+    def handle_stat_update(self, msg_type, payload):
+        self.apply_stat(payload['name'], payload['stat'], payload['value'])
+        self.notify(msg_type, payload)
+
+    def handle_stat_batch(self, msg_type, payload):
+        if self.store:
+            with self.store.batch():
+                for update in payload['updates']:
+                    self.apply_stat(update['name'], update['stat'], update['value'])
+        else:
+            for update in payload['updates']:
+                self.apply_stat(update['name'], update['stat'], update['value'])
+        self.notify(msg_type, payload)
+
+    def apply_stat(self, name, stat, value):
+        self.sync.set_stat(name, stat, value)
+        if self.character and self.character.name == name:
+            set_stat(self.character, stat, value)
+        data = self.player_stats.get(name) if self.is_dm else None
+        if data:
+            if stat in ('hp', 'mp'):
+                data[stat] = value
+            elif stat.upper() in data['stats']:
+                data['stats'][stat.upper()] = value
+            self.store.upsert(self.player_character(name))
+
+    def edit(self, edits):
+        # edits are {'name', 'stat', 'op', 'value'} with op one of =, += and -=, the server applies them all or none
+        self.send(EDIT_BATCH, {'edits': edits})
+
+    def edit_command(self, text):
+        # Raises ProtocolError if the command can't be read
+        self.edit(parse_edit_command(text))
+
+    def handle_patch(self, msg_type, patch):
+        replica, request = self.sync.receive_patch(patch)
+        if request:
+            # We missed a revision, ask for the whole record instead
+            self.send(*request)
+            return
+        name = patch['name']
+        if patch['kind'] == PLAYER_DATA and self.is_dm:
+            if name not in self.player_stats:
+                self.remember_player(replica)
+            else:
+                data = self.player_stats[name]
+                for key, value in patch['fields'].items():
+                    if key == 'stats':
+                        data['stats'].update(value)
+                    elif key == 'class_type':
+                        data['class'] = value
+                    elif key in data:
+                        data[key] = value
+            self.store.upsert(message_model(PLAYER_DATA, replica))
+        self.notify(msg_type, patch)
+
+    def handle_snapshot_request(self, msg_type, request):
+        snapshot = self.sync.snapshot(request['kind'], request['name'])
+        if snapshot:
+            self.send(*snapshot)
+
+    # Initiative subscribers get the payload plus the list positions to change, so views update in place.
+    # Local actions go through the same handlers as received messages, the server doesn't echo them back.
+    def roll_initiative(self, name, roll, dex=10):
+        payload = {'name': name, 'roll': roll, 'dex': dex}
+        self.send(INITIATIVE, payload)
+        self.handle_initiative(INITIATIVE, payload)
+
+    def remove_combatant(self, name):
+        if name in self.initiative:
+            self.send(INITIATIVE_REMOVE, {'name': name})
+            self.handle_initiative_remove(INITIATIVE_REMOVE, {'name': name})
+
+    def next_turn(self):
+        # Only the DM runs the queue, everyone else follows the TURN broadcasts
+        previous = self.initiative.position(self.initiative.active)
+        name = self.initiative.next_turn()
+        if name is None:
+            return None
+        payload = {'name': name, 'round': self.initiative.round}
+        self.send(TURN, payload)
+        self.notify(TURN, dict(payload, index=self.initiative.position(name), previous=previous))
+        return name
+
+    def handle_initiative(self, msg_type, payload):
+        replaced, index = self.initiative.add(payload['name'], payload['roll'], payload['dex'])
+        self.notify(msg_type, dict(payload, index=index, replaced=replaced))
+
+    def handle_initiative_remove(self, msg_type, payload):
+        index = self.initiative.remove(payload['name'])
+        if index is not None:
+            self.notify(msg_type, dict(payload, index=index))
+
+    def handle_turn(self, msg_type, payload):
+        previous = self.initiative.position(self.initiative.active)
+        self.initiative.set_active(payload['name'], payload['round'])
+        self.notify(msg_type, dict(payload, index=self.initiative.position(payload['name']), previous=previous))
+
+    def viewer(self):
+        # Whose fog the maps show, the DM sees everything
+        if self.is_dm:
+            return None
+        return self.character.name if self.character else f"Player {self.player_number}"
+
+    # Map subscribers get the payload plus the tiles that came into and went out of this player's sight
+    def publish_map(self, battle_map):
+        self.send_map(MAP_DATA, battle_map.to_payload())
+
+    def place_token(self, location, name, x, y, owner='', sight=None):
+        if sight is None:
+            from battle_map import DEFAULT_SIGHT
+            sight = DEFAULT_SIGHT
+        return self.send_map(TOKEN_PLACE, {'location': location, 'name': name, 'x': x, 'y': y, 'owner': owner, 'sight': sight})
+
+    def move_token(self, location, name, x, y):
+        return self.send_map(TOKEN_MOVE, {'location': location, 'name': name, 'x': x, 'y': y})
+
+    def remove_token(self, location, name):
+        return self.send_map(TOKEN_REMOVE, {'location': location, 'name': name})
+
+    def set_tile(self, location, x, y, tile):
+        return self.send_map(TILE_SET, {'location': location, 'x': x, 'y': y, 'tile': tile})
+
+    def send_map(self, msg_type, payload):
+        # Applied here first, so a move off the map or of a token that isn't there never goes out
+        if not self.handle_map(msg_type, payload):
+            return False
+        self.send(msg_type, payload)
+        return True
+
+    def handle_map(self, msg_type, payload):
+        from battle_map import apply_message
+        changes = apply_message(self.maps, msg_type, payload)
+        if changes is None:
+            return False
+        viewer = self.viewer()
+        revealed, hidden = [], []
+        if viewer is not None:
+            # The first message for a map starts its fog, after that only the tiles a change touched come back
+            revealed, hidden = (self.maps[payload['location']].watch(viewer) or changes).get(viewer, ([], []))
+        self.notify(msg_type, dict(payload, revealed=revealed, hidden=hidden))
+        return True
+
+    def remember_player(self, payload):
+        self.player_stats[payload['name']] = {
+            'race': payload['race'], 'class': payload['class_type'], 'level': payload['level'], 'hp': payload['hp'],
+            'mp': payload['mp'], 'stats': dict(payload['stats']), 'special_skills': payload['special_skills'],
+        }
+
+    def player_character(self, name):
+        data = self.player_stats[name]
+        character = Character(name, data['race'], data['class'], data['level'])
+        character.hp = data['hp']
+        character.mp = data['mp']
+        character.stats = data['stats']
+        character.special_skills = list(data['special_skills'])
+        return character
+
+def set_stat(character, stat, value):
+    if stat in ('hp', 'mp'):
+        setattr(character, stat, value)
+    elif stat.upper() in character.stats:
+        character.stats[stat.upper()] = value
@@ -0,0 +1,169 @@
+from protocol import (model_message, STATS, STAT_RANGE, INT_RANGE, PATCH, SNAPSHOT_REQUEST, PLAYER_DATA, ENEMY_DATA, LOCATION_DATA, STAT_UPDATE, STAT_BATCH, INITIATIVE,
+                      INITIATIVE_REMOVE, TURN, MAP_DATA, TOKEN_PLACE, TOKEN_MOVE, TOKEN_REMOVE, TILE_SET)
+
+MAP_TYPES = (MAP_DATA, TOKEN_PLACE, TOKEN_MOVE, TOKEN_REMOVE, TILE_SET)
+EDITABLE_STATS = ['hp', 'mp', 'str', 'dex', 'con', 'int', 'wis', 'cha']
+
+def stat_fits(stat, value):
+    # What a packed record holds: ability scores are 16 bit, hp and mp 32 bit
+    return value in (STAT_RANGE if stat.upper() in STATS else INT_RANGE)
+
+def copy_payload(payload):
+    copy = dict(payload)
+    if 'stats' in copy:
+        copy['stats'] = dict(copy['stats'])
+    return copy
+
+def diff_payload(old, new):
+    # Top level fields that changed, ability scores diffed one by one
+    changes = {}
+    for key, value in new.items():
+        if key == 'rev':
+            continue
+        previous = old.get(key)
+        if key == 'stats':
+            stats = {stat: score for stat, score in value.items() if previous.get(stat) != score}
+            if stats:
+                changes['stats'] = stats
+        elif previous != value:
+            changes[key] = value
+    return changes
+
+def apply_patch(payload, fields):
+    for key, value in fields.items():
+        if key == 'stats':
+            payload['stats'].update(value)
+        else:
+            payload[key] = value
+
+def stat_value(payload, stat):
+    # hp and mp are top level fields, ability scores live under stats
+    if stat in ('hp', 'mp'):
+        return payload.get(stat)
+    return payload['stats'].get(stat.upper())
+
+def set_stat_value(payload, stat, value):
+    if stat in ('hp', 'mp'):
+        payload[stat] = value
+    else:
+        payload['stats'][stat.upper()] = value
+
+class StateSync:
+    def __init__(self):
+        # Entities we publish and the last state we sent for each, keyed by (kind, name)
+        self.published = {}
+        # Entities other clients publish, as last received
+        self.replicas = {}
+
+    def outgoing(self, model):
+        # Returns the message to send for model, or None if nothing changed since the last send
+        kind, payload = model_message(model)
+        key = (kind, payload['name'])
+        previous = self.published.get(key)
+        if previous is None:
+            payload['rev'] = 1
+            self.published[key] = copy_payload(payload)
+            return kind, payload
+        changes = diff_payload(previous, payload)
+        if not changes:
+            return None
+        base = previous['rev']
+        apply_patch(previous, changes)
+        previous['rev'] = base + 1
+        return PATCH, {'kind': kind, 'name': payload['name'], 'base': base, 'rev': base + 1, 'fields': changes}
+
+    def snapshot(self, kind, name):
+        payload = self.published.get((kind, name))
+        return (kind, copy_payload(payload)) if payload else None
+
+    def receive_snapshot(self, kind, payload):
+        self.replicas[(kind, payload['name'])] = copy_payload(payload)
+
+    def set_stat(self, name, stat, value):
+        # The server applied an edit, bring our copies in line so later diffs don't undo it
+        for kind in (PLAYER_DATA, ENEMY_DATA):
+            for copies in (self.published, self.replicas):
+                payload = copies.get((kind, name))
+                if payload and stat_value(payload, stat) is not None:
+                    set_stat_value(payload, stat, value)
+
+    def receive_patch(self, patch):
+        # Returns the patched replica, or a snapshot request if we're not at the patch's base revision
+        replica = self.replicas.get((patch['kind'], patch['name']))
+        if replica is None or replica.get('rev', 0) != patch['base']:
+            return None, (SNAPSHOT_REQUEST, {'kind': patch['kind'], 'name': patch['name']})
+        apply_patch(replica, patch['fields'])
+        replica['rev'] = patch['rev']
+        return replica, None
+
+class TableState:
+    # What the server knows about a room's table, changed only through apply so a journal replay ends up identical
+    def __init__(self):
+        # Latest full payload of every player, enemy and location, keyed by (kind, name)
+        self.entities = {}
+        # name -> [roll, dex] of everyone in the fight
+        self.initiative = {}
+        # [name, round] of the latest turn
+        self.turn = None
+        # Battle maps keyed by location name, without fog, the server shows everything to the DM
+        self.maps = {}
+
+    def apply(self, msg_type, payload):
+        if msg_type in (PLAYER_DATA, ENEMY_DATA, LOCATION_DATA):
+            self.entities[(msg_type, payload['name'])] = copy_payload(payload)
+        elif msg_type == PATCH:
+            entity = self.entities.get((payload['kind'], payload['name']))
+            if entity:
+                apply_patch(entity, payload['fields'])
+                entity['rev'] = payload['rev']
+        elif msg_type == STAT_UPDATE:
+            self.set_stat(payload)
+        elif msg_type == STAT_BATCH:
+            for update in payload['updates']:
+                self.set_stat(update)
+        elif msg_type == INITIATIVE:
+            self.initiative[payload['name']] = [payload['roll'], payload['dex']]
+        elif msg_type == INITIATIVE_REMOVE:
+            self.initiative.pop(payload['name'], None)
+        elif msg_type == TURN:
+            self.turn = [payload['name'], payload['round']]
+        elif msg_type in MAP_TYPES:
+            from battle_map import apply_message
+            apply_message(self.maps, msg_type, payload)
+
+    def set_stat(self, update):
+        # A stat the models don't have, or a score they can't hold, would break every later catch-up and replay
+        stat, value = update['stat'], update['value']
+        if stat not in EDITABLE_STATS or not stat_fits(stat, value):
+            return
+        entity = self.entities.get((PLAYER_DATA, update['name'])) or self.entities.get((ENEMY_DATA, update['name']))
+        if entity:
+            set_stat_value(entity, stat, value)
+
+    def messages(self):
+        # Everything a newcomer needs to see the table as it is now, in an order that replays cleanly
+        for (kind, _), payload in self.entities.items():
+            yield kind, payload
+        for battle_map in self.maps.values():
+            yield MAP_DATA, battle_map.to_payload()
+        for name, (roll, dex) in self.initiative.items():
+            yield INITIATIVE, {'name': name, 'roll': roll, 'dex': dex}
+        if self.turn:
+            yield TURN, {'name': self.turn[0], 'round': self.turn[1]}
+
+    def to_dict(self):
+        return {'entities': [[kind, payload] for (kind, _), payload in self.entities.items()],
+                'initiative': self.initiative, 'turn': self.turn, 'maps': [battle_map.to_payload() for battle_map in self.maps.values()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        table = cls()
+        for kind, payload in data['entities']:
+            table.entities[(kind, payload['name'])] = payload
+        table.initiative = data['initiative']
+        table.turn = data['turn']
+        if data.get('maps'):
+            from battle_map import BattleMap
+        for payload in data.get('maps', ()):
+            table.maps[payload['location']] = BattleMap.from_payload(payload)
+        return table
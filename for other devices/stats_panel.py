@@ -0,0 +1,60 @@
+from tkinter import ttk
+
+STATS = ['STR', 'DEX', 'CON', 'INT', 'WIS', 'CHA']
+COLUMNS = ['race', 'class', 'level', 'hp', 'mp'] + STATS + ['special_skills']
+HEADINGS = {'race': 'Race', 'class': 'Class', 'level': 'Lvl', 'hp': 'HP', 'mp': 'MP', 'special_skills': 'Skills'}
+
+class PlayerStatsPanel:
+    def __init__(self, parent, height=8):
+        self.tree = ttk.Treeview(parent, columns=COLUMNS, height=height)
+        self.tree.heading('#0', text='Player')
+        self.tree.column('#0', width=110)
+        for column in COLUMNS:
+            self.tree.heading(column, text=HEADINGS.get(column, column))
+            self.tree.column(column, width=140 if column == 'special_skills' else 45, anchor='center')
+        # Pending cell changes keyed by player, merged until the next flush
+        self.pending = {}
+
+    def __contains__(self, name):
+        return self.tree.exists(name)
+
+    def pack(self, **kwargs):
+        self.tree.pack(**kwargs)
+
+    def row_values(self, data):
+        stats = data.get('stats', {})
+        values = []
+        for column in COLUMNS:
+            if column in STATS:
+                values.append(stats.get(column, 10))
+            elif column == 'special_skills':
+                values.append(', '.join(data.get('special_skills', [])) or 'None')
+            else:
+                values.append(data[column])
+        return values
+
+    def upsert(self, name, data):
+        self.pending.pop(name, None)
+        if self.tree.exists(name):
+            self.tree.item(name, values=self.row_values(data))
+        else:
+            self.tree.insert('', 'end', iid=name, text=name, values=self.row_values(data))
+
+    def update_stat(self, name, stat, value):
+        column = stat.upper() if stat.upper() in STATS else stat
+        if column == 'special_skills':
+            value = ', '.join(value) or 'None'
+        self.pending.setdefault(name, {})[column] = value
+
+    def remove(self, name):
+        self.pending.pop(name, None)
+        if self.tree.exists(name):
+            self.tree.delete(name)
+
+    def flush(self):
+        # Only the cells that actually changed are redrawn
+        for name, cells in self.pending.items():
+            if self.tree.exists(name):
+                for column, value in cells.items():
+                    self.tree.set(name, column, value)
+        self.pending = {}
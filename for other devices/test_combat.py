@@ -0,0 +1,50 @@
+import unittest
+from types import SimpleNamespace
+from combat import CombatEngine, simulate, WIN, TIMEOUT
+from models import Character, Enemy, Encounter
+
+def rigged(pick):
+    # A roller whose every randint(low, high) is pick(low, high), max always crits and min always misses
+    return SimpleNamespace(random=SimpleNamespace(randint=pick))
+
+def duel(character_hp=100, enemy_hp=1, enemy_dex=12):
+    character = Character('Aria', 'Elf', 'Fighter')
+    character.hp = character_hp
+    enemy = Enemy('Goblin', 'Goblin', hp=enemy_hp)
+    enemy.stats = {'DEX': enemy_dex}
+    encounter = Encounter('Duel')
+    encounter.add_character(character)
+    encounter.add_enemy(enemy)
+    return encounter
+
+class CombatEngineTest(unittest.TestCase):
+    def test_win_on_the_last_turn_of_the_first_round(self):
+        # The goblin is quicker, Aria's blow is the last turn of round 1
+        engine = CombatEngine(duel(), rigged(max))
+        self.assertEqual(engine.run(), (WIN, 1))
+        self.assertEqual(engine.round, 2)
+
+    def test_win_on_the_first_turn(self):
+        engine = CombatEngine(duel(enemy_dex=8), rigged(max))
+        self.assertEqual(engine.run(), (WIN, 1))
+
+    def test_undecided_fight_times_out(self):
+        engine = CombatEngine(duel(), rigged(min))
+        self.assertEqual(engine.run(max_rounds=5), (TIMEOUT, 5))
+
+class SimulateTest(unittest.TestCase):
+    def test_timeouts_are_not_losses(self):
+        encounter = duel(character_hp=10000, enemy_hp=10000)
+        report = simulate(encounter.characters, encounter.enemies, trials=20, workers=1, seed=1)
+        self.assertEqual(report['timeouts'], 20)
+        self.assertEqual((report['win_rate'], report['loss_rate'], report['rounds']), (0.0, 0.0, {}))
+
+    def test_every_trial_is_counted_once(self):
+        encounter = duel(character_hp=12, enemy_hp=12, enemy_dex=10)
+        report = simulate(encounter.characters, encounter.enemies, trials=500, workers=1, seed=7)
+        self.assertEqual(sum(report['rounds'].values()) + report['timeouts'], 500)
+        self.assertAlmostEqual(report['win_rate'] + report['loss_rate'] + report['timeouts'] / 500, 1.0)
+        self.assertEqual(simulate(encounter.characters, encounter.enemies, trials=500, workers=1, seed=7), report)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from connection import Connection
+from framing import send_frame
+from protocol import MessageCodec, CHAT, HELLO, SUBSCRIBE, PROTOCOL_VERSION, TABLE_TOPIC, DM_TOPIC
+from server import CampaignServer
+
+TIMEOUT = 10.0
+
+class LocalServer:
+    # A CampaignServer on an ephemeral port, its event loop running in a background thread
+    def __init__(self):
+        self.campaign = CampaignServer('127.0.0.1', 0)
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.server = None
+
+    def start(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.campaign.handle_client, '127.0.0.1', 0), self.loop).result(TIMEOUT)
+        return self.server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        async def close():
+            self.server.close()
+            await self.server.wait_closed()
+            for room in list(self.campaign.rooms.values()):
+                for client in list(room.clients):
+                    client.close()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result(TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(TIMEOUT)
+        self.loop.close()
+
+def wait_until(condition, timeout=TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer()
+        port = self.server.start()
+        self.chats = []
+        self.lock = threading.Lock()
+        # Slow enough to reconnect that the sender gets well ahead of the dropped client
+        self.listener = Connection('127.0.0.1', port, MessageCodec(), self.on_messages, initial_backoff=0.4)
+        self.sender = Connection('127.0.0.1', port, MessageCodec(), lambda messages: None)
+        self.listener.start()
+        self.sender.start()
+        wait_until(lambda: self.listener.token and self.sender.token)
+
+    def tearDown(self):
+        self.listener.close()
+        self.sender.close()
+        self.server.stop()
+
+    def on_messages(self, messages):
+        with self.lock:
+            self.chats.extend(payload['text'] for msg_type, payload in messages if msg_type == CHAT)
+
+    def received(self):
+        with self.lock:
+            return list(self.chats)
+
+    def test_missed_messages_are_replayed_once_in_order(self):
+        expected = [f"message {i}" for i in range(40)]
+        for text in expected[:20]:
+            self.sender.send(CHAT, {'text': text})
+        wait_until(lambda: len(self.received()) == 20)
+        token = self.listener.token
+
+        # Drop the listener's socket mid-chat, everything sent until it resumes has to come from the room's history
+        self.listener.sock.shutdown(socket.SHUT_RDWR)
+        wait_until(lambda: not self.listener.connected.is_set())
+        for text in expected[20:]:
+            self.sender.send(CHAT, {'text': text})
+        wait_until(lambda: len(self.received()) >= len(expected))
+        # Anything replayed twice would have shown up by now
+        time.sleep(0.2)
+
+        self.assertEqual(self.listener.token, token)
+        self.assertEqual(self.received(), expected)
+
+    def test_joining_a_room_restarts_the_sequence(self):
+        # Take the old room well past the reorder window, the new room's first messages have far lower numbers
+        for i in range(400):
+            self.sender.send(CHAT, {'text': f"old {i}"})
+        wait_until(lambda: len(self.received()) == 400)
+        self.listener.send(CHAT, {'text': '/join side'})
+        self.sender.send(CHAT, {'text': '/join side'})
+        wait_until(lambda: 'side' in self.server.campaign.rooms and len(self.server.campaign.rooms['side'].clients) == 2)
+        wait_until(lambda: self.listener.last_seq == 0 and self.sender.last_seq == 0)
+        expected = [f"new {i}" for i in range(20)]
+        for text in expected[:10]:
+            self.sender.send(CHAT, {'text': text})
+        wait_until(lambda: len(self.received()) >= 410)
+        self.assertEqual(self.listener.last_seq, 10)
+
+        # Resuming in the new room replays from its own numbers instead of forcing a resync
+        token = self.listener.token
+        self.listener.sock.shutdown(socket.SHUT_RDWR)
+        wait_until(lambda: not self.listener.connected.is_set())
+        for text in expected[10:]:
+            self.sender.send(CHAT, {'text': text})
+        wait_until(lambda: len(self.received()) >= 420)
+        time.sleep(0.2)
+        self.assertEqual(self.listener.token, token)
+        self.assertEqual(self.received()[400:], expected)
+
+    def test_malformed_messages_leave_the_sender_connected(self):
+        codec = MessageCodec()
+        with socket.create_connection(('127.0.0.1', self.server.server.sockets[0].getsockname()[1]), timeout=TIMEOUT) as sock:
+            send_frame(sock, codec.encode(HELLO, {'version': PROTOCOL_VERSION}))
+            for msg_type, payload in ((CHAT, {}), (CHAT, {'text': 7}), (SUBSCRIBE, {'topics': 'table'}), (SUBSCRIBE, {})):
+                send_frame(sock, codec.encode(msg_type, payload))
+            send_frame(sock, codec.encode(CHAT, {'text': 'still here'}))
+            wait_until(lambda: self.received() == ['still here'])
+
+class AnnounceTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer()
+        port = self.server.start()
+        self.chats = {'dm': [], 'player': []}
+        self.connections = {}
+        for role, topics in (('dm', [TABLE_TOPIC, DM_TOPIC]), ('player', [TABLE_TOPIC])):
+            connection = self.connections[role] = Connection('127.0.0.1', port, MessageCodec(), self.collector(role))
+            connection.topics = topics
+            connection.start()
+        wait_until(lambda: all(connection.token for connection in self.connections.values()))
+
+    def tearDown(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.server.stop()
+
+    def collector(self, role):
+        def on_messages(messages):
+            self.chats[role].extend(payload['text'] for msg_type, payload in messages if msg_type == CHAT)
+        return on_messages
+
+    def test_only_the_dm_can_announce(self):
+        self.connections['player'].send(CHAT, {'text': '/announce free loot'})
+        wait_until(lambda: self.chats['player'])
+        self.connections['dm'].send(CHAT, {'text': '/announce session starts'})
+        wait_until(lambda: len(self.chats['player']) == 2)
+        self.assertEqual(self.chats['player'], ["Only the DM can make announcements", "[Announcement] session starts"])
+        self.assertEqual(self.chats['dm'], ["[Announcement] session starts"])
+
+class OfflineTest(unittest.TestCase):
+    def test_full_send_queue_is_reported(self):
+        connection = Connection('127.0.0.1', 1, MessageCodec(), lambda messages: None, max_pending=2)
+        self.assertTrue(connection.send(CHAT, {'text': 'one'}))
+        self.assertTrue(connection.send(CHAT, {'text': 'two'}))
+        self.assertFalse(connection.send(CHAT, {'text': 'three'}))
+        self.assertEqual(len(connection.queue), 2)
+
+if __name__ == "__main__":
+    unittest.main()
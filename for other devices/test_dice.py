@@ -0,0 +1,50 @@
+import unittest
+import dice
+from dice import DiceError, DiceRoller, distribution, mean, chance_at_least
+
+class DistributionTest(unittest.TestCase):
+    def test_known_distributions(self):
+        self.assertAlmostEqual(mean('2d6'), 7.0)
+        self.assertAlmostEqual(distribution('2d6')[7], 6 / 36)
+        self.assertAlmostEqual(chance_at_least('1d20', 11), 0.5)
+        self.assertAlmostEqual(mean('1d20+5'), 15.5)
+        self.assertAlmostEqual(mean('4d6k3'), 15869 / 1296)
+        self.assertAlmostEqual(mean('2d20kl1'), 7.175)
+        self.assertAlmostEqual(mean('1d8-1d4'), 2.0)
+
+    def test_probabilities_add_up(self):
+        for expression in ('3d6', '1d6!', '4d6k3', '2d10+1d4-2', '20d100'):
+            with self.subTest(expression=expression):
+                self.assertAlmostEqual(sum(distribution(expression).values()), 1.0)
+
+    def test_exploding_die(self):
+        odds = distribution('1d6!')
+        self.assertAlmostEqual(odds[5], 1 / 6)
+        self.assertNotIn(6, odds)
+        self.assertAlmostEqual(odds[6 + 3], 1 / 36)
+
+class LimitTest(unittest.TestCase):
+    def test_too_many_dice_or_sides(self):
+        for expression in ('101d6', '99999999d6', '60d6+41d6', '1d1001', '0d6', 'd'):
+            with self.subTest(expression=expression):
+                with self.assertRaises(DiceError):
+                    dice.roll(expression)
+
+    def test_distribution_work_is_bounded(self):
+        # Fine to roll, too much work to work out exactly on the UI thread
+        for expression in ('60d100', '3d1000', '7d20k3'):
+            with self.subTest(expression=expression):
+                dice.roll(expression)
+                with self.assertRaises(DiceError):
+                    mean(expression)
+
+class RollerTest(unittest.TestCase):
+    def test_seeded_rolls_repeat_and_stay_in_range(self):
+        first, second = DiceRoller(3), DiceRoller(3)
+        rolls = [first.roll('3d6+2') for _ in range(200)]
+        self.assertEqual(rolls, [second.roll('3d6+2') for _ in range(200)])
+        self.assertTrue(all(5 <= total <= 20 for total in rolls))
+        self.assertEqual(len(DiceRoller(3).roll_many('4d6k3', 50)), 50)
+
+if __name__ == "__main__":
+    unittest.main()
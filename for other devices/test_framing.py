@@ -0,0 +1,95 @@
+import os
+import unittest
+from framing import FrameDecoder, SendQueue, message_frames, split_frame, CHUNK_SIZE
+
+def drain(queue, decoder):
+    frames = []
+    while True:
+        data = queue.peek()
+        if data is None:
+            return frames
+        queue.commit()
+        frames.extend(decoder.feed(data))
+
+class SendQueueTest(unittest.TestCase):
+    def test_urgent_message_overtaking_a_half_sent_bulk_one(self):
+        bulk = b'B' * 10000
+        urgent = os.urandom(6000)
+        queue = SendQueue()
+        decoder = FrameDecoder()
+        queue.push(message_frames(bulk, False), False)
+        received = decoder.feed(queue.peek())
+        queue.commit()
+        queue.push(message_frames(urgent, True), True)
+        # The urgent message goes out before the rest of the bulk one, and neither is mixed into the other
+        received += drain(queue, decoder)
+        self.assertEqual(received, [urgent, bulk])
+
+    def test_only_bulk_messages_are_chunked(self):
+        payload = bytes(CHUNK_SIZE * 3)
+        self.assertEqual(len(message_frames(payload, True)), 1)
+        self.assertEqual(message_frames(payload, False), split_frame(payload))
+        self.assertEqual(len(split_frame(payload)), 3)
+
+    def test_urgent_frames_are_batched_in_order(self):
+        queue = SendQueue()
+        decoder = FrameDecoder()
+        messages = [f"message {i}".encode() for i in range(10)]
+        for message in messages:
+            queue.push(message_frames(message, True))
+        self.assertEqual(decoder.feed(queue.peek()), messages)
+        queue.commit()
+        self.assertIsNone(queue.peek())
+
+    def test_full_queue_refuses(self):
+        queue = SendQueue(limit=2)
+        self.assertTrue(queue.push(message_frames(b'one', True)))
+        self.assertTrue(queue.push(message_frames(b'two', False), False))
+        self.assertFalse(queue.push(message_frames(b'three', True)))
+        self.assertEqual(len(queue), 2)
+
+    def test_commit_after_a_rewind_is_ignored(self):
+        queue = SendQueue()
+        decoder = FrameDecoder()
+        bulk = bytes(range(256)) * 40
+        queue.push(message_frames(bulk, False), False)
+        queue.peek()
+        generation = queue.generation
+        # A reconnect lands between the send and the commit, the new socket starts the message over
+        queue.rewind()
+        queue.commit(generation)
+        self.assertEqual(drain(queue, decoder), [bulk])
+
+    def test_flushed_bulk_goes_out_before_anything_pushed_later(self):
+        queue = SendQueue()
+        decoder = FrameDecoder()
+        first, second = os.urandom(CHUNK_SIZE * 2), os.urandom(CHUNK_SIZE + 1)
+        queue.push(message_frames(first, False), False)
+        queue.push(message_frames(second, False), False)
+        received = decoder.feed(queue.peek())
+        queue.commit()
+        queue.flush_bulk()
+        queue.push(message_frames(b'after', True))
+        received += drain(queue, decoder)
+        self.assertEqual(received, [first, second, b'after'])
+
+class FrameDecoderTest(unittest.TestCase):
+    def test_frames_split_across_reads(self):
+        payloads = [os.urandom(size) for size in (0, 1, CHUNK_SIZE + 1, 70000)]
+        wire = b''.join(frame for payload in payloads for frame in message_frames(payload, False))
+        decoder = FrameDecoder(buffer_size=1024)
+        received = []
+        for start in range(0, len(wire), 777):
+            received += decoder.feed(wire[start:start + 777])
+        self.assertEqual(received, payloads)
+
+    def test_unread_hands_over_a_partial_message(self):
+        bulk = os.urandom(CHUNK_SIZE * 2 + 10)
+        frames = message_frames(bulk, False)
+        first = FrameDecoder()
+        self.assertEqual(first.feed(frames[0] + frames[1][:10]), [])
+        second = FrameDecoder()
+        self.assertEqual(second.feed(first.unread() + frames[1][10:] + frames[2]), [bulk])
+
+if __name__ == "__main__":
+    unittest.main()
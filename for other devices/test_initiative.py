@@ -0,0 +1,45 @@
+import unittest
+from initiative import InitiativeTracker
+
+class InitiativeTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = InitiativeTracker()
+        for name, roll, dex in (('Aria', 15, 14), ('Borin', 15, 12), ('Goblin', 18, 10), ('Cato', 15, 12)):
+            self.tracker.add(name, roll, dex)
+
+    def turns(self, count):
+        return [self.tracker.next_turn() for _ in range(count)]
+
+    def test_order_is_roll_then_dex_then_name(self):
+        self.assertEqual([self.tracker.position(name) for name in ('Goblin', 'Aria', 'Borin', 'Cato')], [0, 1, 2, 3])
+        self.assertEqual(self.turns(4), ['Goblin', 'Aria', 'Borin', 'Cato'])
+        self.assertEqual(self.tracker.round, 1)
+        self.assertEqual(self.turns(1), ['Goblin'])
+        self.assertEqual(self.tracker.round, 2)
+
+    def test_removed_combatants_are_skipped(self):
+        self.turns(1)
+        self.assertEqual(self.tracker.remove('Borin'), 2)
+        self.assertEqual(self.turns(3), ['Aria', 'Cato', 'Goblin'])
+        self.assertNotIn('Borin', self.tracker)
+        self.assertIsNone(self.tracker.remove('Borin'))
+
+    def test_joining_after_your_slot_waits_for_the_next_round(self):
+        self.turns(2)
+        self.tracker.add('Dax', 20)
+        self.assertEqual(self.turns(3), ['Borin', 'Cato', 'Dax'])
+        self.assertEqual(self.tracker.round, 2)
+        self.assertEqual(self.turns(1), ['Goblin'])
+
+    def test_reroll_moves_the_combatant(self):
+        self.assertEqual(self.tracker.add('Aria', 1, 14), (1, 3))
+        self.assertEqual(self.turns(4), ['Goblin', 'Borin', 'Cato', 'Aria'])
+
+    def test_empty_fight(self):
+        for name in ('Aria', 'Borin', 'Goblin', 'Cato'):
+            self.tracker.remove(name)
+        self.assertIsNone(self.tracker.next_turn())
+        self.assertEqual(len(self.tracker), 0)
+
+if __name__ == "__main__":
+    unittest.main()
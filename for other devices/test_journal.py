@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+from journal import Journal
+from models import Character, Enemy
+from protocol import ProtocolError, model_message, PLAYER_DATA, ENEMY_DATA, STAT_UPDATE, INITIATIVE, TURN
+from state_sync import TableState
+
+def messages():
+    yield model_message(Character('Aria', 'Elf', 'Wizard'))
+    yield model_message(Enemy('Goblin', 'Humanoid', 1, 7, 12))
+    for hp in range(9, 0, -1):
+        yield STAT_UPDATE, {'name': 'Aria', 'stat': 'hp', 'value': hp}
+    yield INITIATIVE, {'name': 'Aria', 'roll': 15, 'dex': 14}
+    yield TURN, {'name': 'Aria', 'round': 2}
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='dnd-journal-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, journal, table, seq, messages):
+        # What a room does for every broadcast: encode, apply, write, and rotate when a snapshot is due
+        for msg_type, payload in messages:
+            seq += 1
+            record = journal.encode(seq, msg_type, payload)
+            table.apply(msg_type, payload)
+            journal.write(record)
+            if journal.due():
+                journal.rotate(table, seq)
+        return seq
+
+    def test_recover_across_snapshots(self):
+        journal = Journal(self.directory, snapshot_interval=4)
+        table, seq = journal.recover()
+        seq = self.record(journal, table, seq, messages())
+        journal.close()
+        self.assertGreater(len(journal.segments()), 2)
+
+        recovered, recovered_seq = Journal(self.directory, snapshot_interval=4).recover()
+        self.assertEqual(recovered_seq, seq)
+        self.assertEqual(recovered.to_dict(), table.to_dict())
+        self.assertEqual(recovered.entities[(PLAYER_DATA, 'Aria')]['hp'], 1)
+
+    def test_state_at_an_earlier_message(self):
+        journal = Journal(self.directory, snapshot_interval=4)
+        table, seq = journal.recover()
+        self.record(journal, table, seq, messages())
+        journal.close()
+        # Message 2 is the goblin, then Aria's hp counts down from 9 one message at a time
+        past, last = journal.state_at(seq=5)
+        self.assertEqual(last, 5)
+        self.assertEqual(past.entities[(PLAYER_DATA, 'Aria')]['hp'], 7)
+        self.assertIn((ENEMY_DATA, 'Goblin'), past.entities)
+        self.assertEqual(past.initiative, {})
+
+    def test_torn_tail_is_dropped(self):
+        journal = Journal(self.directory)
+        table, seq = journal.recover()
+        seq = self.record(journal, table, seq, list(messages())[:3])
+        journal.close()
+        with open(os.path.join(self.directory, f"{0:010d}.log"), 'ab') as f:
+            f.write(b'\x00\x00\x01\x00half a record')
+
+        journal = Journal(self.directory)
+        recovered, recovered_seq = journal.recover()
+        self.assertEqual((recovered_seq, recovered.to_dict()), (seq, table.to_dict()))
+        # New records go where the torn one was, so they replay
+        self.record(journal, recovered, recovered_seq, [(STAT_UPDATE, {'name': 'Aria', 'stat': 'mp', 'value': 3})])
+        journal.close()
+        again, _ = Journal(self.directory).recover()
+        self.assertEqual(again.entities[(PLAYER_DATA, 'Aria')]['mp'], 3)
+
+    def test_unencodable_payload_is_refused(self):
+        journal = Journal(self.directory)
+        journal.recover()
+        msg_type, payload = model_message(Character('Aria', 'Elf', 'Wizard'))
+        payload['stats']['STR'] = 70000
+        with self.assertRaises(ProtocolError):
+            journal.encode(1, msg_type, payload)
+        journal.close()
+        self.assertEqual(Journal(self.directory).recover()[0].to_dict(), TableState().to_dict())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import json
+import unittest
+from protocol import MessageCodec, ProtocolError, CHAT, EDIT, SUBSCRIBE, STAT_BATCH
+
+def envelope(msg_type, payload, **extra):
+    return json.dumps(dict({'v': 1, 't': msg_type, 'd': payload}, **extra)).encode('utf-8')
+
+class DecodeTest(unittest.TestCase):
+    def setUp(self):
+        self.codec = MessageCodec()
+
+    def test_malformed_payloads_are_protocol_errors(self):
+        frames = [
+            envelope(CHAT, {}),
+            envelope(CHAT, {'text': 5}),
+            envelope(CHAT, ['text']),
+            envelope(CHAT, {'text': 'hi'}, s='one'),
+            envelope(SUBSCRIBE, {'topics': 'table'}),
+            envelope(EDIT, {'name': 'Aria', 'stat': 'hp', 'value': 2 ** 40}),
+            envelope(STAT_BATCH, {'updates': [{'name': 'Aria', 'stat': 'hp'}]}),
+        ]
+        for frame in frames:
+            with self.subTest(frame=frame):
+                with self.assertRaises(ProtocolError):
+                    self.codec.decode(frame)
+
+    def test_well_formed_messages_still_decode(self):
+        self.assertEqual(self.codec.decode(envelope(SUBSCRIBE, {'topics': ['table']})), (SUBSCRIBE, {'topics': ['table']}))
+        self.assertEqual(self.codec.decode(b'{not json'), (CHAT, {'text': '{not json'}))
+        binary = MessageCodec(binary=True)
+        update = {'updates': [{'name': 'Aria', 'stat': 'hp', 'value': 7}]}
+        self.assertEqual(binary.decode(binary.encode(STAT_BATCH, update)), (STAT_BATCH, update))
+
+if __name__ == "__main__":
+    unittest.main()
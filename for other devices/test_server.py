@@ -0,0 +1,96 @@
+import unittest
+from framing import FrameDecoder
+from models import Character
+from protocol import (MessageCodec, ProtocolError, model_message, PLAYER_DATA, STAT_UPDATE, STAT_BATCH, WHISPER, SNAPSHOT_REQUEST,
+                      TABLE_TOPIC, DM_TOPIC, PLAYER_TOPICS, DM_NAME, player_topic, whisper_topic)
+from server import Room
+
+class FakeClient:
+    # What Room needs of a ClientConnection, keeping the frames pushed to it
+    def __init__(self, token, topics=None):
+        self.token = token
+        self.structured = True
+        self.requested = None if topics is None else frozenset(topics)
+        self.topics = None
+        self.frames = []
+
+    def push(self, frames, urgent=True):
+        self.frames.extend(frames)
+        return True
+
+    def received(self):
+        codec = MessageCodec()
+        return [codec.decode(frame) for frame in FrameDecoder().feed(b''.join(self.frames))]
+
+class RoomTestCase(unittest.TestCase):
+    def setUp(self):
+        self.room = Room('test', MessageCodec(), 16)
+        self.aria = self.enter('aria', [TABLE_TOPIC, player_topic('Aria'), whisper_topic('Aria')])
+        self.room.handle(self.aria, *model_message(Character('Aria', 'Elf', 'Wizard')))
+
+    def enter(self, token, topics=None):
+        client = FakeClient(token, topics)
+        self.room.clients.add(client)
+        self.room.authorize(client)
+        return client
+
+class RoomTest(RoomTestCase):
+    def test_clients_cannot_send_stat_updates(self):
+        for msg_type, payload in ((STAT_UPDATE, {'name': 'Aria', 'stat': 'bogus', 'value': 1}),
+                                  (STAT_BATCH, {'updates': [{'name': 'Aria', 'stat': 'str', 'value': 10 ** 9}]})):
+            with self.subTest(msg_type=msg_type):
+                with self.assertRaises(ProtocolError):
+                    self.room.handle(self.aria, msg_type, payload)
+        self.assertEqual(self.room.seq, 1)
+
+    def test_table_ignores_stats_the_models_cannot_hold(self):
+        self.room.table.apply(STAT_BATCH, {'updates': [{'name': 'Aria', 'stat': 'bogus', 'value': 1},
+                                                       {'name': 'Aria', 'stat': 'str', 'value': 10 ** 9},
+                                                       {'name': 'Aria', 'stat': 'dex', 'value': 14}]})
+        character = Character.from_dict(self.room.table.entities[(PLAYER_DATA, 'Aria')])
+        self.assertEqual(character.stats.to_dict(), {'STR': 10, 'DEX': 14, 'CON': 10, 'INT': 10, 'WIS': 10, 'CHA': 10})
+
+class PrivacyTest(RoomTestCase):
+    def test_player_gets_the_channels_of_their_own_character(self):
+        self.assertEqual(self.aria.topics, {TABLE_TOPIC, player_topic('Aria'), whisper_topic('Aria')})
+        self.enter('dm', [DM_TOPIC])
+        snoop = self.enter('snoop', [TABLE_TOPIC, player_topic('Aria'), whisper_topic('Aria'), 'whisper:*', PLAYER_TOPICS, DM_TOPIC])
+        self.assertEqual(snoop.topics, {TABLE_TOPIC})
+
+    def test_whispers_reach_only_their_target(self):
+        # Not even whoever holds the DM seat can ask for every whisper
+        snoop = self.enter('snoop', ['whisper:*', whisper_topic('Aria'), DM_TOPIC])
+        self.assertEqual(snoop.topics, {DM_TOPIC})
+        legacy = self.enter(None)
+        self.room.handle(snoop, WHISPER, {'sender': 'Bob', 'target': 'Aria', 'text': 'psst'})
+        self.assertEqual(self.aria.received()[-1], (WHISPER, {'sender': 'Bob', 'target': 'Aria', 'text': 'psst'}))
+        self.assertEqual(snoop.received(), [])
+        self.assertEqual(legacy.frames, [])
+
+    def test_a_character_cannot_be_taken_while_its_player_is_here(self):
+        impostor = self.enter('impostor', [whisper_topic('Aria')])
+        with self.assertRaises(ProtocolError):
+            self.room.handle(impostor, *model_message(Character('Aria', 'Orc', 'Rogue')))
+        self.assertEqual(self.room.table.entities[(PLAYER_DATA, 'Aria')]['race'], 'Elf')
+        # Once Aria's player has gone for good, whoever publishes the character next has it
+        self.room.remove(self.aria)
+        self.room.handle(impostor, *model_message(Character('Aria', 'Orc', 'Rogue')))
+        self.assertEqual(impostor.topics, {whisper_topic('Aria')})
+
+    def test_one_dm_per_room(self):
+        dm_topics = [TABLE_TOPIC, DM_TOPIC, PLAYER_TOPICS, whisper_topic(DM_NAME)]
+        dm = self.enter('dm', dm_topics)
+        rival = self.enter('rival', dm_topics)
+        self.assertEqual(dm.topics, set(dm_topics))
+        self.assertEqual(rival.topics, {TABLE_TOPIC})
+        # The DM can look at any sheet, the rival only at what is public
+        self.room.handle(dm, SNAPSHOT_REQUEST, {'kind': PLAYER_DATA, 'name': 'Aria'})
+        self.room.handle(rival, SNAPSHOT_REQUEST, {'kind': PLAYER_DATA, 'name': 'Aria'})
+        self.assertEqual([msg_type for msg_type, _ in dm.received()], [PLAYER_DATA])
+        self.assertEqual(rival.received(), [])
+        self.room.remove(dm)
+        self.room.authorize(rival)
+        self.assertEqual(rival.topics, set(dm_topics))
+
+if __name__ == "__main__":
+    unittest.main()
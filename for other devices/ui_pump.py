@@ -0,0 +1,76 @@
+import queue
+import time
+import tkinter as tk
+from metrics import METRICS, COUNT_BUCKETS
+
+class BufferedText:
+    def __init__(self, widget, readonly=False):
+        self.widget = widget
+        self.readonly = readonly
+        self.pending = []
+
+    def append(self, text, tag=None):
+        self.pending.append(text + '\n')
+        self.pending.append(tag or ())
+
+    def flush(self):
+        if not self.pending:
+            return
+        # One insert with text/tag pairs and a single scroll per frame
+        if self.readonly:
+            self.widget.config(state='normal')
+        self.widget.insert(tk.END, *self.pending)
+        self.widget.see(tk.END)
+        if self.readonly:
+            self.widget.config(state='disabled')
+        self.pending = []
+
+class UpdatePump:
+    def __init__(self, root, handler, interval_ms=16, max_batch=2000):
+        self.root = root
+        self.handler = handler
+        self.interval_ms = interval_ms
+        self.max_batch = max_batch
+        self.queue = queue.SimpleQueue()
+        self.flushers = []
+        self.running = False
+
+    def push(self, frames):
+        # Safe to call from the network thread
+        self.queue.put(frames)
+
+    def add_flusher(self, flush):
+        self.flushers.append(flush)
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.due = time.perf_counter() + self.interval_ms / 1000
+            self.root.after(self.interval_ms, self.drain)
+
+    def stop(self):
+        self.running = False
+
+    def drain(self):
+        if not self.running:
+            return
+        if METRICS.enabled:
+            # How late Tk got round to us and how much was waiting, a busy UI thread shows as both growing
+            METRICS.observe('pump_lag_seconds', max(time.perf_counter() - self.due, 0))
+            METRICS.observe('pump_backlog', self.queue.qsize(), COUNT_BUCKETS)
+        self.due = time.perf_counter() + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self.drain)
+        handled = 0
+        with METRICS.span('pump_drain_seconds'):
+            try:
+                while handled < self.max_batch:
+                    frames = self.queue.get_nowait()
+                    for frame in frames:
+                        self.handler(frame)
+                    handled += len(frames)
+            except queue.Empty:
+                pass
+            with METRICS.span('pump_flush_seconds'):
+                for flush in self.flushers:
+                    flush()
+        METRICS.observe('pump_batch', handled, COUNT_BUCKETS)
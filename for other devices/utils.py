@@ -1,24 +1,103 @@
-import random
-import logging
-import json
-
-def roll_dice(sides, count=1):
-    return sum(random.randint(1, sides) for _ in range(count))
-
-def setup_logging():
-    logging.basicConfig(filename='dnd_log.txt', level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
-
-def log_event(event):
-    logging.info(event)
-
-def save_to_file(data, filename):
-    with open(filename, 'w') as f:
-        json.dump(data, f)
-
-def load_from_file(filename):
-    try:
-        with open(filename, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+import random
+import logging
+import logging.handlers
+import json
+import queue
+import threading
+import atexit
+from metrics import METRICS
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_log_queue = None
+_log_writer = None
+
+def roll_dice(sides, count=1):
+    return sum(random.randint(1, sides) for _ in range(count))
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname, 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', None) or {})
+        return json.dumps(entry)
+
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    # Writes without flushing, the writer thread flushes once per batch
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+class LogWriter(threading.Thread):
+    def __init__(self, log_queue, handler, batch_size=256, flush_interval=0.5):
+        super().__init__(name='log-writer', daemon=True)
+        self.queue = log_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            try:
+                records = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for record in records:
+                if record is None:
+                    stopping = True
+                else:
+                    self.handler.handle(record)
+            self.handler.flush()
+
+def setup_logging(filename='dnd_log.txt', json_lines=False, max_bytes=5 * 1024 * 1024, backup_count=3):
+    # UI threads only enqueue records, a background thread does the file I/O
+    global _log_queue, _log_writer
+    if _log_writer is not None:
+        return
+    handler = BatchedRotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+    _log_queue = queue.SimpleQueue()
+    _log_writer = LogWriter(_log_queue, handler)
+    _log_writer.start()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(_log_queue))
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    global _log_queue, _log_writer
+    if _log_writer is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is _log_queue:
+            root.removeHandler(handler)
+    _log_queue.put(None)
+    _log_writer.join()
+    _log_writer.handler.close()
+    _log_queue = None
+    _log_writer = None
+
+def log_event(event, **fields):
+    with METRICS.span('log_event_seconds'):
+        logging.info(event, extra={'fields': fields} if fields else None)
+
+def save_to_file(data, filename):
+    with open(filename, 'w') as f:
+        json.dump(data, f)
+
+def load_from_file(filename):
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}